@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""Measure how backfill throughput scales with the number of encoding
+processes and sending threads, writing to a local stand-in for the API so
+that the network and the backend don't hide the client's own costs.
+
+    python benchmarks/backfill_scaling.py [batches] [points per batch]
+
+The stand-in server accepts every write after reading its body, waiting
+LATENCY seconds first to stand in for the round trip to the backend."""
+
+import os
+import sys
+import time
+import httplib
+import datetime
+import threading
+import multiprocessing
+import BaseHTTPServer
+import SocketServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from tempoiq.client import Client
+from tempoiq.backfill import backfill
+from tempoiq.protocol.point import Point
+
+
+LATENCY = 0.005
+SENSORS = 10
+START = datetime.datetime(2015, 1, 1)
+
+
+class WriteHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    #keep connections open between writes, like the real API
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.getheader('Content-Length', 0))
+        self.rfile.read(length)
+        self.server.add(length)
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Accepts writes on a local port, counting the bytes written.
+
+    :param float latency: seconds to wait before answering each write"""
+
+    daemon_threads = True
+
+    def __init__(self, latency=LATENCY):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           WriteHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.bytes = 0
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add(self, length):
+        with self.lock:
+            self.writes += 1
+            self.bytes += length
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StandInResponse(object):
+    def __init__(self, resp):
+        self.status_code = resp.status
+        self.content = resp.read()
+        self.headers = dict(resp.getheaders())
+
+
+class StandInEndpoint(object):
+    """Sends writes to a :class:`StandInServer` over plain HTTP, with one
+    kept-alive connection per sending thread.
+
+    :param int port: the stand-in server's port"""
+
+    def __init__(self, port):
+        self.port = port
+        self.base_url = 'http://127.0.0.1:%d/v2/' % port
+        self.local = threading.local()
+
+    def post(self, url, body, headers={}, timeout=None, deadline=None):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = httplib.HTTPConnection('127.0.0.1', self.port)
+            self.local.connection = connection
+        connection.request('POST', url, body, headers)
+        return StandInResponse(connection.getresponse())
+
+
+def load_batch(task):
+    """Build the write request for one batch.  Called in the encoding
+    processes, so it must stay a module level function."""
+
+    index, points = task
+    base = index * points
+    values = [Point(START + datetime.timedelta(seconds=i), i)
+              for i in xrange(base, base + points)]
+    return {'device-%d' % (index % SENSORS): {'sensor': values}}
+
+
+def measure(processes, senders, batches=200, points=2000, compression=None,
+            latency=LATENCY):
+    """Backfill to a fresh stand-in server.
+
+    :rtype: (seconds, points written, bytes written, failures) tuple"""
+
+    server = StandInServer(latency)
+    try:
+        client = Client(StandInEndpoint(server.server_address[1]))
+        tasks = [(i, points) for i in range(batches)]
+        start = time.time()
+        result = backfill(client, tasks, loader=load_batch,
+                          processes=processes, senders=senders,
+                          compression=compression)
+        elapsed = time.time() - start
+        return elapsed, batches * points, server.bytes, len(result.failed)
+    finally:
+        server.stop()
+
+
+def main(batches=200, points=2000):
+    cpus = multiprocessing.cpu_count()
+    counts = sorted(set([0, 1, 2, 4, cpus]))
+    print 'backfill of %d batches x %d points, %.0fms write latency:' % (
+        batches, points, LATENCY * 1000)
+    print '  %9s %7s %12s %9s' % ('processes', 'senders', 'points/s', 'MB/s')
+    failed = 0
+    for processes in counts:
+        for senders in (1, 4, 16):
+            seconds, written, size, failures = measure(processes, senders,
+                                                       batches, points)
+            failed += failures
+            print '  %9d %7d %12.0f %9.1f' % (
+                processes, senders, written / seconds,
+                size / seconds / 1024 / 1024)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(a) for a in sys.argv[1:]]))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""Measure how long importing tempoiq and creating a session takes in a
+fresh interpreter, and which slow dependencies get loaded doing it.
+
+    python benchmarks/import_time.py [runs]
+
+None of the dependencies listed in SLOW should be loaded: they are only
+imported once a request is sent or a timestamp is parsed."""
+
+import os
+import sys
+import json
+import subprocess
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SLOW = ('dateutil', 'pytz', 'pkg_resources', 'google', 'h2', 'numpy',
+        'pyarrow', 'multiprocessing')
+SCRIPT = '''
+import sys, time, json
+start = time.time()
+from tempoiq.session import get_session
+get_session('example.backend.tempoiq.com', 'key', 'secret')
+elapsed = time.time() - start
+print json.dumps({'seconds': elapsed, 'modules': sorted(sys.modules)})
+'''
+
+
+def measure():
+    """Import tempoiq and create a session in a new interpreter.
+
+    :rtype: (seconds, list of modules loaded) tuple"""
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        p for p in [ROOT, env.get('PYTHONPATH')] if p)
+    #not check_output, which is only there from 2.7 on
+    process = subprocess.Popen([sys.executable, '-c', SCRIPT], env=env,
+                               stdout=subprocess.PIPE)
+    out = process.communicate()[0]
+    if process.returncode:
+        raise RuntimeError('Import benchmark exited with %d' %
+                           process.returncode)
+    result = json.loads(out)
+    return result['seconds'], result['modules']
+
+
+def slow_modules(modules):
+    """The slow dependencies among modules, by top-level package."""
+
+    return sorted(set(m.split('.')[0] for m in modules
+                      if m.split('.')[0] in SLOW))
+
+
+def main(runs=10):
+    #the first run compiles the .pyc files, which later runs don't pay for
+    measure()
+    times = []
+    for i in range(runs):
+        seconds, modules = measure()
+        times.append(seconds)
+    times.sort()
+    print 'import tempoiq + get_session over %d runs:' % runs
+    print '  median %.1fms, min %.1fms, max %.1fms' % (
+        times[len(times) // 2] * 1000, times[0] * 1000, times[-1] * 1000)
+    print '  %d modules loaded' % len(modules)
+    slow = slow_modules(modules)
+    print '  slow dependencies loaded: %s' % (', '.join(slow) or 'none')
+    return 1 if slow else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(a) for a in sys.argv[1:]]))
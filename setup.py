@@ -17,6 +17,12 @@ install_requires = [
     'sphinx'
 ]
 
+extras_require = {
+    'export': ['pyarrow'],
+    'columnar': ['numpy'],
+    'http2': ['h2'],
+}
+
 tests_require = [
     'mock',
     'unittest2',
@@ -36,5 +42,6 @@ setup(
     ],
     setup_requires=['nose>=1.0'],
     install_requires=install_requires,
+    extras_require=extras_require,
     tests_require=tests_require,
 )
@@ -0,0 +1,181 @@
+import json
+import zlib
+import Queue
+import threading
+import collections
+import multiprocessing
+from protocol.encoder import WriteEncoder
+from bulk import BulkResult, call_with_retry, DEFAULT_RETRIES
+from bulk import DEFAULT_BACKOFF
+
+
+DEFAULT_SENDERS = 4
+COMPRESSIONS = (None, 'gzip')
+_DONE = object()
+
+
+def encode_request(write_request, compression=None):
+    """Encode a write request the same way :meth:`tempoiq.client.Client.write`
+    does, optionally gzip compressing the result.
+
+    :param dict write_request: the request to encode
+    :param string compression: (optional) None or "gzip"
+    :rtype: string"""
+
+    body = json.dumps(write_request, default=WriteEncoder().default)
+    if compression == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        body = compressor.compress(body) + compressor.flush()
+    return body
+
+
+def request_keys(write_request):
+    return set((device, sensor)
+               for device, sensors in write_request.iteritems()
+               for sensor in sensors)
+
+
+def encode_task(task, loader=None, compression=None):
+    """Build (if there is a loader) and encode one batch.  This runs in the
+    worker processes of :func:`backfill`, so it must stay a module level
+    function.  Returns the (device, sensor) pairs the batch writes to along
+    with the encoded body."""
+
+    write_request = task if loader is None else loader(task)
+    return request_keys(write_request), encode_request(write_request,
+                                                       compression)
+
+
+class KeyGate(object):
+    """Admits batches one at a time, in order, holding a batch back while
+    an earlier batch writing to any of the same (device, sensor) pairs is
+    still being sent.  Batches that don't overlap are sent concurrently,
+    while the points of any one sensor are delivered in the order they were
+    submitted."""
+
+    def __init__(self):
+        self.busy = set()
+        self.changed = threading.Condition()
+
+    def acquire(self, keys):
+        with self.changed:
+            while not self.busy.isdisjoint(keys):
+                self.changed.wait()
+            self.busy.update(keys)
+
+    def release(self, keys):
+        with self.changed:
+            self.busy.difference_update(keys)
+            self.changed.notify_all()
+
+
+def backfill(client, batches, loader=None, processes=None,
+             senders=DEFAULT_SENDERS, compression=None,
+             retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+             max_pending=None):
+    """Write a large sequence of write requests, encoding them on a pool of
+    processes so that encoding isn't limited to a single core, and sending
+    the encoded bodies on a pool of threads.
+
+    Handing :class:`~tempoiq.protocol.point.Point` objects to another
+    process costs more than encoding them, so to make use of the pool pass
+    a loader: batches is then an iterable of small, picklable tasks (a file
+    name and offset, say) and loader(task) is called in the worker process
+    to build the write request for each one.  loader must be a module level
+    function.  Without a loader the batches are write requests themselves.
+
+    Batches are taken from the iterable only as fast as they are written:
+    at most max_pending batches are being encoded at once, and the senders
+    hold at most two encoded batches each.  Batches are sent in the order
+    they are given, except that batches writing to different sensors may
+    overlap; see :class:`KeyGate`.  Exceptions and 5xx responses are retried
+    the same way as the bulk rule operations.
+
+    :param client: the :class:`tempoiq.client.Client` to write through
+    :param batches: iterable of write requests, as taken by Client.write,
+                    or of tasks for the loader
+    :param loader: (optional) callable building a write request from a task
+    :param int processes: (optional) number of encoding processes. Default
+                          is the number of CPUs; 0 encodes in this process
+    :param int senders: number of concurrent sending threads
+    :param string compression: (optional) None or "gzip"
+    :param int retries: number of retries per batch
+    :param float backoff: initial retry backoff in seconds
+    :param int max_pending: (optional) batches encoded ahead of the senders.
+                            Default is twice the number of processes
+    :rtype: :class:`tempoiq.bulk.BulkResult` keyed by batch index. When a
+            loader is used, the responses' unwritten attribute is None;
+            retry the failed tasks instead"""
+
+    if senders < 1:
+        raise ValueError('Backfill needs at least one sender')
+    if compression not in COMPRESSIONS:
+        raise ValueError('Unsupported write compression: "%s"' % compression)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if max_pending is None:
+        max_pending = max(1, processes) * 2
+    headers = {}
+    if compression is not None:
+        headers['Content-Encoding'] = compression
+
+    result = BulkResult()
+    lock = threading.Lock()
+    gate = KeyGate()
+    queue = Queue.Queue(maxsize=senders * 2)
+
+    def send(item):
+        index, write_request, keys, body = item
+        return client.write_encoded(body, write_request, headers)
+
+    def work():
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                return
+            try:
+                outcome = call_with_retry(send, item, retries, backoff)
+            finally:
+                gate.release(item[2])
+            with lock:
+                result.add(item[0], outcome)
+
+    def dispatch(index, task, encoded):
+        keys, body = encoded
+        gate.acquire(keys)
+        queue.put((index, task if loader is None else None, keys, body))
+
+    threads = []
+    for i in range(senders):
+        t = threading.Thread(target=work)
+        t.daemon = True
+        t.start()
+        threads.append(t)
+
+    pool = multiprocessing.Pool(processes) if processes > 0 else None
+    pending = collections.deque()
+    try:
+        for index, task in enumerate(batches):
+            if pool is None:
+                dispatch(index, task, encode_task(task, loader, compression))
+                continue
+            pending.append((index, task, pool.apply_async(
+                encode_task, (task, loader, compression))))
+            while len(pending) >= max_pending:
+                index, task, encoded = pending.popleft()
+                dispatch(index, task, encoded.get())
+        while pending:
+            index, task, encoded = pending.popleft()
+            dispatch(index, task, encoded.get())
+    finally:
+        if pool is not None:
+            if pending:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+        for t in threads:
+            queue.put(_DONE)
+        for t in threads:
+            t.join()
+    return result
@@ -0,0 +1,259 @@
+import time
+import threading
+from collections import deque
+from deadline import CancelledError, DeadlineExceeded
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+DEFAULT_WINDOW = 20
+DEFAULT_MIN_REQUESTS = 5
+DEFAULT_ERROR_RATE = 0.5
+DEFAULT_OPEN_FOR = 30.0
+
+
+class CircuitOpenError(IOError):
+    """Raised when every host's circuit breaker is open, instead of waiting
+    on a host that is known to be failing."""
+    pass
+
+
+def is_failure(outcome):
+    """Whether the outcome of a request counts against its host: exceptions
+    (timeouts, refused connections) and 5xx responses do.
+
+    :param outcome: the response or exception
+    :rtype: bool"""
+
+    if isinstance(outcome, Exception):
+        return True
+    status = getattr(outcome, 'status_code', None)
+    return status is not None and status >= 500
+
+
+class CircuitBreaker(object):
+    """Tracks the outcome of the last window requests to a host.  When at
+    least min_requests of them are known and the share that failed reaches
+    error_rate, the breaker opens and the host gets no requests for
+    open_for seconds.  After that it is half-open: a single probe request
+    is let through, which closes the breaker if it succeeds and opens it
+    again if it fails.
+
+    :param int window: number of recent requests considered
+    :param int min_requests: requests needed before the breaker can open
+    :param float error_rate: share of failed requests that opens it
+    :param float open_for: seconds the breaker stays open
+    :param clock: (optional) callable returning the current time in seconds
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW,
+                 min_requests=DEFAULT_MIN_REQUESTS,
+                 error_rate=DEFAULT_ERROR_RATE, open_for=DEFAULT_OPEN_FOR,
+                 clock=time.time):
+        #deque.count and deque.maxlen only exist from Python 2.7 on, so
+        #the failures in the window are counted as outcomes come and go
+        self.outcomes = deque()
+        self.window = window
+        self.failed = 0
+        self.min_requests = min_requests
+        self.error_rate_limit = error_rate
+        self.open_for = open_for
+        self.clock = clock
+        self.opened_at = None
+        #the token of the half-open probe in flight, if any
+        self.probe = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if self.clock() - self.opened_at < self.open_for:
+            return OPEN
+        return HALF_OPEN
+
+    def error_rate(self):
+        with self.lock:
+            if not self.outcomes:
+                return 0.0
+            return self.failed / float(len(self.outcomes))
+
+    def allow(self):
+        """Whether a request may be sent now.  The request is given a token
+        to pass to :meth:`record` or :meth:`cancel`.  In the half-open
+        state this claims the probe, which only its own token resolves.
+
+        :rtype: a token, or None if the request may not be sent"""
+
+        with self.lock:
+            state = self._state()
+            if state == CLOSED:
+                return object()
+            if state == HALF_OPEN and self.probe is None:
+                self.probe = object()
+                return self.probe
+            return None
+
+    def cancel(self, token=None):
+        """Give up a request sent after :meth:`allow` without an outcome,
+        e.g. because the caller cancelled it.
+
+        :param token: the token :meth:`allow` gave the request"""
+
+        with self.lock:
+            if token is not None and token is self.probe:
+                self.probe = None
+
+    def record(self, success, token=None):
+        """Record the outcome of a request sent after :meth:`allow`.
+
+        :param bool success: whether the request succeeded
+        :param token: the token :meth:`allow` gave the request"""
+
+        with self.lock:
+            if self.opened_at is not None:
+                #only the probe's outcome matters once the breaker opened
+                if token is None or token is not self.probe:
+                    return
+                self.probe = None
+                if success:
+                    self.opened_at = None
+                    self.outcomes.clear()
+                    self.failed = 0
+                else:
+                    self.opened_at = self.clock()
+                return
+            self.outcomes.append(success)
+            if not success:
+                self.failed += 1
+            if len(self.outcomes) > self.window:
+                if not self.outcomes.popleft():
+                    self.failed -= 1
+            if len(self.outcomes) >= self.min_requests and \
+                    self.failed >= self.error_rate_limit * len(self.outcomes):
+                self.opened_at = self.clock()
+
+
+class Host(object):
+    """A backend host with its circuit breaker, the number of requests it
+    has in flight and an exponentially weighted average of its latency.
+
+    :param endpoint: the endpoint sending requests to the host
+    :param breaker: the host's :class:`CircuitBreaker`"""
+
+    def __init__(self, endpoint, breaker):
+        self.endpoint = endpoint
+        self.breaker = breaker
+        self.outstanding = 0
+        self.latency = None
+        self.requests = 0
+        self.failures = 0
+
+
+class HostPool(object):
+    """Spreads requests over several hosts.  Each request goes to the
+    host with the fewest requests in flight among those whose breaker
+    allows it (on a tie, the one with the lowest recent error rate, then
+    the lowest average latency).  An idempotent request that fails with an
+    exception or a 5xx response is sent again to another host, until every
+    host has been tried once.  Other requests (writes) are never sent
+    twice, since the failed host may have applied them.
+
+    :param list endpoints: one endpoint per host
+    :param breaker: (optional) callable making a :class:`CircuitBreaker`
+                    for each host
+    :param float smoothing: weight of the newest latency in the averages
+    :param clock: (optional) callable returning the current time in seconds
+    """
+
+    def __init__(self, endpoints, breaker=CircuitBreaker, smoothing=0.2,
+                 clock=time.time):
+        if not endpoints:
+            raise ValueError('At least one host is needed')
+        self.hosts = [Host(e, breaker()) for e in endpoints]
+        self.smoothing = smoothing
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    def choose(self, exclude=()):
+        """Pick the host for the next request and count it as in flight.
+
+        :param exclude: hosts that shouldn't be picked
+        :rtype: (:class:`Host`, breaker token) tuple, or None if no host
+                may be sent a request"""
+
+        with self.lock:
+            candidates = [h for h in self.hosts if h not in exclude]
+            candidates.sort(key=lambda h: (h.outstanding,
+                                           h.breaker.error_rate(),
+                                           h.latency or 0.0))
+            for host in candidates:
+                token = host.breaker.allow()
+                if token is not None:
+                    host.outstanding += 1
+                    return host, token
+        return None
+
+    def release(self, host, token):
+        """Count a request to host as no longer in flight without recording
+        an outcome for it."""
+
+        host.breaker.cancel(token)
+        with self.lock:
+            host.outstanding -= 1
+
+    def finish(self, host, token, outcome, elapsed):
+        """Record the outcome of a request to host."""
+
+        failed = is_failure(outcome)
+        host.breaker.record(not failed, token)
+        with self.lock:
+            host.outstanding -= 1
+            host.requests += 1
+            if failed:
+                host.failures += 1
+            elif host.latency is None:
+                host.latency = elapsed
+            else:
+                host.latency += self.smoothing * (elapsed - host.latency)
+
+    def call(self, send, idempotent=True):
+        """Call send with the endpoint of the chosen host, failing over to
+        the next host on exceptions and 5xx responses if the call is
+        idempotent.  The last failure is returned (or raised) if every host
+        failed.  Cancelled calls and calls that ran out of time are not
+        held against the host, and are not sent elsewhere.
+
+        :param send: callable taking an endpoint
+        :param bool idempotent: whether send may safely run more than once
+        :rtype: the return value of send"""
+
+        tried = []
+        outcome = None
+        while True:
+            chosen = self.choose(exclude=tried)
+            if chosen is None:
+                break
+            host, token = chosen
+            tried.append(host)
+            start = self.clock()
+            try:
+                outcome = send(host.endpoint)
+            except (CancelledError, DeadlineExceeded):
+                self.release(host, token)
+                raise
+            except Exception, e:
+                outcome = e
+            self.finish(host, token, outcome, self.clock() - start)
+            if not idempotent or not is_failure(outcome):
+                break
+        if outcome is None:
+            raise CircuitOpenError('Every host is failing')
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
@@ -0,0 +1,446 @@
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+import threading
+from protocol.encoder import WriteEncoder
+from response import SUCCESS
+
+
+DEFAULT_SEGMENT_SIZE = 16 * 1024 * 1024
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_BACKOFF = 30.0
+READ_AHEAD = 256
+SEGMENT_SUFFIX = '.seg'
+CHECKPOINT = 'checkpoint'
+
+
+class FlusherError(Exception):
+    """Raised by :meth:`WriteBuffer.flush` and :meth:`WriteBuffer.close`
+    when the buffer's background flusher has stopped unexpectedly, so that
+    the records waiting in the log will not be sent."""
+    pass
+
+
+def count_points(write_request):
+    return sum(len(points) for sensors in write_request.itervalues()
+               for points in sensors.itervalues())
+
+
+class Segment(object):
+    """A fixed size, memory-mapped file holding a sequence of records.  Each
+    record is a big-endian length and CRC32 followed by the payload.  The
+    unused tail of the file is zero filled, so a zero length marks the end
+    of the records, and a CRC mismatch marks a record torn by a crash.
+
+    :param string path: location of the segment file
+    :param int size: (optional) create the file with this size. If omitted
+                     the file must already exist"""
+
+    HEADER = struct.Struct('>II')
+
+    def __init__(self, path, size=None):
+        self.path = path
+        if size is not None:
+            with open(path, 'wb') as f:
+                f.truncate(size)
+        self.file = open(path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.size = len(self.map)
+
+    def append(self, offset, payload):
+        """Write payload at offset, returning the offset of the next record,
+        or None if the segment doesn't have room for it."""
+        end = offset + self.HEADER.size + len(payload)
+        if end > self.size:
+            return None
+        #the header goes in last, so a reader never sees a length before
+        #the payload it describes has been written
+        self.map[offset + self.HEADER.size:end] = payload
+        self.map[offset:offset + self.HEADER.size] = self.HEADER.pack(
+            len(payload), zlib.crc32(payload) & 0xffffffff)
+        return end
+
+    def read(self, offset):
+        """Read the record at offset, returning (payload, next offset), or
+        None if there is no complete record there."""
+        if offset + self.HEADER.size > self.size:
+            return None
+        length, crc = self.HEADER.unpack_from(self.map, offset)
+        end = offset + self.HEADER.size + length
+        if length == 0 or end > self.size:
+            return None
+        payload = self.map[offset + self.HEADER.size:end]
+        if zlib.crc32(payload) & 0xffffffff != crc:
+            return None
+        return payload, end
+
+    def flush(self):
+        self.map.flush()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class WriteAheadLog(object):
+    """An append-only log of encoded write requests, stored as a directory
+    of memory-mapped :class:`Segment` files plus a checkpoint recording how
+    far the log has been acknowledged.  Reopening the directory after a
+    crash resumes reading from the checkpoint; new records always go to a
+    fresh segment so a torn tail is never appended to.
+
+    Positions in the log are (segment number, offset) tuples.
+
+    :param string directory: where segments and the checkpoint are kept
+    :param int segment_size: size in bytes of each segment file
+    :param bool sync: whether to flush each record to disk before append
+                      returns. Default is False, leaving it to the OS"""
+
+    def __init__(self, directory, segment_size=DEFAULT_SEGMENT_SIZE,
+                 sync=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.sync = sync
+        self.lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        numbers = self._segment_numbers()
+        self.checkpoint = self._load_checkpoint()
+        if self.checkpoint is None:
+            start = numbers[0] if numbers else 0
+            self.checkpoint = (start, 0)
+        self.segments = {}
+        self.write_number = (numbers[-1] + 1) if numbers else 0
+        self.write_offset = 0
+        self.segments[self.write_number] = Segment(
+            self._path(self.write_number), self.segment_size)
+
+    def _path(self, number):
+        return os.path.join(self.directory,
+                            '%08d%s' % (number, SEGMENT_SUFFIX))
+
+    def _segment_numbers(self):
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)])
+                      for name in os.listdir(self.directory)
+                      if name.endswith(SEGMENT_SUFFIX))
+
+    def _load_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT)) as f:
+                j = json.load(f)
+            return (j['segment'], j['offset'])
+        except (IOError, ValueError, KeyError):
+            return None
+
+    def _segment(self, number):
+        #None for a segment that's missing or was never sized, e.g. after a
+        #crash between creating and truncating the file
+        segment = self.segments.get(number)
+        if segment is None:
+            path = self._path(number)
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                return None
+            segment = Segment(path)
+            self.segments[number] = segment
+        return segment
+
+    def append(self, payload):
+        """Append one record to the log.
+
+        :param string payload: the encoded record
+        :rtype: the (segment number, offset) position after the record"""
+
+        with self.lock:
+            segment = self.segments[self.write_number]
+            end = segment.append(self.write_offset, payload)
+            if end is None:
+                size = max(self.segment_size,
+                           Segment.HEADER.size * 2 + len(payload))
+                self.write_number += 1
+                self.write_offset = 0
+                segment = Segment(self._path(self.write_number), size)
+                self.segments[self.write_number] = segment
+                end = segment.append(0, payload)
+            self.write_offset = end
+            if self.sync:
+                segment.flush()
+            return (self.write_number, end)
+
+    def read(self, position, max_records=None):
+        """Read the records following position.
+
+        :param tuple position: where to start reading
+        :param int max_records: (optional) stop after this many records
+        :rtype: list of (payload, position after the record) tuples"""
+
+        records = []
+        number, offset = position
+        with self.lock:
+            last = self.write_number
+        while max_records is None or len(records) < max_records:
+            #the writer creates and sizes new segments under the lock, so
+            #holding it here means a segment is never mapped half made
+            with self.lock:
+                segment = self._segment(number)
+                record = segment.read(offset) if segment else None
+            if segment is None:
+                if number >= last:
+                    break
+                number, offset = number + 1, 0
+                continue
+            if record is None:
+                if number >= last:
+                    break
+                #everything after a sealed segment's last record lives in
+                #the next segment
+                number, offset = number + 1, 0
+                continue
+            payload, offset = record
+            records.append((payload, (number, offset)))
+        return records
+
+    def end(self, position):
+        """The position after the last complete record following position."""
+
+        while True:
+            records = self.read(position, READ_AHEAD)
+            if not records:
+                return position
+            position = records[-1][1]
+
+    def commit(self, position):
+        """Record that everything before position has been acknowledged,
+        and remove the segments that are no longer needed."""
+
+        path = os.path.join(self.directory, CHECKPOINT)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'segment': position[0], 'offset': position[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(path + '.tmp', path)
+        self.checkpoint = position
+
+        with self.lock:
+            for number in self._segment_numbers():
+                if number >= position[0]:
+                    break
+                segment = self.segments.pop(number, None)
+                if segment is not None:
+                    segment.close()
+                os.remove(self._path(number))
+
+    def close(self):
+        with self.lock:
+            for segment in self.segments.itervalues():
+                segment.flush()
+                segment.close()
+            self.segments = {}
+
+
+class WriteBuffer(object):
+    """A durable buffer in front of :meth:`tempoiq.client.Client.write`.
+    Producers hand write requests to :meth:`write`, which encodes them and
+    appends them to a :class:`WriteAheadLog` without waiting on the backend.
+    A background thread drains the log in order, merging records into
+    batches of up to batch_size points, and only advances the log's
+    checkpoint once a batch has been acknowledged.  Because a single thread
+    sends the batches in log order, points for each (device, sensor) are
+    delivered in the order they were written.
+
+    Exceptions and 5xx responses are retried with exponential backoff for
+    as long as it takes.  Any other failure, or a partial (207) write, is
+    passed to on_error(batch, response) and the batch is not retried.
+    Errors inside the flusher itself, such as an exception raised by
+    on_error or a checkpoint that can't be written, are kept in the
+    last_error attribute and the flusher carries on.
+
+    :param client: the :class:`tempoiq.client.Client` to write through
+    :param string directory: where the write-ahead log is kept
+    :param int batch_size: maximum number of points per write
+    :param float flush_interval: maximum seconds a point waits in the log
+                                 before the flusher looks at it
+    :param on_error: (optional) callable for batches that can't be written
+    :param int segment_size: size in bytes of each log segment
+    :param bool sync: whether to flush every record to disk on write
+    :param float max_backoff: longest wait in seconds between retries"""
+
+    encoder = WriteEncoder()
+
+    def __init__(self, client, directory, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, on_error=None,
+                 segment_size=DEFAULT_SEGMENT_SIZE, sync=False,
+                 max_backoff=DEFAULT_MAX_BACKOFF):
+        self.client = client
+        self.log = WriteAheadLog(directory, segment_size, sync)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self.max_backoff = max_backoff
+        self.pending_points = 0
+        self.last_error = None
+        self.running = True
+        #records left over from a previous run count as already written
+        self.last_position = self.log.end(self.log.checkpoint)
+        self.progress = threading.Condition()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, write_request):
+        """Durably queue a write request.  Takes the same argument as
+        :meth:`tempoiq.client.Client.write`.
+
+        :param dict write_request:"""
+
+        payload = json.dumps(write_request, default=self.encoder.default)
+        position = self.log.append(payload)
+        with self.progress:
+            self.last_position = max(self.last_position, position)
+            self.pending_points += count_points(write_request)
+            full = self.pending_points >= self.batch_size
+        if full:
+            self.wakeup.set()
+
+    def _check_flusher(self):
+        if not self.running:
+            raise FlusherError('The write buffer flusher has stopped: %r' %
+                               (self.last_error,))
+
+    def flush(self, timeout=None):
+        """Block until everything written so far has been sent.
+
+        :param float timeout: (optional) maximum seconds to wait
+        :raises FlusherError: if the background flusher has stopped
+        :rtype: bool, whether the buffer was drained in time"""
+
+        deadline = None if timeout is None else time.time() + timeout
+        with self.progress:
+            target = self.last_position
+            self.wakeup.set()
+            while self.log.checkpoint < target:
+                self._check_flusher()
+                if deadline is None:
+                    self.progress.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self.progress.wait(remaining)
+        return True
+
+    def close(self, flush=True):
+        """Stop the background flusher.  Records that haven't been sent stay
+        in the log and are sent by the next buffer opened on the directory.
+
+        :param bool flush: whether to send outstanding records first
+        :raises FlusherError: if the background flusher has stopped"""
+
+        try:
+            if flush:
+                self.flush()
+            else:
+                self._check_flusher()
+        finally:
+            self.stopping.set()
+            self.wakeup.set()
+            self.thread.join()
+            self.log.close()
+
+    def _next_batch(self):
+        batch = {}
+        points = 0
+        position = self.log.checkpoint
+        while points < self.batch_size:
+            records = self.log.read(position, READ_AHEAD)
+            for payload, after in records:
+                request = json.loads(payload)
+                for device, sensors in request.iteritems():
+                    merged = batch.setdefault(device, {})
+                    for sensor, values in sensors.iteritems():
+                        merged.setdefault(sensor, []).extend(values)
+                        points += len(values)
+                position = after
+                if points >= self.batch_size:
+                    break
+            if len(records) < READ_AHEAD:
+                break
+        return batch, points, position
+
+    def _commit(self, position, points=0):
+        with self.progress:
+            self.log.commit(position)
+            self.pending_points = max(0, self.pending_points - points)
+            self.progress.notify_all()
+
+    def _send(self, batch, points, position):
+        backoff = 0.5
+        while True:
+            try:
+                response = self.client.write(batch)
+                failed = response.status >= 500
+            except Exception, e:
+                response = e
+                failed = True
+            if not failed:
+                break
+            if self.stopping.is_set():
+                return False
+            self.stopping.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+        if response.successful != SUCCESS and self.on_error is not None:
+            try:
+                self.on_error(batch, response)
+            except Exception, e:
+                #the batch is still acknowledged, or it would be reported
+                #again and again
+                self.last_error = e
+        self._commit(position, points)
+        return True
+
+    def _step(self):
+        #one pass of the flusher, returning whether it should carry on
+        batch, points, position = self._next_batch()
+        if points == 0:
+            if position != self.log.checkpoint:
+                #records without points still need acknowledging
+                self._commit(position)
+                return True
+            with self.progress:
+                #only if nothing was written since the log was read
+                if self.last_position <= position:
+                    self.pending_points = 0
+            if self.stopping.is_set():
+                return False
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            return True
+        return self._send(batch, points, position)
+
+    def _run(self):
+        backoff = 0.5
+        try:
+            while True:
+                try:
+                    if not self._step():
+                        return
+                    backoff = 0.5
+                except Exception, e:
+                    #the records stay in the log, to be read again
+                    self.last_error = e
+                    if self.stopping.is_set():
+                        return
+                    self.stopping.wait(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+        finally:
+            #wake up flush() calls, which check whether the flusher runs
+            with self.progress:
+                self.running = False
+                self.progress.notify_all()
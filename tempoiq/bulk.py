@@ -0,0 +1,152 @@
+import time
+import Queue
+import threading
+from response import SUCCESS, FAILURE, PARTIAL
+
+
+DEFAULT_WORKERS = 8
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.5
+
+#returned by a bulk operation to record an item as intentionally not sent
+SKIPPED = object()
+_DONE = object()
+
+
+def is_retryable(outcome):
+    """Utility function for deciding whether the outcome of a single bulk
+    operation is worth retrying.  Exceptions (timeouts, dropped connections)
+    and 5xx responses are retried, anything else is considered final.
+
+    :param outcome: the response or exception from the operation
+    :rtype: bool"""
+
+    if isinstance(outcome, Exception):
+        return True
+    status = getattr(outcome, 'status', None)
+    return status is not None and status >= 500
+
+
+def call_with_retry(operation, item, retries=DEFAULT_RETRIES,
+                    backoff=DEFAULT_BACKOFF):
+    """Call operation(item), retrying with exponential backoff while the
+    outcome is retryable.  Exceptions are caught and returned rather than
+    raised so that a single bad item can't take down a bulk run.
+
+    :param operation: callable applied to the item
+    :param item: the item to operate on
+    :param int retries: number of retries after the first attempt
+    :param float backoff: seconds to wait before the first retry, doubled
+                          for every retry after that
+    :rtype: the operation's return value or the last exception raised"""
+
+    attempt = 0
+    while True:
+        try:
+            outcome = operation(item)
+        except Exception, e:
+            outcome = e
+        if attempt >= retries or not is_retryable(outcome):
+            return outcome
+        time.sleep(backoff * (2 ** attempt))
+        attempt += 1
+
+
+class BulkResult(object):
+    """Aggregated report of a bulk operation.  Each item is recorded under
+    its key (the rule key for monitoring operations) in exactly one of the
+    following attributes:
+
+        * succeeded: dict mapping key to the successful response
+        * failed: dict mapping key to the failed response, or to the
+                  exception raised if no response was received
+        * skipped: list of keys that did not need to be sent
+
+    The successful attribute follows the constants in
+    :mod:`tempoiq.response`: SUCCESS if nothing failed, FAILURE if nothing
+    succeeded or was skipped, and PARTIAL otherwise."""
+
+    def __init__(self):
+        self.succeeded = {}
+        self.failed = {}
+        self.skipped = []
+
+    def add(self, key, outcome):
+        if outcome is SKIPPED:
+            self.skipped.append(key)
+        elif isinstance(outcome, Exception):
+            self.failed[key] = outcome
+        elif getattr(outcome, 'successful', FAILURE) == SUCCESS:
+            self.succeeded[key] = outcome
+        else:
+            self.failed[key] = outcome
+
+    @property
+    def successful(self):
+        if not self.failed:
+            return SUCCESS
+        if not self.succeeded and not self.skipped:
+            return FAILURE
+        return PARTIAL
+
+
+def run_bulk(operation, items, key=None, workers=DEFAULT_WORKERS,
+             retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    """Apply operation to every item on a bounded pool of worker threads and
+    aggregate the outcomes into a :class:`BulkResult`.  Items are handed to
+    the workers through a bounded queue, so a generator of items is consumed
+    at the pace of the workers rather than materialized up front.
+
+    :param operation: callable applied to each item, returning a
+                      :class:`tempoiq.response.Response` or :data:`SKIPPED`
+    :param items: iterable of items to operate on
+    :param key: (optional) callable mapping an item to its key in the report.
+                Default is the item itself. Items whose key can't be
+                computed are not sent, and fail with the exception raised
+    :param int workers: number of concurrent worker threads
+    :param int retries: number of retries per item
+    :param float backoff: initial retry backoff in seconds
+    :rtype: :class:`BulkResult`"""
+
+    if workers < 1:
+        raise ValueError('Bulk operations need at least one worker')
+    if key is None:
+        key = lambda item: item
+
+    result = BulkResult()
+    lock = threading.Lock()
+    queue = Queue.Queue(maxsize=workers * 2)
+
+    def work():
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                return
+            try:
+                item_key = key(item)
+            except Exception, e:
+                #the item can't be reported under its key, so it isn't sent
+                #and is reported under the item itself
+                with lock:
+                    result.add(item, e)
+                continue
+            outcome = call_with_retry(operation, item, retries, backoff)
+            with lock:
+                result.add(item_key, outcome)
+
+    threads = []
+    for i in range(workers):
+        t = threading.Thread(target=work)
+        t.daemon = True
+        t.start()
+        threads.append(t)
+
+    try:
+        for item in items:
+            queue.put(item)
+    finally:
+        for t in threads:
+            queue.put(_DONE)
+        for t in threads:
+            t.join()
+    return result
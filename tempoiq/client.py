@@ -1,21 +1,33 @@
 import json
+import time
 import urlparse
 import urllib
 from protocol.encoder import WriteEncoder, CreateEncoder, ReadEncoder
+from protocol.encoder import CanonicalReadEncoder
 from protocol.query.builder import QueryBuilder
+from protocol.row import Row
 from response import Response, SensorPointsResponse, DeleteDatapointsResponse
 from response import StreamResponse, AlertListResponse
 from response import MonitoringResponse, DeviceResponse, ResponseException
+from response import WriteResponse, CachedResponse, SUCCESS, PARTIAL
 from endpoint import media_type, media_types
+from bulk import run_bulk, SKIPPED, DEFAULT_WORKERS, DEFAULT_RETRIES
+from singleflight import SingleFlight
+from latest import is_latest
+from protocol.columnar import iter_payloads, DEFAULT_CHUNK_SIZE
+from protocol.query.batch import single_many, DEFAULT_MAX_KEYS
+
+PROJECTMSG = 'Projections are only supported by the v2 read format'
 
 
 def escape(s):
     return urllib.quote(s, safe='')
 
 
-def make_fetcher(endpoint, url, headers={}):
+def make_fetcher(endpoint, url, headers={}, timeout=None, deadline=None):
     def fetcher(cursor):
-        resp = endpoint.get(url, json.dumps(cursor), headers=headers)
+        resp = endpoint.get(url, json.dumps(cursor), headers=headers,
+                            timeout=timeout, deadline=deadline)
         if resp.status_code != 200:
             #munge this so the ResponsException can work with it
             resp.status = resp.status_code
@@ -24,6 +36,14 @@ def make_fetcher(endpoint, url, headers={}):
     return fetcher
 
 
+def rule_report_key(rule):
+    """Key a rule is reported under in a bulk result.  Rules that have not
+    been assigned a key yet are reported under their name."""
+    if rule.key is not None:
+        return rule.key
+    return rule.name
+
+
 class MonitoringClient(object):
     def __init__(self, endpoint):
         self.endpoint = endpoint
@@ -33,6 +53,19 @@ class MonitoringClient(object):
         resp = self.endpoint.delete(url)
         return Response(resp, self.endpoint)
 
+    def delete_rules(self, keys, workers=DEFAULT_WORKERS,
+                     retries=DEFAULT_RETRIES):
+        """Delete many rules concurrently.
+
+        :param keys: iterable of rule keys
+        :param int workers: number of concurrent requests
+        :param int retries: number of retries per rule on errors and 5xx
+                            responses
+        :rtype: :class:`tempoiq.bulk.BulkResult`"""
+
+        return run_bulk(self.delete_rule, keys, workers=workers,
+                        retries=retries)
+
     def get_alert(self, key, alert_id):
         url1 = urlparse.urljoin(self.endpoint.base_url,
                                 'monitors/' + key + '/')
@@ -68,12 +101,32 @@ class MonitoringClient(object):
         resp = self.endpoint.get(url)
         return MonitoringResponse(resp, self.endpoint, 'decode_rule_usage')
 
-    def list_alerts(self, key):
+    def list_alerts(self, key, start=None, end=None, limit=None):
+        """List the alerts raised by a rule.  The response data is a cursor
+        that fetches further pages of alerts as it is iterated.
+
+        :param string key: the rule key
+        :param DateTime start: (optional) only list alerts raised at or after
+                               this time
+        :param DateTime end: (optional) only list alerts raised before this
+                             time
+        :param int limit: (optional) number of alerts per page
+        :rtype: :class:`tempoiq.response.AlertListResponse`"""
+
         url1 = urlparse.urljoin(self.endpoint.base_url,
                                 'monitors/' + key + '/')
         url = urlparse.urljoin(url1, 'alerts/')
-        resp = self.endpoint.get(url)
-        return AlertListResponse(resp, self.endpoint)
+        args = {}
+        if start is not None:
+            args['start'] = start.isoformat()
+        if end is not None:
+            args['stop'] = end.isoformat()
+        if limit is not None:
+            args['limit'] = limit
+        body = json.dumps(args) if args else ''
+        resp = self.endpoint.get(url, body)
+        fetcher = make_fetcher(self.endpoint, url)
+        return AlertListResponse(resp, self.endpoint, fetcher, start, end)
 
     def list_rules(self):
         url = urlparse.urljoin(self.endpoint.base_url, 'monitors/')
@@ -86,14 +139,24 @@ class Client(object):
 
     :param endpoint: backend and credentials to connect to
     :type endpoint: tempoiq.endpoint.HTTPEndpoint
+    :param bool coalesce_reads: whether concurrent identical reads should
+                                share a single request. Default is True
+    :param latest_cache: (optional) cache answering ``single('latest')``
+                         calls for streams recently written or read
+    :type latest_cache: :class:`tempoiq.latest.LatestCache`
     """
 
     write_encoder = WriteEncoder()
     create_encoder = CreateEncoder()
     read_encoder = ReadEncoder()
+    canonical_encoder = CanonicalReadEncoder()
 
-    def __init__(self, endpoint, read_version='v2'):
+    def __init__(self, endpoint, read_version='v2', coalesce_reads=True,
+                 latest_cache=None):
         self.endpoint = endpoint
+        self.coalesce_reads = coalesce_reads
+        self.latest_cache = latest_cache
+        self.inflight = SingleFlight()
         self.monitoring_client = MonitoringClient(self.endpoint)
         self.DATAPOINT_ACCEPT_TYPE = media_type('datapoint-collection',
                                                 read_version)
@@ -102,6 +165,28 @@ class Client(object):
         self.QUERY_CONTENT_TYPE = media_type('query', 'v1')
         self.read_version = read_version
 
+    def _coalesced_get(self, url, body, headers={}, timeout=None,
+                       deadline=None):
+        """Perform a query request, sharing it with any identical request
+        already in flight.  Returns the raw response along with the decoded
+        first page (None unless the request succeeded), so that coalesced
+        callers don't decode the same page more than once.  Requests with
+        their own timeout or deadline are never shared."""
+
+        def fetch():
+            resp = self.endpoint.get(url, body, headers=headers,
+                                     timeout=timeout, deadline=deadline)
+            page = None
+            if resp.status_code == 200:
+                page = json.loads(resp.content)
+            return resp, page
+
+        if not self.coalesce_reads or timeout is not None or \
+                deadline is not None:
+            return fetch()
+        key = (url, body, tuple(sorted(headers.items())))
+        return self.inflight.do(key, fetch)
+
     def create_device(self, device):
         """Create a new device
 
@@ -151,12 +236,53 @@ class Client(object):
         resp = self.endpoint.delete(url, j)
         return DeleteDatapointsResponse(resp, self.endpoint)
 
+    def deploy_rules(self, rules, workers=DEFAULT_WORKERS,
+                     retries=DEFAULT_RETRIES):
+        """Idempotently deploy a set of rules.  Each rule is compared with
+        the rule currently stored under its key: unchanged rules are skipped,
+        changed rules are updated and unknown rules are created.
+
+        :param rules: iterable of :class:`tempoiq.protocol.rule.Rule`
+        :param int workers: number of concurrent rules in flight
+        :param int retries: number of retries per rule on errors and 5xx
+                            responses
+        :rtype: :class:`tempoiq.bulk.BulkResult`"""
+
+        return run_bulk(self._deploy_rule, rules, key=rule_report_key,
+                        workers=workers, retries=retries)
+
+    def _deploy_rule(self, rule):
+        if rule.key is None:
+            return self.monitor(rule)
+        existing = self.monitoring_client.get_rule(rule.key)
+        if existing.status == 404:
+            return self.monitor(rule)
+        if existing.successful != SUCCESS or existing.data is None:
+            return existing
+        encode = self.write_encoder.encode_rule
+        if encode(existing.data) == encode(rule):
+            return SKIPPED
+        return self.update_rule(rule)
+
     def monitor(self, rule):
         url = urlparse.urljoin(self.endpoint.base_url, 'monitors/')
         rule_json = json.dumps(rule, default=self.write_encoder.default)
         resp = self.endpoint.post(url, rule_json)
         return MonitoringResponse(resp, self.endpoint)
 
+    def monitor_rules(self, rules, workers=DEFAULT_WORKERS,
+                      retries=DEFAULT_RETRIES):
+        """Create many rules concurrently.
+
+        :param rules: iterable of :class:`tempoiq.protocol.rule.Rule`
+        :param int workers: number of concurrent requests
+        :param int retries: number of retries per rule on errors and 5xx
+                            responses
+        :rtype: :class:`tempoiq.bulk.BulkResult`"""
+
+        return run_bulk(self.monitor, rules, key=rule_report_key,
+                        workers=workers, retries=retries)
+
     def query(self, object_type):
         """Begin to build a query on the given object type.
 
@@ -166,36 +292,110 @@ class Client(object):
 
         return QueryBuilder(self, object_type)
 
-    def read(self, query):
+    def read(self, query, project=None, timeout=None, deadline=None):
+        """Read sensor data.  Rows can be narrowed down to some of the
+        sensors in the result with project, which is only supported by the
+        v2 (row) read format.
+
+        The timeout applies to each request of the read, the first one and
+        every page the cursor fetches later, while a deadline covers all of
+        them together: once it passes (or its token is cancelled), iterating
+        the cursor raises :class:`tempoiq.deadline.DeadlineExceeded` (or
+        :class:`tempoiq.deadline.CancelledError`).
+
+        :param query: the query to run
+        :type query: :class:`~tempoiq.protocol.query.builder.QueryBuilder`
+        :param list project: (optional) (device key, sensor key) pairs whose
+                             values the rows should keep
+        :param timeout: (optional) seconds, or a (connect, read) tuple.
+                        Default is the endpoint's timeout
+        :param deadline: (optional) :class:`tempoiq.deadline.Deadline` for
+                         the whole read
+        :rtype: :class:`tempoiq.response.SensorPointsResponse` or
+                :class:`tempoiq.response.StreamResponse`"""
+
+        j = self.canonical_encoder.encode(query)
+        return self.read_encoded(j, project=project, timeout=timeout,
+                                 deadline=deadline)
+
+    def read_encoded(self, body, project=None, timeout=None, deadline=None):
+        """Read sensor data with a query that has already been encoded,
+        e.g. by a :class:`~tempoiq.protocol.query.template.PreparedQuery`.
+        See :meth:`read`.
+
+        :param string body: the encoded query
+        :rtype: :class:`tempoiq.response.SensorPointsResponse` or
+                :class:`tempoiq.response.StreamResponse`"""
+
+        if project is not None and self.read_version != 'v2':
+            raise ValueError(PROJECTMSG)
         url = urlparse.urljoin(self.endpoint.base_url, 'read/')
-        j = json.dumps(query, default=self.read_encoder.default)
         accept_headers = [self.ERROR_ACCEPT_TYPE, self.DATAPOINT_ACCEPT_TYPE]
         content_header = self.QUERY_CONTENT_TYPE
         headers = media_types(accept_headers, content_header)
-        resp = self.endpoint.get(url, j, headers=headers)
-        fetcher = make_fetcher(self.endpoint, url, headers)
+        resp, page = self._coalesced_get(url, body, headers, timeout,
+                                         deadline)
+        fetcher = make_fetcher(self.endpoint, url, headers, timeout, deadline)
         if self.read_version == 'v2':
-            return SensorPointsResponse(resp, self.endpoint, fetcher)
+            return SensorPointsResponse(resp, self.endpoint, fetcher, page,
+                                        project)
         else:
-            return StreamResponse(resp, self.endpoint, fetcher)
+            return StreamResponse(resp, self.endpoint, fetcher, page)
 
-    def search_devices(self, query):
+    def search_devices(self, query, timeout=None, deadline=None):
         #TODO - actually use the size param
         url = urlparse.urljoin(self.endpoint.base_url, 'devices/')
         j = json.dumps(query, default=self.read_encoder.default)
         accept_headers = [self.ERROR_ACCEPT_TYPE, self.DEVICE_ACCEPT_TYPE]
         content_header = self.QUERY_CONTENT_TYPE
         headers = media_types(accept_headers, content_header)
-        fetcher = make_fetcher(self.endpoint, url, headers)
-        return DeviceResponse(self.endpoint.get(url, j, headers=headers),
-                              self.endpoint, fetcher)
-
-    def single(self, query):
+        fetcher = make_fetcher(self.endpoint, url, headers, timeout, deadline)
+        resp = self.endpoint.get(url, j, headers=headers, timeout=timeout,
+                                 deadline=deadline)
+        return DeviceResponse(resp, self.endpoint, fetcher)
+
+    def single(self, query, timeout=None, deadline=None):
+        cache = self.latest_cache
+        if cache is not None:
+            rows = cache.lookup(query)
+            if rows is not None:
+                return CachedResponse(rows, self.endpoint)
         url = urlparse.urljoin(self.endpoint.base_url, 'single/')
-        j = json.dumps(query, default=self.read_encoder.default)
-        fetcher = make_fetcher(self.endpoint, url)
-        return SensorPointsResponse(self.endpoint.get(url, j), self.endpoint,
-                                    fetcher)
+        j = self.canonical_encoder.encode(query)
+        resp, page = self._coalesced_get(url, j, {}, timeout, deadline)
+        fetcher = make_fetcher(self.endpoint, url, {}, timeout, deadline)
+        response = SensorPointsResponse(resp, self.endpoint, fetcher, page)
+        if cache is not None and page is not None and is_latest(query):
+            cache.record_rows(Row(r) for r in page.get('data', ()))
+        return response
+
+    def single_many(self, queries, function, timestamp=None,
+                    include_selection=False, max_keys=DEFAULT_MAX_KEYS,
+                    workers=DEFAULT_WORKERS, retries=DEFAULT_RETRIES):
+        """Run the same single-point call for many sensor queries at once.
+        Queries that select devices by key only, and are otherwise
+        identical, are merged into one request for all of their devices
+        (up to max_keys devices per request).  The remaining queries are
+        sent as they are.  All requests run concurrently.
+
+        Every query is reported under its position in queries.  A merged
+        query gets a :class:`tempoiq.response.SubsetResponse` holding the
+        rows of its own devices, and the shared response if the request
+        failed.
+
+        :param queries: iterable of sensor
+                        :class:`~tempoiq.protocol.query.builder.QueryBuilder`
+        :param String function: Method for finding the point to return for
+                    each sensor. Ex: earliest, latest, before, after
+        :param DateTime timestamp: required for all functions except earliest
+        :param int max_keys: most device keys in one merged request
+        :param int workers: number of concurrent requests
+        :param int retries: number of retries per request on errors and 5xx
+                            responses
+        :rtype: :class:`tempoiq.bulk.BulkResult`"""
+
+        return single_many(self, queries, function, timestamp,
+                           include_selection, max_keys, workers, retries)
 
     def update_rule(self, rule):
         route = 'monitors/%s' % rule.key
@@ -204,7 +404,21 @@ class Client(object):
         resp = self.endpoint.put(url, rule_json)
         return MonitoringResponse(resp, self.endpoint)
 
-    def write(self, write_request):
+    def update_rules(self, rules, workers=DEFAULT_WORKERS,
+                     retries=DEFAULT_RETRIES):
+        """Update many rules concurrently.
+
+        :param rules: iterable of :class:`tempoiq.protocol.rule.Rule`
+        :param int workers: number of concurrent requests
+        :param int retries: number of retries per rule on errors and 5xx
+                            responses
+        :rtype: :class:`tempoiq.bulk.BulkResult`"""
+
+        return run_bulk(self.update_rule, rules, key=rule_report_key,
+                        workers=workers, retries=retries)
+
+    def write(self, write_request, retries=0, backoff=0.5, timeout=None,
+              deadline=None):
         """Write data points to one or more devices and sensors.
 
         The write_request argument is a dict which maps device keys to device
@@ -213,10 +427,94 @@ class Client(object):
         The device data is itself a dict mapping sensor key to a list of
         :class:`tempoiq.protocol.point.Point`
 
-        :param dict write_request:"""
+        If retries is set, points that fail to write because of a partial
+        (207) or server error response are written again, up to retries
+        more times, waiting backoff seconds before the first retry and
+        doubling the wait every time after that.  Only the failed points are
+        sent again.  The returned response is the last one received, and its
+        unwritten attribute holds the points that could not be written.
+        A deadline covers the retries too: no retry is made that would start
+        after it.
+
+        :param dict write_request:
+        :param int retries: (optional) number of retries. Default is 0
+        :param float backoff: (optional) seconds to wait before retrying
+        :param timeout: (optional) seconds, or a (connect, read) tuple, for
+                        each request. Default is the endpoint's timeout
+        :param deadline: (optional) :class:`tempoiq.deadline.Deadline` for
+                         the write and its retries
+        :rtype: :class:`tempoiq.response.WriteResponse`"""
 
-        url = urlparse.urljoin(self.endpoint.base_url, 'write/')
         default = self.write_encoder.default
-        resp = self.endpoint.post(url, json.dumps(write_request,
-                                                  default=default))
-        return Response(resp, self.endpoint)
+        attempt = 0
+        while True:
+            body = json.dumps(write_request, default=default)
+            response = self.write_encoded(body, write_request,
+                                          timeout=timeout, deadline=deadline)
+            response.attempts = attempt + 1
+            retryable = response.successful == PARTIAL or \
+                response.status >= 500
+            if attempt >= retries or not retryable or \
+                    not response.unwritten:
+                return response
+            wait = backoff * (2 ** attempt)
+            if deadline is not None and \
+                    deadline.remaining() is not None and \
+                    deadline.remaining() <= wait:
+                return response
+            time.sleep(wait)
+            write_request = response.unwritten
+            attempt += 1
+
+    def write_columns(self, columns, chunk_size=DEFAULT_CHUNK_SIZE,
+                      unit='ms'):
+        """Write columnar data, such as NumPy arrays or memory-mapped .npy
+        and Arrow files, without building a
+        :class:`tempoiq.protocol.point.Point` for every value.  The data is
+        serialized and sent in bodies of at most chunk_size points, so peak
+        memory is bounded by the size of one chunk.  See
+        :func:`tempoiq.protocol.columnar.iter_payloads` for the layout of
+        columns.
+
+        Chunks are sent in order, and sending stops at the first chunk that
+        isn't written completely.  Since chunk boundaries only depend on the
+        data and chunk_size, the successful chunks can be skipped when the
+        write is repeated.  The points attribute of each response holds
+        the number of points in its chunk.
+
+        :param dict columns: the data to write
+        :param int chunk_size: maximum number of points per write
+        :param string unit: numpy time unit of integer timestamps
+        :rtype: list of :class:`tempoiq.response.WriteResponse`, one per
+                chunk sent"""
+
+        responses = []
+        for body, points in iter_payloads(columns, chunk_size, unit):
+            response = self.write_encoded(body, None)
+            response.points = points
+            responses.append(response)
+            if response.successful != SUCCESS:
+                break
+        return responses
+
+    def write_encoded(self, body, write_request, headers={}, timeout=None,
+                      deadline=None):
+        """Send a write whose body has already been encoded, for callers that
+        encode writes somewhere else (see :mod:`tempoiq.backfill`).  The
+        write_request the body was encoded from is only used to report which
+        points were not written, and may be None.
+
+        :param string body: the encoded write request
+        :param dict write_request: the request the body was encoded from
+        :param dict headers: (optional) extra headers, e.g. Content-Encoding
+        :param timeout: (optional) seconds, or a (connect, read) tuple
+        :param deadline: (optional) :class:`tempoiq.deadline.Deadline`
+        :rtype: :class:`tempoiq.response.WriteResponse`"""
+
+        url = urlparse.urljoin(self.endpoint.base_url, 'write/')
+        resp = self.endpoint.post(url, body, headers=headers, timeout=timeout,
+                                  deadline=deadline)
+        response = WriteResponse(resp, self.endpoint, write_request)
+        if self.latest_cache is not None and write_request is not None:
+            self.latest_cache.record_write(write_request, response.unwritten)
+        return response
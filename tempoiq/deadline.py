@@ -0,0 +1,126 @@
+import time
+import threading
+
+
+CONNECT_TIMEOUT = 10
+
+
+class CancelledError(Exception):
+    """Raised by a call whose :class:`CancelToken` was cancelled."""
+    pass
+
+
+class DeadlineExceeded(Exception):
+    """Raised by a call that ran out of the time its :class:`Deadline`
+    allowed."""
+    pass
+
+
+class CancelToken(object):
+    """Lets one thread cancel calls made by another.  Calls check the token
+    before every request they send; requests already in flight over the
+    HTTP/2 transport are aborted as soon as the token is cancelled.  One
+    token can be shared by any number of calls."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks = []
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        """Cancel every call using this token."""
+
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.event.set()
+            callbacks = list(self.callbacks)
+            self.callbacks = []
+        for callback in callbacks:
+            callback()
+
+    def check(self):
+        if self.event.is_set():
+            raise CancelledError('The call was cancelled')
+
+    def on_cancel(self, callback):
+        """Call callback (with no arguments) when the token is cancelled, or
+        right away if it already is.
+
+        :rtype: a callable that unregisters the callback"""
+
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback):
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+
+def split_timeout(timeout):
+    """Split a timeout into its connect and read parts.
+
+    :param timeout: seconds, or a (connect, read) tuple of seconds
+    :rtype: (connect, read) tuple"""
+
+    if isinstance(timeout, tuple):
+        return timeout
+    return timeout, timeout
+
+
+class Deadline(object):
+    """An end-to-end time budget for a call, covering every request it
+    makes: a read and all of the pages its cursor fetches later, or a write
+    and its retries.  Each request gets the smaller of its own timeout and
+    the time left, and :class:`DeadlineExceeded` is raised once no time is
+    left.  A deadline can also carry a :class:`CancelToken`.
+
+    :param float seconds: (optional) the time budget. Default is no limit
+    :param token: (optional) token that cancels the call
+    :type token: :class:`CancelToken`
+    :param clock: (optional) callable returning the current time in seconds
+    """
+
+    def __init__(self, seconds=None, token=None, clock=time.time):
+        self.clock = clock
+        self.token = token
+        self.expires = None if seconds is None else clock() + seconds
+
+    def remaining(self):
+        """Seconds left, or None if there is no time limit."""
+
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - self.clock())
+
+    def check(self):
+        """Raise if the call was cancelled or has no time left."""
+
+        if self.token is not None:
+            self.token.check()
+        if self.expires is not None and self.clock() >= self.expires:
+            raise DeadlineExceeded('The call ran out of time')
+
+    def limit(self, timeout):
+        """The timeout for the next request: timeout, cut down to the time
+        left.
+
+        :param float timeout: the request's own timeout, or None
+        :rtype: float, or None for no timeout"""
+
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
@@ -1,9 +1,15 @@
 import urlparse
 import urllib
 import base64
-from google.appengine.api import urlfetch
+from lazy import LazyModule
+from deadline import split_timeout, CONNECT_TIMEOUT
+from hedge import hedged
+from breaker import HostPool, CircuitBreaker
 
 TIQ_REQUEST_TIMEOUT = 35
+#only imported once a request is sent, or an HTTP/2 endpoint is made
+urlfetch = LazyModule('google.appengine.api.urlfetch')
+http2_transport = LazyModule('tempoiq.http2')
 
 def make_url_args(params):
     """Utility function for constructing a URL query string from a dictionary
@@ -72,18 +78,76 @@ class HTTPEndpoint(object):
     :param bool secure: whether to use the HTTPS protocol. Default is True
     :param int port: the port for connecting to the endpoint. Default is the
                     standard port for HTTP or HTTPS, depending on whether
-                    secure is True"""
+                    secure is True
+    :param bool http2: whether to multiplex requests over a few HTTP/2
+                       connections (see :class:`tempoiq.http2.HTTP2Transport`)
+                       instead of using urlfetch. Default is False
+    :param timeout: default timeout of every request, in seconds, or a
+                    (connect, read) tuple. urlfetch only uses the read part
+    :type timeout: float or tuple
+    :param hedge: (optional) policy for hedging queries, which are
+                  idempotent: slow ones are sent a second time and the
+                  first answer is used
+    :type hedge: :class:`tempoiq.hedge.HedgePolicy`"""
 
-    def __init__(self, host, key, secret, secure=True, port=None):
+    def __init__(self, host, key, secret, secure=True, port=None,
+                 http2=False, timeout=(CONNECT_TIMEOUT, TIQ_REQUEST_TIMEOUT),
+                 hedge=None):
         url = construct_url(host, secure, port)
         self.base_url = url + '/v2/'
+        self.transport = http2_transport.HTTP2Transport(url) if http2 \
+            else None
+        self.timeout = timeout
+        self.hedge = hedge
 
         self.headers = {
             'User-Agent': 'tempoiq-python/%s' % "1.0.2",
             'Authorization': "Basic %s" % base64.b64encode("%s:%s" % (key,secret))
         }
 
-    def post(self, url, body, headers={}):
+    def fetch(self, url, method, body, headers, timeout=None, deadline=None,
+              idempotent=False):
+        """Send a request over the HTTP/2 transport if there is one, or
+        with urlfetch otherwise.
+
+        :param timeout: (optional) timeout for this request, overriding the
+                        endpoint's
+        :param deadline: (optional) :class:`tempoiq.deadline.Deadline` the
+                         request has to fit in
+        :param bool idempotent: whether the request may be hedged"""
+
+        if timeout is None:
+            timeout = self.timeout
+        connect, read = split_timeout(timeout)
+        token = None
+        if deadline is not None:
+            connect = deadline.limit(connect)
+            read = deadline.limit(read)
+            token = deadline.token
+        send = lambda t: self._send(url, method, body, headers, connect,
+                                    read, t)
+        try:
+            if idempotent and self.hedge is not None:
+                return hedged(self.hedge, url, send, token)
+            return send(token)
+        except Exception:
+            #report timeouts caused by the deadline as such
+            if deadline is not None:
+                deadline.check()
+            raise
+
+    def _send(self, url, method, body, headers, connect, read, token):
+        if self.transport is not None:
+            return self.transport.request(method, url, body, headers, read,
+                                          connect, token)
+        resp = urlfetch.fetch(url=url,method=method,payload=body,headers=headers,deadline=read)
+        if token is not None:
+            #urlfetch can't be interrupted, so a cancelled call only stops
+            #once the request is done
+            token.check()
+        return resp
+
+    def post(self, url, body, headers={}, timeout=None, deadline=None):
         """Perform a POST request to the given resource with the given
         body.  The "url" argument will be joined to the base URL this
         object was initialized with.
@@ -94,10 +158,11 @@ class HTTPEndpoint(object):
 
         to_hit = urlparse.urljoin(self.base_url, url)
         merged = merge_headers(self.headers, headers)
-        resp = urlfetch.fetch(url=to_hit,method="POST",payload=body,headers=merged,deadline=TIQ_REQUEST_TIMEOUT)
+        resp = self.fetch(to_hit, "POST", body, merged, timeout, deadline)
         return resp
 
-    def get(self, url, body='', headers={}):
+    def get(self, url, body='', headers={}, timeout=None,
+            deadline=None):
         """Perform a GET request to the given resource with the given URL.  The
         "url" argument will be joined to the base URL this object was
         initialized with.
@@ -107,10 +172,12 @@ class HTTPEndpoint(object):
 
         to_hit = urlparse.urljoin(self.base_url, url) + "query"
         merged = merge_headers(self.headers, headers)
-        resp = urlfetch.fetch(url=to_hit,method="POST",payload=body,headers=merged,deadline=TIQ_REQUEST_TIMEOUT)
+        resp = self.fetch(to_hit, "POST", body, merged, timeout, deadline,
+                          idempotent=True)
         return resp
 
-    def delete(self, url, body='', headers={}):
+    def delete(self, url, body='', headers={}, timeout=None,
+               deadline=None):
         """Perform a DELETE request to the given resource with the given.  The
         "url" argument will be joined to the base URL this object was
         initialized with.
@@ -120,10 +187,10 @@ class HTTPEndpoint(object):
 
         to_hit = urlparse.urljoin(self.base_url, url)
         merged = merge_headers(self.headers, headers)
-        resp = urlfetch.fetch(url=to_hit,method="DELETE",payload=body,headers=merged,deadline=TIQ_REQUEST_TIMEOUT)
+        resp = self.fetch(to_hit, "DELETE", body, merged, timeout, deadline)
         return resp
 
-    def put(self, url, body, headers={}):
+    def put(self, url, body, headers={}, timeout=None, deadline=None):
         """Perform a PUT request to the given resource with the given
         body.  The "url" argument will be joined to the base URL this
         object was initialized with.
@@ -134,5 +201,63 @@ class HTTPEndpoint(object):
 
         to_hit = urlparse.urljoin(self.base_url, url)
         merged = merge_headers(self.headers, headers)
-        resp = urlfetch.fetch(url=to_hit,method="PUT",payload=body,headers=merged,deadline=TIQ_REQUEST_TIMEOUT)
+        resp = self.fetch(to_hit, "PUT", body, merged, timeout, deadline)
         return resp
+
+
+class FailoverEndpoint(object):
+    """An endpoint for several backend hosts serving the same data.  Every
+    request goes to the healthy host with the fewest requests in flight.
+    Reads, deletes and puts are sent to another host if they fail with an
+    exception or a 5xx response; posts (writes) are not, as the failed host
+    may have stored them.  Each host has a circuit breaker: a host whose recent
+    requests mostly failed is skipped for a while, then probed with a
+    single request to see if it recovered (see
+    :class:`tempoiq.breaker.CircuitBreaker`).  If every breaker is open,
+    requests fail right away with
+    :class:`tempoiq.breaker.CircuitOpenError`.
+
+    The other parameters are those of :class:`HTTPEndpoint`, and apply to
+    every host.
+
+    :param list hosts: the hosts, in the form accepted by
+                       :class:`HTTPEndpoint`
+    :param breaker: (optional) callable making the
+                    :class:`~tempoiq.breaker.CircuitBreaker` of each host"""
+
+    def __init__(self, hosts, key, secret, secure=True, port=None,
+                 http2=False, timeout=(CONNECT_TIMEOUT, TIQ_REQUEST_TIMEOUT),
+                 hedge=None, breaker=CircuitBreaker):
+        endpoints = [HTTPEndpoint(host, key, secret, secure, port, http2,
+                                  timeout, hedge) for host in hosts]
+        self.pool = HostPool(endpoints, breaker)
+        self.base_url = endpoints[0].base_url
+        self.headers = endpoints[0].headers
+
+    def _relative(self, url):
+        #the client builds URLs from base_url, which any host can serve
+        url = urlparse.urljoin(self.base_url, url)
+        if url.startswith(self.base_url):
+            return url[len(self.base_url):]
+        return url
+
+    def post(self, url, body, headers={}, timeout=None, deadline=None):
+        url = self._relative(url)
+        return self.pool.call(lambda e: e.post(url, body, headers, timeout,
+                                               deadline), idempotent=False)
+
+    def get(self, url, body='', headers={}, timeout=None, deadline=None):
+        url = self._relative(url)
+        return self.pool.call(lambda e: e.get(url, body, headers, timeout,
+                                              deadline))
+
+    def delete(self, url, body='', headers={}, timeout=None,
+               deadline=None):
+        url = self._relative(url)
+        return self.pool.call(lambda e: e.delete(url, body, headers, timeout,
+                                                 deadline))
+
+    def put(self, url, body, headers={}, timeout=None, deadline=None):
+        url = self._relative(url)
+        return self.pool.call(lambda e: e.put(url, body, headers, timeout,
+                                              deadline))
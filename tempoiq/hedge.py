@@ -0,0 +1,204 @@
+import time
+import Queue
+import bisect
+import threading
+from deadline import CancelToken
+
+
+#upper bounds of the latency histogram buckets, in seconds: 1ms to ~2min,
+#each bucket 20% wider than the one before
+BUCKETS = [0.001 * 1.2 ** i for i in range(65)]
+DEFAULT_PERCENTILE = 95
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_BUDGET = 0.05
+DEFAULT_BURST = 10
+
+
+class LatencyHistogram(object):
+    """Counts of request latencies in exponentially growing buckets, from
+    which percentiles can be estimated to within a bucket (20%).  Once
+    max_samples latencies have been counted every count is halved, so the
+    histogram follows changes in latency instead of averaging over all
+    time.
+
+    :param int max_samples: number of samples after which counts decay"""
+
+    def __init__(self, max_samples=1000):
+        self.max_samples = max_samples
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.counts[i] += 1
+            self.total += 1
+            if self.total >= self.max_samples:
+                self.counts = [c // 2 for c in self.counts]
+                self.total = sum(self.counts)
+
+    def percentile(self, p):
+        """Estimate the p-th percentile latency, in seconds.
+
+        :param float p: percentile, between 0 and 100
+        :rtype: float, or None if nothing was recorded"""
+
+        with self.lock:
+            if self.total == 0:
+                return None
+            rank = self.total * p / 100.0
+            seen = 0
+            for i, count in enumerate(self.counts):
+                seen += count
+                if count and seen >= rank:
+                    break
+        if i >= len(BUCKETS):
+            return BUCKETS[-1]
+        return BUCKETS[i]
+
+
+class HedgePolicy(object):
+    """Decides when an idempotent request is hedged: if it hasn't answered
+    after the given percentile of recent latencies for its URL, a duplicate
+    is sent and whichever answers first is used (see :func:`hedged`).
+
+    The number of hedges is capped by a budget: every request earns budget
+    hedges (up to burst saved up), and sending a hedge spends one.  With
+    the defaults, at most about 5% extra requests are made.
+
+    :param float percentile: latency percentile to wait before hedging
+    :param float initial_delay: delay used until min_samples latencies of a
+                                URL are known, in seconds
+    :param float min_delay: shortest delay, in seconds
+    :param float max_delay: (optional) longest delay, in seconds
+    :param float budget: hedges earned per request
+    :param float burst: most hedges that can be saved up
+    :param int min_samples: latencies needed before the percentile is used
+    """
+
+    def __init__(self, percentile=DEFAULT_PERCENTILE, initial_delay=1.0,
+                 min_delay=0.01, max_delay=None, budget=DEFAULT_BUDGET,
+                 burst=DEFAULT_BURST, min_samples=DEFAULT_MIN_SAMPLES):
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.burst = burst
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.tokens = 0.0
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def histogram(self, key):
+        with self.lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = LatencyHistogram()
+            return h
+
+    def record(self, key, seconds):
+        self.histogram(key).record(seconds)
+
+    def delay(self, key):
+        """Seconds to wait before hedging a request for key."""
+
+        h = self.histogram(key)
+        if h.total < self.min_samples:
+            delay = self.initial_delay
+        else:
+            delay = h.percentile(self.percentile)
+        delay = max(delay, self.min_delay)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        return delay
+
+    def start(self):
+        """Count a request, earning it its share of the budget."""
+
+        with self.lock:
+            self.requests += 1
+            self.tokens = min(self.burst, self.tokens + self.budget)
+
+    def allow(self):
+        """Spend a hedge from the budget, if there is one left.
+
+        :rtype: bool"""
+
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            self.hedges += 1
+            return True
+
+
+def hedged(policy, key, send, token=None):
+    """Call send, and call it again if the first call hasn't returned after
+    the policy's delay for key and the budget allows.  The first call to
+    return without raising wins, and the other one is cancelled.  The
+    latency recorded in the policy is measured from when hedged was called,
+    not from when the winning attempt was sent, so hedge wins don't make
+    the URL look faster than it answers.
+
+    :param policy: the :class:`HedgePolicy`
+    :param key: what latencies are tracked by, e.g. the URL
+    :param send: callable taking a :class:`tempoiq.deadline.CancelToken`
+                 that cancels it
+    :param token: (optional) token cancelling the whole call
+    :rtype: the return value of send"""
+
+    started = time.time()
+    policy.start()
+    outcomes = Queue.Queue()
+    tokens = []
+    unregister = []
+
+    def attempt(index):
+        attempt_token = CancelToken()
+        tokens.append(attempt_token)
+        if token is not None:
+            unregister.append(token.on_cancel(attempt_token.cancel))
+
+        def run():
+            try:
+                outcomes.put((index, send(attempt_token), None))
+            except Exception, e:
+                outcomes.put((index, None, e))
+
+        t = threading.Thread(target=run)
+        t.daemon = True
+        t.start()
+
+    attempt(0)
+    pending = 1
+    try:
+        index, result, error = outcomes.get(True, policy.delay(key))
+        pending -= 1
+    except Queue.Empty:
+        if policy.allow():
+            attempt(1)
+            pending += 1
+        index, result, error = outcomes.get()
+        pending -= 1
+    while error is not None and pending:
+        index, result, error = outcomes.get()
+        pending -= 1
+    elapsed = time.time() - started
+
+    for callback in unregister:
+        callback()
+    for i, attempt_token in enumerate(tokens):
+        if i != index:
+            attempt_token.cancel()
+    if error is not None:
+        raise error
+    policy.record(key, elapsed)
+    if index == 1:
+        with policy.lock:
+            policy.wins += 1
+    return result
@@ -0,0 +1,396 @@
+import ssl
+import socket
+import threading
+import urlparse
+from deadline import CancelledError, CONNECT_TIMEOUT
+
+
+H2MSG = 'The HTTP/2 transport requires the h2 package'
+DEFAULT_CONNECTIONS = 2
+DEFAULT_MAX_STREAMS = 100
+READ_SIZE = 65535
+#headers that only make sense for a single HTTP/1.1 connection
+HOP_HEADERS = ('connection', 'host', 'keep-alive', 'proxy-connection',
+               'transfer-encoding', 'upgrade')
+
+
+def _import_h2():
+    try:
+        import h2.config
+        import h2.connection
+        import h2.events
+        return h2
+    except ImportError:
+        raise ImportError(H2MSG)
+
+
+class HTTP2Error(IOError):
+    """Raised when a request can't be completed over HTTP/2: the connection
+    was lost, the server reset the stream or the request timed out."""
+    pass
+
+
+class HTTP2Response(object):
+    """The response to a request sent over HTTP/2, with the same attributes
+    the client reads from urlfetch responses.
+
+    :var status_code: the HTTP status code
+    :var headers: dict of response headers
+    :var content: the response body"""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = None
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8')
+
+
+class _Stream(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.status = None
+        self.headers = {}
+        self.data = []
+        self.error = None
+
+
+class HTTP2Connection(object):
+    """A single HTTP/2 connection that carries many requests at once, each
+    on its own stream.  Requests can be made from any number of threads: a
+    background thread reads the socket and hands each stream its response.
+    At most max_streams requests (or fewer, if the server says so) are in
+    flight at a time, further requests wait for a stream to finish.
+
+    Bodies are sent as the server's flow control windows allow, and every
+    byte received is acknowledged as soon as it is read, so one large
+    response doesn't hold up the streams next to it.
+
+    :param string host: the server to connect to
+    :param int port: the server's port
+    :param bool secure: whether to use TLS, negotiating HTTP/2 with ALPN.
+                        Plain connections use HTTP/2 with prior knowledge
+    :param int max_streams: most concurrent requests on the connection
+    :param float connect_timeout: seconds to wait for the connection"""
+
+    def __init__(self, host, port, secure=True,
+                 max_streams=DEFAULT_MAX_STREAMS,
+                 connect_timeout=CONNECT_TIMEOUT):
+        h2 = _import_h2()
+        self.events = h2.events
+        self.host = host
+        self.secure = secure
+        self.scheme = 'https' if secure else 'http'
+        if port == (443 if secure else 80):
+            self.authority = host
+        else:
+            self.authority = '%s:%d' % (host, port)
+        self.max_streams = max_streams
+
+        sock = socket.create_connection((host, port), connect_timeout)
+        if secure:
+            context = ssl.create_default_context()
+            context.set_alpn_protocols(['h2'])
+            sock = context.wrap_socket(sock, server_hostname=host)
+            if sock.selected_alpn_protocol() != 'h2':
+                sock.close()
+                raise HTTP2Error('%s does not support HTTP/2' % host)
+        sock.settimeout(None)
+        self.sock = sock
+
+        config = h2.config.H2Configuration(client_side=True,
+                                           header_encoding='utf-8')
+        self.conn = h2.connection.H2Connection(config=config)
+        self.lock = threading.Condition()
+        self.streams = {}
+        self.active = 0
+        #requests handed this connection by a transport, started or not
+        self.assigned = 0
+        self.closed = False
+        self.error = None
+        with self.lock:
+            self.conn.initiate_connection()
+            self._flush()
+
+        self.reader = threading.Thread(target=self._read)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def _flush(self):
+        #must hold self.lock
+        data = self.conn.data_to_send()
+        if data:
+            self.sock.sendall(data)
+
+    def limit(self):
+        """The number of requests that can be in flight at once."""
+
+        remote = self.conn.remote_settings.max_concurrent_streams
+        if remote is None:
+            return self.max_streams
+        return min(self.max_streams, remote)
+
+    def request(self, method, path, body='', headers={}, timeout=None,
+                token=None):
+        """Send a request and wait for its response.  If token is cancelled
+        while the request is in flight, its stream is reset and
+        :class:`tempoiq.deadline.CancelledError` is raised.
+
+        :param string method: the HTTP method
+        :param string path: the path and query string to request
+        :param string body: (optional) the request body
+        :param dict headers: (optional) request headers
+        :param float timeout: (optional) seconds to wait for the response
+        :param token: (optional) :class:`tempoiq.deadline.CancelToken`
+        :rtype: :class:`HTTP2Response`"""
+
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+        body = body or ''
+        request_headers = [(':method', method), (':path', path),
+                           (':scheme', self.scheme),
+                           (':authority', self.authority)]
+        for name, value in headers.iteritems():
+            name = name.lower()
+            if name not in HOP_HEADERS and name != 'content-length':
+                request_headers.append((name, str(value)))
+        request_headers.append(('content-length', str(len(body))))
+
+        stream = _Stream()
+        with self.lock:
+            while not self.closed and self.active >= self.limit():
+                self.lock.wait()
+            if self.closed:
+                raise HTTP2Error('Connection to %s is closed' % self.host)
+            self.active += 1
+            stream_id = self.conn.get_next_available_stream_id()
+            self.streams[stream_id] = stream
+            try:
+                self.conn.send_headers(stream_id, request_headers,
+                                       end_stream=not body)
+                self._flush()
+            except Exception:
+                self._finish(stream_id)
+                raise
+
+        unregister = None
+        if token is not None:
+            unregister = token.on_cancel(
+                lambda: self._cancel(stream_id, stream))
+        try:
+            if body:
+                self._send_body(stream_id, stream, body)
+            if not stream.done.wait(timeout):
+                self._reset(stream_id)
+                raise HTTP2Error('Request to %s timed out' % self.host)
+        finally:
+            if unregister is not None:
+                unregister()
+            with self.lock:
+                self._finish(stream_id)
+        if stream.error is not None:
+            raise stream.error
+        return HTTP2Response(stream.status, stream.headers,
+                             ''.join(stream.data))
+
+    def _finish(self, stream_id):
+        #must hold self.lock
+        if self.streams.pop(stream_id, None) is not None:
+            self.active -= 1
+            self.lock.notify_all()
+
+    def _send_body(self, stream_id, stream, body):
+        offset = 0
+        while offset < len(body):
+            with self.lock:
+                while True:
+                    if self.closed or stream.done.is_set():
+                        #the server has answered or reset the stream
+                        return
+                    window = self.conn.local_flow_control_window(stream_id)
+                    if window > 0:
+                        break
+                    self.lock.wait()
+                size = min(window, self.conn.max_outbound_frame_size,
+                           len(body) - offset)
+                chunk = body[offset:offset + size]
+                offset += size
+                self.conn.send_data(stream_id, chunk,
+                                    end_stream=offset >= len(body))
+                self._flush()
+
+    def _cancel(self, stream_id, stream):
+        with self.lock:
+            if stream.done.is_set():
+                return
+            stream.error = CancelledError('The call was cancelled')
+            stream.done.set()
+            self.lock.notify_all()
+        self._reset(stream_id)
+
+    def _reset(self, stream_id):
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                self.conn.reset_stream(stream_id)
+                self._flush()
+            except Exception:
+                pass
+
+    def _read(self):
+        error = None
+        try:
+            while True:
+                data = self.sock.recv(READ_SIZE)
+                if not data:
+                    break
+                with self.lock:
+                    for event in self.conn.receive_data(data):
+                        self._handle(event)
+                    self._flush()
+                    self.lock.notify_all()
+                if self.closed:
+                    break
+        except Exception, e:
+            error = e
+        self._fail(HTTP2Error('Connection to %s was lost: %s'
+                              % (self.host, error or 'closed by server')))
+        self.sock.close()
+
+    def _handle(self, event):
+        #must hold self.lock
+        events = self.events
+        if isinstance(event, events.DataReceived):
+            self.conn.acknowledge_received_data(event.flow_controlled_length,
+                                                event.stream_id)
+        stream = self.streams.get(getattr(event, 'stream_id', None))
+        if isinstance(event, events.ConnectionTerminated):
+            self._fail(HTTP2Error('Connection to %s was closed by the '
+                                  'server, error code %s'
+                                  % (self.host, event.error_code)))
+        elif stream is None:
+            return
+        elif isinstance(event, events.ResponseReceived):
+            for name, value in event.headers:
+                if name == ':status':
+                    stream.status = int(value)
+                elif not name.startswith(':'):
+                    stream.headers[name] = value
+        elif isinstance(event, events.DataReceived):
+            stream.data.append(event.data)
+        elif isinstance(event, events.StreamEnded):
+            stream.done.set()
+        elif isinstance(event, events.StreamReset):
+            stream.error = HTTP2Error('Stream reset by %s, error code %s'
+                                      % (self.host, event.error_code))
+            stream.done.set()
+
+    def _fail(self, error):
+        with self.lock:
+            if self.error is None:
+                self.error = error
+            self.closed = True
+            for stream in self.streams.itervalues():
+                if not stream.done.is_set():
+                    stream.error = error
+                    stream.done.set()
+            self.lock.notify_all()
+
+    def close(self):
+        """Close the connection.  Requests in flight fail."""
+
+        with self.lock:
+            if not self.closed:
+                try:
+                    self.conn.close_connection()
+                    self._flush()
+                except Exception:
+                    pass
+            self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+
+
+class HTTP2Transport(object):
+    """Sends requests for an endpoint over a few shared HTTP/2 connections
+    instead of one connection per request.  Each request goes to an open
+    connection with a free stream, opening a new connection (up to
+    connections) only when all of them are busy.  Connections that are
+    lost are replaced on the next request.
+
+    Pass ``http2=True`` to :class:`tempoiq.endpoint.HTTPEndpoint` (or
+    :func:`tempoiq.session.get_session`) to use it.
+
+    :param string base_url: the endpoint's base URL
+    :param int connections: most connections to open
+    :param int max_streams: most concurrent requests per connection"""
+
+    def __init__(self, base_url, connections=DEFAULT_CONNECTIONS,
+                 max_streams=DEFAULT_MAX_STREAMS):
+        _import_h2()
+        parsed = urlparse.urlparse(base_url)
+        self.secure = parsed.scheme == 'https'
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if self.secure else 80)
+        self.max_streams = max_streams
+        self.lock = threading.Lock()
+        self.pool = [None] * connections
+
+    def connection(self, connect_timeout=CONNECT_TIMEOUT):
+        """Pick the connection for the next request, which must be handed
+        back by decrementing its assigned count once the request is done.
+
+        :rtype: :class:`HTTP2Connection`"""
+
+        with self.lock:
+            open_ = [c for c in self.pool if c is not None and not c.closed]
+            free = [c for c in open_ if c.assigned < c.limit()]
+            if free:
+                chosen = min(free, key=lambda c: c.assigned)
+            else:
+                chosen = None
+                for i, c in enumerate(self.pool):
+                    if c is None or c.closed:
+                        chosen = HTTP2Connection(self.host, self.port,
+                                                 self.secure,
+                                                 self.max_streams,
+                                                 connect_timeout)
+                        self.pool[i] = chosen
+                        break
+                if chosen is None:
+                    chosen = min(open_, key=lambda c: c.assigned)
+            chosen.assigned += 1
+            return chosen
+
+    def request(self, method, url, body='', headers={}, timeout=None,
+                connect_timeout=CONNECT_TIMEOUT, token=None):
+        """Send a request to a URL of the endpoint.  See
+        :meth:`HTTP2Connection.request`.
+
+        :rtype: :class:`HTTP2Response`"""
+
+        parsed = urlparse.urlparse(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        connection = self.connection(connect_timeout)
+        try:
+            return connection.request(method, path, body, headers, timeout,
+                                      token)
+        finally:
+            with self.lock:
+                connection.assigned -= 1
+
+    def close(self):
+        with self.lock:
+            pool = [c for c in self.pool if c is not None]
+            self.pool = [None] * len(self.pool)
+        for c in pool:
+            c.close()
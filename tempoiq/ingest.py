@@ -0,0 +1,184 @@
+import threading
+from response import SUCCESS
+from protocol.query.pipeline import to_micros
+from temporal.validate import convert_iso_stamp
+
+
+DEFAULT_MAX_POINTS = 5000
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+def point_timestamp(point):
+    if isinstance(point, dict):
+        return point['t']
+    return point.timestamp
+
+
+def timestamp_micros(point):
+    """The timestamp of a point as microseconds since the epoch, whether
+    it is a Datetime (naive ones are taken as UTC) or an ISO8601 string, so
+    that the same instant always gives the same number."""
+
+    t = point_timestamp(point)
+    if isinstance(t, basestring):
+        t = convert_iso_stamp(t)
+    return to_micros(t)
+
+
+def point_value(point):
+    if isinstance(point, dict):
+        return point['v']
+    return point.value
+
+
+class IngestBuffer(object):
+    """A client-side buffer that coalesces many small writes into a few
+    large ones.  Points handed to :meth:`write` are merged into a map per
+    (device, sensor) keyed by the instant of their timestamp, so a point
+    written more than once before a flush is only sent once, with the value
+    from the last write, even if its timestamp was given as a Datetime one
+    time and a string the next.
+
+    The merged points are sent through :meth:`tempoiq.client.Client.write`,
+    sorted by timestamp, as soon as max_points distinct points are pending
+    or flush_interval seconds after the first pending point arrived,
+    whichever comes first.  Size triggered flushes happen in the thread
+    calling :meth:`write`; time triggered ones in a background thread.
+
+    Failed writes are passed to on_error(batch, response), or on_error(batch,
+    exception) if the write raised.  Either way the batch is dropped.
+    Without on_error, an exception raised by a write in the background
+    thread is raised again by the next call to :meth:`write` or
+    :meth:`flush`.
+
+    :param client: the :class:`tempoiq.client.Client` to write through
+    :param int max_points: flush once this many distinct points are pending
+    :param float flush_interval: maximum seconds a point waits to be sent
+    :param on_error: (optional) callable for batches that can't be written
+    :param int retries: (optional) passed on to Client.write"""
+
+    def __init__(self, client, max_points=DEFAULT_MAX_POINTS,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, on_error=None,
+                 retries=0):
+        self.client = client
+        self.max_points = max_points
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self.retries = retries
+        #(device, sensor) -> timestamp in microseconds -> point
+        self.pending = {}
+        self.pending_points = 0
+        self.received = 0
+        self.sent = 0
+        self.requests = 0
+        self.error = None
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, write_request):
+        """Queue a write request.  Takes the same argument as
+        :meth:`tempoiq.client.Client.write`.
+
+        :param dict write_request:"""
+
+        self._raise_error()
+        with self.lock:
+            first = self.pending_points == 0
+            for device, sensors in write_request.iteritems():
+                for sensor, points in sensors.iteritems():
+                    merged = self.pending.setdefault((device, sensor), {})
+                    for point in points:
+                        t = timestamp_micros(point)
+                        if t not in merged:
+                            self.pending_points += 1
+                        merged[t] = point
+                        self.received += 1
+            full = self.pending_points >= self.max_points
+        if full:
+            self.flush()
+        elif first:
+            self.wakeup.set()
+
+    def flush(self):
+        """Send everything pending now.
+
+        :rtype: the response from Client.write, or None if nothing was
+                pending"""
+
+        self._raise_error()
+        return self._flush()
+
+    def _raise_error(self):
+        with self.lock:
+            error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def _flush(self):
+        with self.send_lock:
+            batch, points = self._take()
+            if not points:
+                return None
+            return self._send(batch, points)
+
+    def close(self, flush=True):
+        """Stop the background flusher.
+
+        :param bool flush: whether to send pending points first. If False
+                           they are discarded"""
+
+        self.stopping.set()
+        self.wakeup.set()
+        self.thread.join()
+        if flush:
+            self.flush()
+
+    def _take(self):
+        with self.lock:
+            pending, points = self.pending, self.pending_points
+            self.pending = {}
+            self.pending_points = 0
+        batch = {}
+        for (device, sensor), merged in pending.iteritems():
+            batch.setdefault(device, {})[sensor] = [
+                merged[t] for t in sorted(merged)]
+        return batch, points
+
+    def _send(self, batch, points):
+        try:
+            response = self.client.write(batch, retries=self.retries)
+        except Exception, e:
+            if self.on_error is None:
+                raise
+            self.on_error(batch, e)
+            return None
+        self.requests += 1
+        if response.successful == SUCCESS:
+            self.sent += points
+        elif self.on_error is not None:
+            self.on_error(batch, response)
+        return response
+
+    def _run(self):
+        while not self.stopping.is_set():
+            self.wakeup.wait()
+            self.wakeup.clear()
+            if self.stopping.is_set():
+                return
+            #give the rest of the batch time to arrive
+            #wait() only returns the flag from 2.7 on
+            self.stopping.wait(self.flush_interval)
+            if self.stopping.is_set():
+                return
+            try:
+                self._flush()
+            except Exception, e:
+                #without an on_error handler, the caller hears about it on
+                #its next write or flush
+                with self.lock:
+                    self.error = e
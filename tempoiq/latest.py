@@ -0,0 +1,144 @@
+import time
+import threading
+from protocol.row import Row
+from protocol.query.batch import selected_keys
+from temporal.validate import localize_datetime, convert_iso_stamp
+from ingest import point_timestamp, point_value
+
+
+DEFAULT_MAX_AGE = 5.0
+
+
+def written_points(write_request, unwritten):
+    """The points of a write request that were written, given the points
+    that were not (see :class:`tempoiq.response.WriteResponse`).
+
+    :rtype: generator of (device, sensor, point) tuples"""
+
+    for device, sensors in write_request.iteritems():
+        failed_sensors = unwritten.get(device, {})
+        for sensor, points in sensors.iteritems():
+            failed = set(id(p) for p in failed_sensors.get(sensor, ()))
+            for point in points:
+                if id(point) not in failed:
+                    yield device, sensor, point
+
+
+class LatestCache(object):
+    """In-process cache of the newest value of every (device, sensor) stream
+    the client has written or read with ``single('latest')``.  Only the
+    point with the greatest timestamp is kept per stream, along with when
+    it was last confirmed.  A ``single('latest')`` call is answered from
+    the cache when its query names its devices and sensors by key, has no
+    pipeline, and every stream it names was confirmed less than max_age
+    seconds ago.
+
+    Points written by other processes are only seen once the entry has
+    gone stale and the backend is asked again, so max_age is how out of
+    date a cached answer may be.
+
+    :param float max_age: seconds an entry stays fresh
+    :param clock: (optional) callable returning the current time in seconds
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE, clock=time.time):
+        self.max_age = max_age
+        self.clock = clock
+        self.lock = threading.Lock()
+        #(device, sensor) -> (timestamp, value, confirmed at)
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, device, sensor, timestamp, value):
+        """Record a point of a stream, keeping it if it is at least as new
+        as the cached one."""
+
+        timestamp = localize_datetime(timestamp)
+        now = self.clock()
+        key = (device, sensor)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or timestamp >= entry[0]:
+                self.entries[key] = (timestamp, value, now)
+
+    def record_write(self, write_request, unwritten):
+        """Record the points of a write request that were written.  Points
+        may be :class:`~tempoiq.protocol.point.Point` objects or dicts with
+        't' and 'v' keys, as taken by :meth:`tempoiq.client.Client.write`.
+        """
+
+        latest = {}
+        for device, sensor, point in written_points(write_request,
+                                                    unwritten):
+            key = (device, sensor)
+            timestamp = point_timestamp(point)
+            if isinstance(timestamp, basestring):
+                timestamp = convert_iso_stamp(timestamp)
+            timestamp = localize_datetime(timestamp)
+            if key not in latest or timestamp >= latest[key][0]:
+                latest[key] = (timestamp, point_value(point))
+        for (device, sensor), (timestamp, value) in latest.iteritems():
+            self.record(device, sensor, timestamp, value)
+
+    def record_rows(self, rows):
+        """Record the rows returned by a ``single('latest')`` call."""
+
+        for row in rows:
+            for (device, sensor), value in row:
+                self.record(device, sensor, row.timestamp, value)
+
+    def lookup(self, query):
+        """Answer a ``single('latest')`` query from the cache.
+
+        :param query: the :class:`~tempoiq.protocol.query.builder.QueryBuilder`
+        :rtype: list of :class:`~tempoiq.protocol.row.Row`, or None if the
+                query can't be answered from the cache"""
+
+        streams = cacheable_streams(query)
+        if streams is None:
+            return None
+        oldest = self.clock() - self.max_age
+        found = []
+        with self.lock:
+            for key in streams:
+                entry = self.entries.get(key)
+                if entry is None or entry[2] < oldest:
+                    self.misses += 1
+                    return None
+                found.append((key, entry))
+            self.hits += 1
+
+        by_time = {}
+        for (device, sensor), (timestamp, value, confirmed) in found:
+            data = by_time.setdefault(timestamp, {})
+            data.setdefault(device, {})[sensor] = value
+        return [Row({'t': t.isoformat(), 'data': by_time[t]})
+                for t in sorted(by_time)]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def is_latest(query):
+    operation = query.operation
+    return operation is not None and operation.name == 'single' and \
+        operation.args.get('function') == 'latest' and \
+        'timestamp' not in operation.args
+
+
+def cacheable_streams(query):
+    """The (device, sensor) streams a ``single('latest')`` query asks for,
+    or None if the cache can't tell which streams it covers.
+
+    :rtype: list of (device key, sensor key) tuples, or None"""
+
+    if not is_latest(query) or query.pipeline or \
+            query.operation.args.get('include_selection'):
+        return None
+    devices = selected_keys(query, 'devices')
+    sensors = selected_keys(query, 'sensors')
+    if not devices or not sensors:
+        return None
+    return [(d, s) for d in sorted(devices) for s in sorted(sensors)]
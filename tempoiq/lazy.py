@@ -0,0 +1,39 @@
+import sys
+
+
+class LazyModule(object):
+    """Stands in for a module that is slow to import (pytz, dateutil, the
+    App Engine APIs, the HTTP/2 transport) and is only imported when one of
+    its attributes is first used, so that importing tempoiq and creating a
+    session stays cheap::
+
+        pytz = LazyModule('pytz')
+        pytz.timezone('UTC')   #pytz is imported here
+
+    :param string name: the module's full name
+    :param string attribute: (optional) use this attribute of the module
+                             instead of the module itself, for modules like
+                             ``pytz.gae`` that wrap another one"""
+
+    def __init__(self, name, attribute=None):
+        self._name = name
+        self._attribute = attribute
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            #importlib is only there from 2.7 on
+            __import__(self._name)
+            module = sys.modules[self._name]
+            if self._attribute is not None:
+                module = getattr(module, self._attribute)
+            self._module = module
+        return self._module
+
+    def __getattr__(self, name):
+        #attributes aren't copied onto the proxy, so that patching the real
+        #module (e.g. in tests) still works
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        return '<lazy module %s>' % self._name
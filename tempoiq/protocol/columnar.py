@@ -0,0 +1,168 @@
+import json
+
+
+DEFAULT_CHUNK_SIZE = 50000
+NUMPYMSG = 'Columnar writes require the numpy package'
+PYARROWMSG = 'Reading Arrow files requires the pyarrow package'
+
+
+def _import_numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        raise ImportError(NUMPYMSG)
+
+
+def load_npy(timestamps_path, values_path):
+    """Memory-map a pair of .npy files holding the timestamps and values of
+    one sensor.  Nothing is read from disk until the arrays are encoded.
+
+    :param string timestamps_path: .npy file of datetime64 or integer
+                                   timestamps
+    :param string values_path: .npy file of values
+    :rtype: (timestamps, values) tuple of arrays"""
+
+    np = _import_numpy()
+    return (np.load(timestamps_path, mmap_mode='r'),
+            np.load(values_path, mmap_mode='r'))
+
+
+def load_arrow(path, timestamp_column='t', value_column='v'):
+    """Memory-map an Arrow IPC file holding the points of one sensor, one
+    block per record batch.  Columns without nulls are read without copying.
+
+    :param string path: the Arrow file
+    :param string timestamp_column: name of the timestamp column
+    :param string value_column: name of the value column
+    :rtype: generator of (timestamps, values) tuples of arrays"""
+
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError(PYARROWMSG)
+    reader = pa.ipc.open_file(pa.memory_map(path, 'r'))
+    names = reader.schema.names
+    t = names.index(timestamp_column)
+    v = names.index(value_column)
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        yield batch.column(t).to_numpy(), batch.column(v).to_numpy()
+
+
+def _blocks(series):
+    #a series is either one (timestamps, values) pair or an iterable of them
+    if isinstance(series, tuple) and len(series) == 2 and \
+            hasattr(series[0], '__len__'):
+        return [series]
+    return series
+
+
+def format_timestamps(np, timestamps, unit='ms'):
+    """Format an array of timestamps as ISO8601 strings in UTC.  Integer
+    timestamps are taken as offsets from the Unix epoch in unit.
+
+    :param timestamps: array of datetime64 or integer timestamps
+    :param string unit: numpy time unit of integer timestamps
+    :rtype: array of strings"""
+
+    timestamps = np.asarray(timestamps)
+    if timestamps.dtype.kind != 'M':
+        if timestamps.dtype.kind not in 'iu':
+            raise ValueError('Timestamps must be datetime64 or integers')
+        timestamps = timestamps.astype('datetime64[%s]' % unit)
+    return np.datetime_as_string(timestamps, timezone='UTC')
+
+
+def format_values(np, values):
+    """Format an array of values as JSON literals.
+
+    :param values: array of numbers or booleans
+    :rtype: array of strings"""
+
+    values = np.asarray(values)
+    if values.dtype.kind == 'b':
+        return np.where(values, 'true', 'false')
+    if values.dtype.kind not in 'iuf':
+        raise ValueError('Values must be numbers or booleans')
+    if values.dtype.kind == 'f' and not np.isfinite(values).all():
+        raise ValueError('Values must be finite to be written')
+    return values.astype(str)
+
+
+def encode_points(np, timestamps, values, unit='ms'):
+    """Encode parallel timestamp and value arrays as the JSON list of points
+    used in a write request.
+
+    :rtype: string"""
+
+    if len(timestamps) != len(values):
+        raise ValueError('Timestamps and values must have the same length')
+    if len(timestamps) == 0:
+        return '[]'
+    points = np.char.add(
+        np.char.add('{"t":"', format_timestamps(np, timestamps, unit)),
+        np.char.add('","v":', np.char.add(format_values(np, values), '}')))
+    return '[' + ','.join(points.tolist()) + ']'
+
+
+def _slices(columns, chunk_size):
+    #walk every series of every sensor, cutting the blocks into slices so
+    #that no more than chunk_size points are taken at a time
+    for device, sensors in columns.iteritems():
+        for sensor, series in sensors.iteritems():
+            for timestamps, values in _blocks(series):
+                for start in xrange(0, len(timestamps), chunk_size):
+                    end = start + chunk_size
+                    yield (device, sensor, timestamps[start:end],
+                           values[start:end])
+
+
+def _payload(np, chunk, unit):
+    devices = []
+    for device, sensors in chunk:
+        encoded = []
+        for sensor, parts in sensors:
+            points = ','.join(encode_points(np, t, v, unit)[1:-1]
+                              for t, v in parts)
+            encoded.append('%s:[%s]' % (json.dumps(sensor), points))
+        devices.append('%s:{%s}' % (json.dumps(device), ','.join(encoded)))
+    return '{%s}' % ','.join(devices)
+
+
+def iter_payloads(columns, chunk_size=DEFAULT_CHUNK_SIZE, unit='ms'):
+    """Serialize columnar data into write request bodies of at most
+    chunk_size points each, without creating an object per point.  Only
+    the slice of each array going into the current body is read, so
+    memory-mapped input is never loaded all at once.
+
+    The columns argument is laid out like a write request, mapping device
+    keys to dicts which map sensor keys to a (timestamps, values) tuple of
+    arrays, or to an iterable of such tuples (see :func:`load_arrow`).
+
+    :param dict columns: the data to write
+    :param int chunk_size: maximum number of points per body
+    :param string unit: numpy time unit of integer timestamps
+    :rtype: generator of (body, number of points) tuples"""
+
+    np = _import_numpy()
+    if chunk_size < 1:
+        raise ValueError('Chunk size must be positive')
+
+    chunk = []
+    points = 0
+    for device, sensor, timestamps, values in _slices(columns, chunk_size):
+        count = len(timestamps)
+        if points + count > chunk_size:
+            yield _payload(np, chunk, unit), points
+            chunk = []
+            points = 0
+        if not chunk or chunk[-1][0] != device:
+            chunk.append((device, []))
+        sensors = chunk[-1][1]
+        if not sensors or sensors[-1][0] != sensor:
+            sensors.append((sensor, []))
+        sensors[-1][1].append((timestamps, values))
+        points += count
+    if points:
+        yield _payload(np, chunk, unit), points
@@ -1,17 +1,32 @@
-from collections import defaultdict
-from row import Row, StreamInfo, PointStream
+import heapq
+from collections import defaultdict, namedtuple
+from row import Row, StreamInfo, PointStream, make_projection, project_values
 from device import Device
 from sensor import Sensor
+from decoder import TempoIQDecoder
+from export import export_pages, DEFAULT_ROW_GROUP_SIZE
+from query.pipeline import to_micros
+from tempoiq.temporal.validate import localize_datetime, convert_iso_stamps
 
 
-def make_row_generator(rows):
+#one value of a read, as yielded by DataPointsCursor.iter_points
+PointRecord = namedtuple('PointRecord', ['timestamp', 'device', 'sensor',
+                                         'value'])
+#one timestamp of several reads, as yielded by merge_cursors
+MergedRow = namedtuple('MergedRow', ['timestamp', 'values'])
+FILLS = (None, 'previous', 'nan')
+
+
+def make_row_generator(rows, projection=None):
     """"Utility function for converting a list to a generator.
 
     :param list d: the list to convert
+    :param dict projection: (optional) see
+                            :func:`tempoiq.protocol.row.make_projection`
     :rtype: generator"""
 
     for r in rows:
-        yield Row(r)
+        yield Row(r, projection)
 
 
 def make_device_generator(devices):
@@ -23,6 +38,47 @@ def make_device_generator(devices):
         yield Device(d['key'], d.get('name', ''), d['attributes'], sensors)
 
 
+def alert_in_range(alert, start=None, end=None):
+    """Utility function for checking whether an alert was raised within the
+    given time bounds.  An alert is considered to be raised at the timestamp
+    of its first transition.  Either bound may be None to leave that side of
+    the range open.
+
+    :param alert: the alert to check
+    :type alert: :class:`tempoiq.protocol.rule.Alert`
+    :param Datetime start: (optional) inclusive start of the range
+    :param Datetime end: (optional) exclusive end of the range
+    :rtype: bool"""
+
+    if not alert.transitions:
+        return True
+    raised = localize_datetime(alert.transitions[0].timestamp)
+    if start is not None and raised < localize_datetime(start):
+        return False
+    if end is not None and raised >= localize_datetime(end):
+        return False
+    return True
+
+
+def make_alert_generator(alerts, start=None, end=None):
+    """Utility function for lazily decoding a page of alerts.  Transitions
+    are only decoded when they are accessed, so alerts that are filtered out
+    by the time bounds cost no more than parsing a single timestamp.
+
+    :param list alerts: the raw alert JSON to decode
+    :param Datetime start: (optional) drop alerts raised before this time
+    :param Datetime end: (optional) drop alerts raised at or after this time
+    :rtype: generator"""
+
+    decoder = TempoIQDecoder()
+    bounded = start is not None or end is not None
+    for a in alerts:
+        alert = decoder.decode_lazy_alert(a)
+        if bounded and not alert_in_range(alert, start, end):
+            continue
+        yield alert
+
+
 def check_response(resp):
     """Utility function for checking the status of a cursor increment.  Raises
     an exception if the call to the paginated link returns anything other than
@@ -95,14 +151,19 @@ class DataPointsCursor(Cursor):
     Additionally, the raw response object is available as the response
     attribute of the cursor.
 
+    Rows only keep the values of the (device key, sensor key) pairs in
+    project, if it is given.
+
     :param response: the raw response object
-    :type response: :class:`tempodb.response.Response"""
+    :type response: :class:`tempodb.response.Response
+    :param list project: (optional) (device key, sensor key) pairs to keep"""
 
-    def __init__(self, response, data, fetcher):
+    def __init__(self, response, data, fetcher, project=None):
         self.response = response
         self.fetcher = fetcher
+        self.projection = make_projection(project)
         self._raw_data = data
-        self.data = make_row_generator(data['data'])
+        self.data = make_row_generator(data['data'], self.projection)
 
     def _fetch_next(self):
         try:
@@ -110,12 +171,173 @@ class DataPointsCursor(Cursor):
             new_data = self.fetcher(cursor_obj)
             self._raw_data = new_data
             self.response.data = new_data
-            self.data = make_row_generator(new_data['data'])
+            self.data = make_row_generator(new_data['data'],
+                                           self.projection)
         except KeyError:
             raise StopIteration
         except Exception:
             raise
 
+    def iter_pages(self):
+        """Iterate over the raw 'data' list of every page, starting with the
+        current one and fetching the rest as needed.  The cursor is
+        exhausted afterwards, so this shouldn't be mixed with iterating the
+        cursor itself."""
+
+        self.data = iter([])
+        while True:
+            yield self._raw_data['data']
+            try:
+                cursor_obj = self._raw_data['next_page']['next_query']
+            except KeyError:
+                return
+            self._raw_data = self.fetcher(cursor_obj)
+
+    def iter_points(self, named=False, epoch=False):
+        """Iterate over every value of every page as flat (timestamp, device
+        key, sensor key, value) tuples, read straight from the page JSON
+        without building :class:`~tempoiq.protocol.row.Row` objects.  Each
+        row's timestamp is only parsed once.  Like :meth:`iter_pages`, this
+        exhausts the cursor.
+
+        :param bool named: whether to yield :class:`PointRecord` named
+                           tuples instead of plain tuples
+        :param bool epoch: whether to yield timestamps as integer
+                           milliseconds since the Unix epoch instead of
+                           Datetimes
+        :rtype: generator"""
+
+        projection = self.projection
+        for page in self.iter_pages():
+            stamps = convert_iso_stamps([row['t'] for row in page])
+            for row, t in zip(page, stamps):
+                if epoch:
+                    t = to_micros(t) // 1000
+                data = row['data']
+                if projection is not None:
+                    data = project_values(data, projection)
+                for device, sensors in data.iteritems():
+                    for sensor, value in sensors.iteritems():
+                        if named:
+                            yield PointRecord(t, device, sensor, value)
+                        else:
+                            yield (t, device, sensor, value)
+
+    def export(self, sink, format='csv', row_group_size=DEFAULT_ROW_GROUP_SIZE,
+               compression=None):
+        """Stream the pages of this cursor into sink as they are fetched,
+        without building :class:`~tempoiq.protocol.row.Row` objects.  See
+        :func:`tempoiq.protocol.export.export_pages` for the formats.
+
+        :param sink: writable binary file object
+        :param string format: one of "csv", "arrow" or "parquet"
+        :param int row_group_size: maximum values per batch or row group
+        :param string compression: (optional) compression codec
+        :rtype: int, the number of values written"""
+
+        return export_pages(self.iter_pages(), sink, format, row_group_size,
+                            compression)
+
+
+class AlertCursor(Cursor):
+    """A cursor over the alerts of a monitoring rule.  Alerts are decoded one
+    page at a time as the cursor is iterated, so paging through the history
+    of a noisy rule only ever holds a single page in memory.
+
+    The raw response object is available as the response attribute of the
+    cursor.
+
+    :param response: the raw response object
+    :type response: :class:`tempoiq.response.Response`
+    :param dict data: the first page of alerts
+    :param fetcher: callable used to retrieve the next page
+    :param Datetime start: (optional) drop alerts raised before this time
+    :param Datetime end: (optional) drop alerts raised at or after this time"""
+
+    def __init__(self, response, data, fetcher, start=None, end=None):
+        self.response = response
+        self.fetcher = fetcher
+        self.start = start
+        self.end = end
+        self._raw_data = data
+        self.data = make_alert_generator(data['data'], start, end)
+
+    def _fetch_next(self):
+        try:
+            cursor_obj = self._raw_data['next_page']['next_query']
+            new_data = self.fetcher(cursor_obj)
+            self._raw_data = new_data
+            self.data = make_alert_generator(new_data['data'], self.start,
+                                             self.end)
+        except KeyError:
+            raise StopIteration
+
+
+def _nan_values(values):
+    nan = float('nan')
+    return dict((device, dict.fromkeys(sensors, nan))
+                for device, sensors in values.iteritems())
+
+
+def merge_cursors(*cursors, **kwargs):
+    """Join several read cursors on timestamp.  The cursors are walked in
+    step with a k-way heap merge, so rows are yielded in time order while
+    each cursor only holds the page it is currently on.  Every cursor must
+    yield its rows in time order, as read cursors do.
+
+    For each distinct timestamp a :class:`MergedRow` is yielded, whose
+    values attribute is a list holding the values dict of each cursor's row
+    at that timestamp, in the order the cursors were given.  The fill
+    keyword decides what a cursor without a row at that timestamp gets:
+
+        * None (the default): an empty dict
+        * "previous": the values of its most recent row
+        * "nan": the keys of its most recent row, with every value NaN
+
+    :param cursors: the cursors (or any iterables of
+                    :class:`~tempoiq.protocol.row.Row`) to merge
+    :param string fill: (optional) how to fill missing rows
+    :rtype: generator"""
+
+    fill = kwargs.pop('fill', None)
+    if kwargs:
+        raise TypeError('Unexpected keyword arguments: %s' %
+                        ', '.join(kwargs))
+    if fill not in FILLS:
+        raise ValueError('Invalid fill: "%s", expected None, "previous" or '
+                         '"nan"' % fill)
+
+    iterators = [iter(c) for c in cursors]
+    heap = []
+    for index, it in enumerate(iterators):
+        for row in it:
+            heap.append((row.timestamp, index, row))
+            break
+    heapq.heapify(heap)
+    last = [{} for c in cursors]
+
+    while heap:
+        timestamp = heap[0][0]
+        current = [None] * len(iterators)
+        while heap and heap[0][0] == timestamp:
+            t, index, row = heapq.heappop(heap)
+            current[index] = row.values
+            for row in iterators[index]:
+                heapq.heappush(heap, (row.timestamp, index, row))
+                break
+        values = []
+        for index, row_values in enumerate(current):
+            if row_values is not None:
+                last[index] = row_values
+            elif fill == 'previous':
+                row_values = last[index]
+            elif fill == 'nan':
+                row_values = _nan_values(last[index])
+            else:
+                row_values = {}
+            values.append(row_values)
+        yield MergedRow(timestamp, values)
+
 
 class Page(object):
     def __init__(self, data, cursor_obj, collectible=True):
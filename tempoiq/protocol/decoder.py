@@ -1,10 +1,11 @@
 import operator
 from rule import Rule, Condition, Trigger, Filter, Webhook, Email
-from rule import ActionLog, Instigator, Transition, Alert
+from rule import ActionLog, Instigator, Transition, LazyTransition, Alert
 from device import Device
 from sensor import Sensor
 from point import Point
 from log import RuleLog, RuleUsage, RuleUsageMetric
+from status import WriteFailure
 from query.selection import Selection, ScalarSelector, AndClause, OrClause
 from tempoiq.temporal.validate import convert_iso_stamp
 
@@ -128,6 +129,10 @@ class TempoIQDecoder(object):
             decoded_transitions.append(transition_obj)
         return Alert(alert['alert_id'], alert['rule_key'], decoded_transitions)
 
+    def decode_lazy_alert(self, alert):
+        transitions = [LazyTransition(t, self) for t in alert['transitions']]
+        return Alert(alert['alert_id'], alert['rule_key'], transitions)
+
     def decode_alert_list(self, alert):
         if alert.get('data') is None:
             return alert
@@ -148,6 +153,29 @@ class TempoIQDecoder(object):
         point = Point(convert_iso_stamp(dp_dct['t']), dp_dct['v'])
         return Instigator(point, device, sensor)
 
+    def decode_multi_status(self, dct):
+        """Decode the body of a multi-status (207) write response, which
+        maps each device key to its outcome.  A failed device may narrow
+        the failure down to some of its sensors, and a failed sensor to the
+        indices of some of its points."""
+        failures = []
+        for device, status in dct.iteritems():
+            if status.get('success', False):
+                continue
+            sensor_failures = []
+            for sensor, sensor_status in status.get('sensors', {}).iteritems():
+                if sensor_status.get('success', False):
+                    continue
+                sensor_failures.append(WriteFailure(
+                    device, sensor, sensor_status.get('points'),
+                    sensor_status.get('message', status.get('message'))))
+            if sensor_failures:
+                failures.extend(sensor_failures)
+            else:
+                failures.append(WriteFailure(device,
+                                             message=status.get('message')))
+        return failures
+
     def decode_rule(self, rule):
         name = rule['rule']['name']
         alert_by = rule['alerts']
@@ -204,3 +232,6 @@ class TempoIQDecoder(object):
 
     def decode_selection(self, dct):
         pass
+
+    def decode_timestamp(self, t):
+        return convert_iso_stamp(t)
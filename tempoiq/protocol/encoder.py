@@ -1,5 +1,7 @@
 import json
+import hashlib
 from query.selection import AndClause, Compound, OrClause, ScalarSelector
+from query.selection import normalize
 
 
 class TempoIQEncoder(json.JSONEncoder):
@@ -241,3 +243,29 @@ class ReadEncoder(TempoIQEncoder):
             else:
                 return self.default(selection.selection)
         return self.encode_scalar_selector(selection.selection)
+
+
+class CanonicalReadEncoder(ReadEncoder):
+    """A :class:`ReadEncoder` that always produces the same JSON for
+    semantically identical queries, no matter how their filters were
+    chained: selections are normalized with
+    :func:`~tempoiq.protocol.query.selection.normalize` and object keys are
+    sorted."""
+
+    def encode(self, o):
+        return json.dumps(o, default=self.default, sort_keys=True,
+                          separators=(',', ':'))
+
+    def encode_selection(self, selection):
+        if selection.selection is None:
+            return {}
+        canonical = normalize(selection.selection)
+        if isinstance(canonical, Compound):
+            if len(canonical.selectors) == 0:
+                return {}
+            return self.default(canonical)
+        return self.encode_scalar_selector(canonical)
+
+    def hash(self, o):
+        """A stable hash of the canonical encoding of a query."""
+        return hashlib.sha1(self.encode(o)).hexdigest()
@@ -0,0 +1,184 @@
+import csv
+import gzip
+
+
+FORMATS = ('csv', 'arrow', 'parquet')
+COLUMNS = ['t', 'device', 'sensor', 'value']
+DEFAULT_ROW_GROUP_SIZE = 65536
+PYARROWMSG = 'Exporting to %s requires the pyarrow package'
+
+
+def flatten_page(page):
+    """Utility function for flattening one page of raw read JSON into
+    (timestamp, device key, sensor key, value) tuples without building
+    :class:`~tempoiq.protocol.row.Row` objects.  Timestamps are left as the
+    ISO8601 strings sent by the API.
+
+    :param list page: the 'data' list of a read response
+    :rtype: generator"""
+
+    for row in page:
+        t = row['t']
+        for device, sensors in row['data'].iteritems():
+            for sensor, value in sensors.iteritems():
+                yield (t, device, sensor, value)
+
+
+def _utf8(value):
+    #the csv module only writes byte strings
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _import_pyarrow(format):
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise ImportError(PYARROWMSG % format)
+
+
+def _row_groups(pages, row_group_size):
+    """Regroup the flattened values of a sequence of pages into columns of
+    at most row_group_size values each."""
+
+    columns = [[], [], [], []]
+    for page in pages:
+        for values in flatten_page(page):
+            for column, value in zip(columns, values):
+                column.append(value)
+            if len(columns[0]) >= row_group_size:
+                yield columns
+                columns = [[], [], [], []]
+    if columns[0]:
+        yield columns
+
+
+def export_csv(pages, sink, compression=None):
+    if compression == 'gzip':
+        sink = gzip.GzipFile(fileobj=sink, mode='wb')
+    elif compression is not None:
+        raise ValueError('Unsupported CSV compression: "%s"' % compression)
+
+    writer = csv.writer(sink)
+    writer.writerow(COLUMNS)
+    count = 0
+    for page in pages:
+        values = [[_utf8(v) for v in record] for record in flatten_page(page)]
+        writer.writerows(values)
+        count += len(values)
+    if compression is not None:
+        sink.close()
+    return count
+
+
+def _schema(pa):
+    #fixed, rather than inferred from the first batch, so that a page of
+    #integer values can follow a page of floats
+    return pa.schema([('t', pa.string()), ('device', pa.string()),
+                      ('sensor', pa.string()), ('value', pa.float64())])
+
+
+def _record_batch(pa, schema, columns):
+    arrays = [pa.array(c, type=field.type) for c, field in zip(columns,
+                                                                schema)]
+    return pa.RecordBatch.from_arrays(arrays, COLUMNS)
+
+
+class _Unclosed(object):
+    #lets pyarrow close a stream it wraps sink in without closing sink
+    def __init__(self, sink):
+        self.sink = sink
+        self.closed = False
+
+    def write(self, data):
+        return self.sink.write(data)
+
+    def flush(self):
+        if hasattr(self.sink, 'flush'):
+            self.sink.flush()
+
+    def close(self):
+        self.flush()
+        self.closed = True
+
+
+def _compressed_stream(pa, sink, compression):
+    try:
+        return pa.CompressedOutputStream(
+            pa.PythonFile(_Unclosed(sink), mode='w'), compression)
+    except (ValueError, NotImplementedError):
+        raise ValueError('Unsupported Arrow compression: "%s"' % compression)
+
+
+def export_arrow(pages, sink, row_group_size, compression=None):
+    pa = _import_pyarrow('arrow')
+    schema = _schema(pa)
+    if compression is not None:
+        #the whole stream is compressed, as IPC buffer compression needs a
+        #newer pyarrow than the last one for Python 2
+        sink = _compressed_stream(pa, sink, compression)
+    writer = None
+    count = 0
+    for columns in _row_groups(pages, row_group_size):
+        batch = _record_batch(pa, schema, columns)
+        if writer is None:
+            writer = pa.RecordBatchStreamWriter(sink, schema)
+        writer.write_batch(batch)
+        count += len(columns[0])
+    if writer is not None:
+        writer.close()
+    if compression is not None:
+        sink.close()
+    return count
+
+
+def export_parquet(pages, sink, row_group_size, compression=None):
+    pa = _import_pyarrow('parquet')
+    import pyarrow.parquet as pq
+    schema = _schema(pa)
+    writer = None
+    count = 0
+    for columns in _row_groups(pages, row_group_size):
+        table = pa.Table.from_batches([_record_batch(pa, schema, columns)])
+        if writer is None:
+            writer = pq.ParquetWriter(sink, schema,
+                                      compression=compression or 'snappy')
+        writer.write_table(table)
+        count += len(columns[0])
+    if writer is not None:
+        writer.close()
+    return count
+
+
+def export_pages(pages, sink, format='csv',
+                 row_group_size=DEFAULT_ROW_GROUP_SIZE, compression=None):
+    """Write pages of raw read JSON to sink as they arrive, in long form
+    with one record per value and the columns t, device, sensor and value.
+    In Arrow and Parquet, t (the ISO8601 timestamp), device and sensor are
+    strings and value is a 64-bit float.
+
+    CSV is written with the standard library; the optional compression is
+    "gzip".  Arrow (an IPC stream of record batches) and Parquet require
+    pyarrow.  A compressed Arrow stream is compressed as a whole (e.g.
+    "gzip", "lz4" or "zstd"), and is read back through
+    pyarrow.CompressedInputStream.  Parquet compression is passed through to
+    pyarrow and defaults to snappy.  Each Arrow record batch or Parquet row group holds at most
+    row_group_size values.
+
+    :param pages: iterable of the 'data' lists of read responses
+    :param sink: writable binary file object (or path, for Parquet)
+    :param string format: one of "csv", "arrow" or "parquet"
+    :param int row_group_size: maximum values per batch or row group
+    :param string compression: (optional) compression codec
+    :rtype: int, the number of values written"""
+
+    if format == 'csv':
+        return export_csv(pages, sink, compression)
+    elif format == 'arrow':
+        return export_arrow(pages, sink, row_group_size, compression)
+    elif format == 'parquet':
+        return export_parquet(pages, sink, row_group_size, compression)
+    raise ValueError('Invalid export format: "%s", expected one of %s' %
+                     (format, ', '.join(FORMATS)))
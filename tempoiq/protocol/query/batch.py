@@ -0,0 +1,184 @@
+import copy
+import json
+from selection import Selection, ScalarSelector, OrClause, normalize
+from functions import APIOperation
+from tempoiq.bulk import run_bulk, BulkResult, DEFAULT_WORKERS
+from tempoiq.bulk import DEFAULT_RETRIES
+from tempoiq.protocol.encoder import CanonicalReadEncoder
+from tempoiq.protocol.device import Device
+from tempoiq.protocol.row import Row
+from tempoiq.response import SubsetResponse, SUCCESS
+
+
+DEFAULT_MAX_KEYS = 500
+
+
+def selected_keys(query, selection_type):
+    """The keys a query's devices or sensors are restricted to, if that
+    selection consists only of key selectors (a single one or an OR of
+    them).
+
+    :param query: the :class:`~tempoiq.protocol.query.builder.QueryBuilder`
+    :param string selection_type: 'devices' or 'sensors'
+    :rtype: frozenset of keys, or None if the selection is anything else"""
+
+    selector = query.selection[selection_type].selection
+    if selector is None:
+        return None
+    selector = normalize(selector)
+    if isinstance(selector, OrClause):
+        selectors = selector.selectors
+    else:
+        selectors = [selector]
+    keys = set()
+    for s in selectors:
+        if not isinstance(s, ScalarSelector) or s.key != 'key' or \
+                s.selection_type != selection_type:
+            return None
+        keys.add(s.value)
+    return frozenset(keys)
+
+
+def device_keys(query):
+    """The device keys a query is restricted to (see
+    :func:`selected_keys`)."""
+
+    return selected_keys(query, 'devices')
+
+
+def merge_key(query, encoder=None):
+    """The canonical encoding of everything about a query except its device
+    selection.  Queries with the same merge key can be answered by one
+    request for the union of their devices.
+
+    :rtype: string"""
+
+    encoder = encoder or CanonicalReadEncoder()
+    j = encoder.default(query)
+    del j['search']['filters']['devices']
+    return json.dumps(j, sort_keys=True)
+
+
+def with_devices(query, keys):
+    """A copy of query restricted to the given device keys."""
+
+    merged = copy.copy(query)
+    merged.selection = dict(query.selection)
+    merged.selection['devices'] = Selection()
+    clause = OrClause()
+    clause.selection_type = 'devices'
+    for key in sorted(keys):
+        clause.add(Device.key == key)
+    merged.selection['devices'].add(clause)
+    return merged
+
+
+class SingleGroup(object):
+    """One request of a batched single call: the query to send and the
+    positions of the input queries it answers, each with the device keys it
+    asked for (None when the query is sent as it is).  Once the request of a
+    merged group succeeds, its rows are kept to be split between members."""
+
+    def __init__(self, query, members):
+        self.query = query
+        self.members = members
+        self.rows = None
+
+    @property
+    def merged(self):
+        return len(self.members) > 1
+
+
+def plan_singles(queries, max_keys=DEFAULT_MAX_KEYS):
+    """Group queries whose device selections are plain keys and which agree
+    on everything else into as few queries as possible, each asking for at
+    most max_keys devices.  Every other query is sent on its own.
+
+    :param list queries: queries with their single operation already set
+    :param int max_keys: most device keys in one merged query
+    :rtype: list of :class:`SingleGroup`"""
+
+    encoder = CanonicalReadEncoder()
+    planned = []
+    #merge key -> [index in planned, union of keys, members]
+    open_groups = {}
+    for index, query in enumerate(queries):
+        keys = device_keys(query)
+        if keys is None:
+            planned.append(SingleGroup(query, [(index, None)]))
+            continue
+        signature = merge_key(query, encoder)
+        pending = open_groups.get(signature)
+        if pending is None or len(pending[1] | keys) > max_keys:
+            pending = [len(planned), set(), []]
+            open_groups[signature] = pending
+            planned.append(None)
+        pending[1].update(keys)
+        pending[2].append((index, keys))
+        if len(pending[2]) == 1:
+            planned[pending[0]] = SingleGroup(query, [(index, None)])
+        else:
+            planned[pending[0]] = SingleGroup(
+                with_devices(query, pending[1]), pending[2])
+    return planned
+
+
+def split_rows(rows, keys):
+    """The part of the rows of a merged single call that belongs to the
+    given device keys.  Rows left without values are dropped.
+
+    :param list rows: :class:`~tempoiq.protocol.row.Row` objects
+    :param keys: device keys to keep
+    :rtype: list of :class:`~tempoiq.protocol.row.Row`"""
+
+    kept = []
+    for row in rows:
+        data = dict((device, values) for device, values
+                    in row.values.iteritems() if device in keys)
+        if data:
+            kept.append(Row({'t': row.raw_timestamp, 'data': data}))
+    return kept
+
+
+def single_operation(function, timestamp=None, include_selection=False):
+    args = {'include_selection': include_selection, 'function': function}
+    if timestamp is not None:
+        args['timestamp'] = timestamp
+    return APIOperation('single', args)
+
+
+def single_many(client, queries, function, timestamp=None,
+                include_selection=False, max_keys=DEFAULT_MAX_KEYS,
+                workers=DEFAULT_WORKERS, retries=DEFAULT_RETRIES):
+    """Run the same single-point call for many queries, merged as planned
+    by :func:`plan_singles`, on the client.  See
+    :meth:`tempoiq.client.Client.single_many`.
+
+    :rtype: :class:`tempoiq.bulk.BulkResult` keyed by position in queries"""
+
+    operation = single_operation(function, timestamp, include_selection)
+    #set the operation on copies, leaving the caller's queries as they were
+    queries = [copy.copy(query) for query in queries]
+    for query in queries:
+        query.operation = operation
+    groups = plan_singles(queries, max_keys)
+
+    def send(group):
+        response = client.single(group.query)
+        if group.merged and response.successful == SUCCESS:
+            group.rows = list(response.data)
+        return response
+
+    outcomes = run_bulk(send, groups, workers=workers, retries=retries)
+    result = BulkResult()
+    for group in groups:
+        outcome = outcomes.succeeded.get(group)
+        if outcome is None:
+            outcome = outcomes.failed[group]
+        for index, keys in group.members:
+            if keys is None or group.rows is None:
+                result.add(index, outcome)
+            else:
+                rows = split_rows(group.rows, keys)
+                result.add(index, SubsetResponse(outcome, rows))
+    return result
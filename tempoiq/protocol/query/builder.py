@@ -4,6 +4,10 @@ import functools
 from selection import Selection, ScalarSelector, OrClause, AndClause
 from selection import Compound, DictSelectable
 from functions import *
+from pipeline import LocalPipeline
+from sampling import SampledCursor, choose_period, SAMPLINGS
+from follow import Follower
+from template import PreparedQuery
 from tempoiq.protocol.rule import Rule
 from tempoiq.tempo_exceptions import TempoIQDeprecationWarning
 
@@ -15,6 +19,17 @@ DELETEMSG = 'Deleting data from sensors requires a start and end time'
 DELETEKEYMSG = 'Deleting data from a sensor requires a selection specifying one device key and one sensor key only'
 DELETEDEVICEMSG = 'Start and end are invalid arguments for deleting devices.  Are you sure you didn\'t mean session.query(Sensor).delete() instead?'
 LATESTMSG = 'The latest() method has been deprecated. Please use single("latest") instead.'
+LTTBMSG = 'LTTB sampling is only supported by the v2 read format'
+
+
+def call_options(timeout=None, deadline=None):
+    #only pass timeouts and deadlines on to the client when they are set
+    options = {}
+    if timeout is not None:
+        options['timeout'] = timeout
+    if deadline is not None:
+        options['deadline'] = deadline
+    return options
 
 
 def extract_key_for_monitoring(selection):
@@ -63,7 +78,9 @@ class QueryBuilder(object):
         return self.client.monitoring_client.get_rule(key)
 
     def _normalize_pipeline_functions(self, start, end):
-        for function in self.pipeline:
+        #copies, so that the query can be run again with another range
+        pipeline = [function.copy() for function in self.pipeline]
+        for function in pipeline:
             if isinstance(function, (Rollup, MultiRollup, Find)):
                 if start is None or end is None:
                     raise ValueError(ROLLUPMSG)
@@ -74,6 +91,14 @@ class QueryBuilder(object):
                     function.args[-2] = start
                 if function.args[-1] is None:
                     function.args[-1] = end
+        return pipeline
+
+    def _add_sampling_rollup(self, start, end, max_points, function):
+        for f in self.pipeline:
+            if isinstance(f, (Rollup, MultiRollup, Find)):
+                return
+        period = choose_period(start, end, max_points)
+        self.pipeline.append(Rollup(function, period))
 
     def _validate_datapoint_delete(self):
         if issubclass(self.selection['devices'].selection.__class__,
@@ -101,9 +126,16 @@ class QueryBuilder(object):
         return self.client.monitoring_client.get_alert(key, alert_id)
 
     @restrict_object_type('rules')
-    def alerts(self):
+    def alerts(self, start=None, end=None, limit=None):
+        """List the alerts of the selected rule, optionally bounded to the
+        alerts raised between start and end.
+
+        :param DateTime start: (optional) start of the time range
+        :param DateTime end: (optional) end of the time range
+        :param int limit: (optional) number of alerts fetched per page"""
         key = extract_key_for_monitoring(self.selection['rules'])
-        return self.client.monitoring_client.list_alerts(key)
+        return self.client.monitoring_client.list_alerts(key, start=start,
+                                                         end=end, limit=limit)
 
     @restrict_object_type('rules')
     def annotations(self):
@@ -115,6 +147,21 @@ class QueryBuilder(object):
         key = extract_key_for_monitoring(self.selection['rules'])
         return self.client.monitoring_client.get_changelog(key)
 
+    @restrict_object_type('sensors')
+    def compute(self, data, start, end):
+        """Run this query's pipeline locally over data that has already been
+        read, instead of asking the backend to compute it. See
+        :class:`~tempoiq.protocol.query.pipeline.LocalPipeline` for the
+        accepted data formats.
+
+        :param data: raw rows or streams read between start and end
+        :param DateTime start: start of the time range the data covers
+        :param DateTime end: end of the time range the data covers
+        :rtype: dict mapping (device key, sensor key) to a list of
+                :class:`~tempoiq.protocol.point.Point`"""
+        pipeline = self._normalize_pipeline_functions(start, end)
+        return LocalPipeline(pipeline).run(data, start, end)
+
     def convert_timezone(self, tz):
         """Convert the result's data points to the specified time zone.
 
@@ -182,6 +229,24 @@ class QueryBuilder(object):
         key = extract_key_for_monitoring(self.selection['rules'])
         return self.client.monitoring_client.get_logs(key)
 
+    @restrict_object_type('sensors')
+    def follow(self, start, **kwargs):
+        """Follow this query as new data arrives, starting with the data
+        since start.  Returns a
+        :class:`~tempoiq.protocol.query.follow.Follower`, which can be
+        iterated to get every new point as a
+        :class:`~tempoiq.protocol.cursor.PointRecord`, or shared between
+        several subscribers. The keyword arguments are passed on to it.
+
+        :param DateTime start: the time to start following from
+        :rtype: :class:`~tempoiq.protocol.query.follow.Follower`"""
+        return Follower(self, start, **kwargs)
+
+    @restrict_object_type('sensors')
+    def tail(self, **kwargs):
+        """Like :meth:`follow`, but only for data from now on."""
+        return Follower(self, **kwargs)
+
     @restrict_object_type('sensors')
     def monitor(self, rule):
         if self.pipeline:
@@ -205,6 +270,19 @@ class QueryBuilder(object):
         }
         return self
 
+    @restrict_object_type('sensors')
+    def prepare(self):
+        """Compile this query for reading it many times with different
+        time ranges.  The query is encoded once, and each read of the
+        returned :class:`~tempoiq.protocol.query.template.PreparedQuery`
+        only fills in its start, end and limit::
+
+            prepared = client.query(Sensor).filter(...).rollup(...).prepare()
+            response = prepared.read(start, end)
+
+        :rtype: :class:`~tempoiq.protocol.query.template.PreparedQuery`"""
+        return PreparedQuery(self)
+
     def rollup(self, function, period, start=None):
         """Apply a rollup function to the query.
 
@@ -225,26 +303,76 @@ class QueryBuilder(object):
         :param end: required when reading sensor data. End of time range to
                     read.
         :type end: DateTime
+        :param project: optional when reading sensor data. List of
+                        (device key, sensor key) pairs whose values the
+                        returned rows should keep
+        :type project: list
+        :param max_points: optional when reading sensor data. Roughly how
+                           many points to return per stream, for plotting.
+                           See sampling
+        :type max_points: int
+        :param sampling: how max_points is met. With "rollup" (the default)
+                         a rollup is added to the pipeline, with the
+                         shortest round period that gives no more than
+                         max_points points, unless the pipeline already
+                         rolls the data up. With "lttb" the data is read
+                         as is and downsampled with
+                         :func:`~tempoiq.protocol.query.sampling.lttb` as
+                         the rows are iterated
+        :type sampling: String
+        :param sample_function: the rollup function used by "rollup"
+                                sampling. Default is mean
+        :type sample_function: String
+        :param timeout: optional. Seconds, or a (connect, read) tuple, for
+                        each request of the read
+        :param deadline: optional. A :class:`tempoiq.deadline.Deadline`
+                         covering every request of the read, including the
+                         pages fetched while iterating
         """
+        options = call_options(kwargs.get('timeout'), kwargs.get('deadline'))
         if self.object_type == 'sensors':
             start = kwargs['start']
             end = kwargs['end']
             limit = kwargs.get('limit')
-            args = {'start': start, 'stop': end}
-            if limit is not None:
-                args['limit'] = limit
-            #this is set here to be used by the encoder to correctly specify
-            #the last step of the operation in the JSON
-            self.operation = APIOperation('read', args)
-            self._normalize_pipeline_functions(start, end)
-            return self.client.read(self)
+            project = kwargs.get('project')
+            max_points = kwargs.get('max_points')
+            sampling = kwargs.get('sampling', 'rollup')
+            if sampling not in SAMPLINGS:
+                raise ValueError('Invalid sampling: "%s"' % sampling)
+            #the sampling rollup and the filled in starts are only for this
+            #read, the query's own pipeline is put back afterwards
+            pipeline = self.pipeline
+            self.pipeline = list(pipeline)
+            try:
+                if max_points is not None and sampling == 'rollup':
+                    self._add_sampling_rollup(
+                        start, end, max_points,
+                        kwargs.get('sample_function', 'mean'))
+                elif max_points is not None and \
+                        getattr(self.client, 'read_version', 'v2') != 'v2':
+                    raise ValueError(LTTBMSG)
+                args = {'start': start, 'stop': end}
+                if limit is not None:
+                    args['limit'] = limit
+                #this is set here to be used by the encoder to correctly
+                #specify the last step of the operation in the JSON
+                self.operation = APIOperation('read', args)
+                self.pipeline = self._normalize_pipeline_functions(start, end)
+                response = self.client.read(self, project=project, **options)
+            finally:
+                self.pipeline = pipeline
+            if max_points is not None and sampling == 'lttb' and \
+                    response.data is not None:
+                response.data = SampledCursor(response.data, start, end,
+                                              max_points)
+            return response
         elif self.object_type == 'devices':
             if self.pipeline:
                 self.pipeline = []
                 warnings.warn(DEVICEMSG, exceptions.FutureWarning)
             self.operation = APIOperation('find',
                                           {'quantifier': 'all'})
-            return self.client.search_devices(self)
+            return self.client.search_devices(self, **options)
         elif self.object_type == 'rules':
             return self._handle_monitor_read(**kwargs)
         else:
@@ -252,12 +380,15 @@ class QueryBuilder(object):
             raise TypeError(msg)
 
     @restrict_object_type('sensors')
-    def single(self, function, timestamp=None, include_selection=False):
+    def single(self, function, timestamp=None, include_selection=False,
+               timeout=None, deadline=None):
         """Make a single-point API call to the TempoIQ backend for this query.
 
         :param String function: Method for finding the point to return for
                     each sensor. Ex: earliest, latest, before, after
         :param DateTime timestamp: required for all functions except earliest
+        :param timeout: optional. Seconds, or a (connect, read) tuple
+        :param deadline: optional. A :class:`tempoiq.deadline.Deadline`
         """
         args = {'include_selection': include_selection,
                 'function': function}
@@ -265,7 +396,7 @@ class QueryBuilder(object):
             args['timestamp'] = timestamp
 
         self.operation = APIOperation('single', args)
-        return(self.client.single(self))
+        return(self.client.single(self, **call_options(timeout, deadline)))
 
     def latest(self, include_selection=False):
         """Deprecated. Use the
@@ -0,0 +1,177 @@
+import Queue
+import datetime
+import threading
+from tempoiq.bulk import is_retryable
+from tempoiq.response import ResponseException, SUCCESS
+from tempoiq.temporal.validate import localize_datetime, pytz
+
+
+DEFAULT_MIN_INTERVAL = 1.0
+DEFAULT_MAX_INTERVAL = 30.0
+FOLLOWMSG = 'Following reads is only supported by the v2 read format'
+_DONE = object()
+
+
+def utcnow():
+    return datetime.datetime.now(pytz.utc)
+
+
+class Follower(object):
+    """Follows a sensor query as new data arrives, by polling the backend
+    for everything after the newest point seen so far.  The last timestamp
+    of every (device, sensor) stream is tracked, so points are only ever
+    yielded once even when polls overlap.  Polls happen every min_interval
+    seconds while data keeps arriving; each poll that finds nothing doubles
+    the interval, up to max_interval.  Exceptions and 5xx responses are
+    treated like empty polls, any other failed read raises
+    :class:`tempoiq.response.ResponseException`.
+
+    A follower can be iterated directly, yielding
+    :class:`~tempoiq.protocol.cursor.PointRecord` tuples in the order they
+    are found, or shared: each call to :meth:`subscribe` returns a new
+    iterator over the same points, fed by a single background poll loop.
+
+    The query is prepared once (see
+    :meth:`~tempoiq.protocol.query.builder.QueryBuilder.prepare`), so each
+    poll only encodes its time range, and later changes to the query don't
+    affect the follower.
+
+    :param query: the :class:`~tempoiq.protocol.query.builder.QueryBuilder`
+                  to follow
+    :param Datetime start: (optional) replay data from this time on. Default
+                           is to only yield data from now on
+    :param float min_interval: shortest time between polls, in seconds
+    :param float max_interval: longest time between polls, in seconds
+    :param float lag: (optional) seconds of data to read again on every poll,
+                      to pick up points that arrive late
+    :param list project: (optional) (device key, sensor key) pairs to keep"""
+
+    def __init__(self, query, start=None, min_interval=DEFAULT_MIN_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL, lag=0, project=None):
+        if getattr(query.client, 'read_version', 'v2') != 'v2':
+            raise ValueError(FOLLOWMSG)
+        self.query = query
+        self.prepared = query.prepare()
+        self.watermark = localize_datetime(start) if start else utcnow()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.lag = datetime.timedelta(seconds=lag)
+        self.project = project
+        self.last_seen = {}
+        self.last_error = None
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.finished = False
+
+    def poll(self):
+        """Read once, returning the points that haven't been seen before.
+
+        :rtype: list of :class:`~tempoiq.protocol.cursor.PointRecord`"""
+
+        end = utcnow()
+        points = None
+        try:
+            response = self.prepared.read(self.watermark - self.lag, end,
+                                          project=self.project)
+            if response.successful == SUCCESS:
+                #every page is read before anything is marked as seen, so a
+                #page that fails leaves the next poll to read them all again
+                points = list(response.data.iter_points(named=True))
+        except Exception, e:
+            self.last_error = e
+            return self._backoff([])
+        if points is None:
+            if not is_retryable(response):
+                raise ResponseException(response)
+            self.last_error = response
+            return self._backoff([])
+
+        new = []
+        for point in points:
+            key = (point.device, point.sensor)
+            last = self.last_seen.get(key)
+            if last is not None and point.timestamp <= last:
+                continue
+            self.last_seen[key] = point.timestamp
+            self.watermark = max(self.watermark, point.timestamp)
+            new.append(point)
+        return self._backoff(new)
+
+    def _backoff(self, new):
+        if new:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        return new
+
+    def __iter__(self):
+        while not self.stopping.is_set():
+            for point in self.poll():
+                yield point
+            self.stopping.wait(self.interval)
+
+    def subscribe(self, maxsize=0):
+        """Return an iterator over the points found by a poll loop shared by
+        every subscriber, starting it if needed.  With maxsize set, a
+        subscriber that falls that many polls behind holds up the loop.
+        Once the loop has ended, e.g. after :meth:`close`, the iterator
+        returned is empty.
+
+        :param int maxsize: (optional) polls buffered for this subscriber
+        :rtype: generator"""
+
+        queue = Queue.Queue(maxsize=maxsize)
+        with self.lock:
+            self.subscribers.append(queue)
+            if self.finished:
+                queue.put(_DONE)
+            elif self.thread is None:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+        return self._drain(queue)
+
+    def _drain(self, queue):
+        try:
+            while True:
+                points = queue.get()
+                if points is _DONE:
+                    return
+                for point in points:
+                    yield point
+        finally:
+            with self.lock:
+                if queue in self.subscribers:
+                    self.subscribers.remove(queue)
+
+    def _run(self):
+        try:
+            for points in self._polls():
+                with self.lock:
+                    subscribers = list(self.subscribers)
+                for queue in subscribers:
+                    queue.put(points)
+        except Exception, e:
+            self.last_error = e
+        finally:
+            with self.lock:
+                self.finished = True
+                subscribers = list(self.subscribers)
+            for queue in subscribers:
+                queue.put(_DONE)
+
+    def _polls(self):
+        while not self.stopping.is_set():
+            points = self.poll()
+            if points:
+                yield points
+            self.stopping.wait(self.interval)
+
+    def close(self):
+        """Stop polling.  Direct iteration and subscribers end after the
+        poll in progress."""
+
+        self.stopping.set()
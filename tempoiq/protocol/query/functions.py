@@ -1,8 +1,16 @@
+import copy
+
+
 class Function(object):
     def __init__(self, name, args):
         self.name = name
         self.args = args
 
+    def copy(self):
+        function = copy.copy(self)
+        function.args = list(self.args)
+        return function
+
 
 class Aggregation(Function):
     def __init__(self, function):
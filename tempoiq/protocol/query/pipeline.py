@@ -0,0 +1,313 @@
+import re
+import math
+import datetime
+from collections import defaultdict
+from functions import Aggregation, ConvertTZ, Find, Interpolation
+from functions import MultiRollup, Rollup
+from tempoiq.protocol.point import Point
+from tempoiq.protocol.row import Row
+from tempoiq.temporal.validate import localize_datetime, pytz
+from tempoiq.temporal.validate import get_transitions, EPOCH
+
+
+PERIOD = re.compile(
+    r'^P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?'
+    r'(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?'
+    r'(?:(?P<seconds>\d+(?:\.\d+)?)S)?)?$')
+CALENDARMSG = 'Year and month periods can only be computed by the backend'
+
+
+def _mean(values):
+    return sum(values) / float(len(values))
+
+
+def _stddev(values):
+    mean = _mean(values)
+    return math.sqrt(_mean([(v - mean) ** 2 for v in values]))
+
+
+ROLLUP_FUNCTIONS = {
+    'count': len,
+    'sum': sum,
+    'mean': _mean,
+    'min': min,
+    'max': max,
+    'first': lambda values: values[0],
+    'last': lambda values: values[-1],
+    'range': lambda values: max(values) - min(values),
+    'stddev': _stddev,
+}
+
+FIND_FUNCTIONS = {
+    'min': lambda points: min(points, key=lambda p: p[1]),
+    'max': lambda points: max(points, key=lambda p: p[1]),
+    'first': lambda points: points[0],
+    'last': lambda points: points[-1],
+}
+
+
+def parse_period(period):
+    """Convert an ISO8601 duration such as "PT1H" or "P1DT12H" into a
+    timedelta.  Year and month periods have no fixed length and are
+    rejected.
+
+    :param period: the period to convert
+    :type period: string or timedelta
+    :raises ValueError: if the period is malformed or calendar based
+    :rtype: timedelta"""
+
+    if isinstance(period, datetime.timedelta):
+        return period
+    match = PERIOD.match(period)
+    if match is None:
+        if re.match(r'^P(\d+Y|\d+M)', period):
+            raise ValueError(CALENDARMSG)
+        raise ValueError('Invalid period: "%s"' % period)
+    parts = dict((k, float(v)) for k, v in match.groupdict().items()
+                 if v is not None)
+    delta = datetime.timedelta(**parts)
+    if delta <= datetime.timedelta(0):
+        raise ValueError('Invalid period: "%s"' % period)
+    return delta
+
+
+def to_micros(dt):
+    """Microseconds since the epoch of a Datetime object.  Naive datetimes
+    are assumed to be in UTC."""
+
+    offset = dt.utcoffset()
+    if offset is not None:
+        dt = dt.replace(tzinfo=None) - offset
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def from_micros(micros):
+    dt = EPOCH + datetime.timedelta(microseconds=micros)
+    return dt.replace(tzinfo=pytz.utc)
+
+
+def _period_micros(period):
+    delta = parse_period(period)
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _bucket(points, start, period, table=None):
+    """Split a time ordered list of (micros, member) tuples into consecutive
+    periods aligned on start, yielding (period start, members) for every
+    period that contains data.  With a
+    :class:`~tempoiq.temporal.validate.TransitionTable` the periods follow
+    the time zone's wall clock, so that e.g. daily periods start at local
+    midnight on both sides of a daylight saving change."""
+
+    if table is not None:
+        local = ((table.local_micros(micros), member)
+                 for micros, member in points)
+        for t, members in _bucket(local, table.local_micros(start), period):
+            yield table.utc_micros(t), members
+        return
+    current = None
+    members = []
+    for micros, member in points:
+        idx = (micros - start) // period
+        if idx != current:
+            if members:
+                yield start + current * period, members
+            current = idx
+            members = []
+        members.append(member)
+    if members:
+        yield start + current * period, members
+
+
+class LocalPipeline(object):
+    """Evaluates a :class:`~tempoiq.protocol.query.builder.QueryBuilder`
+    pipeline against data that is already in memory, so that different
+    rollups and interpolations can be derived from one raw read without
+    going back to the backend.
+
+    Input data is either an iterable of
+    :class:`~tempoiq.protocol.row.Row` objects (e.g. a read response's
+    cursor) or a dict mapping (device key, sensor key) to a list of
+    :class:`~tempoiq.protocol.point.Point` objects or (timestamp, value)
+    tuples.  The result has the latter form, with
+    :class:`~tempoiq.protocol.point.Point` values in time order.
+
+    Rollups are aligned on their start argument (or the read start) and
+    stamped with the start of each period; periods without data are
+    omitted.  Rollups and finds after a timezone conversion follow that
+    time zone's wall clock.  Interpolations produce a point every period from start until
+    end.  An aggregation collapses every stream into a single stream keyed
+    by ("aggregation", function).  Multi-rollups produce a dict mapping each
+    function to its value.
+
+    :param list pipeline: the :class:`~tempoiq.protocol.query.functions.Function`
+                          objects to apply, in order"""
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    def run(self, data, start, end):
+        """Apply the pipeline to data read between start and end.
+
+        :param data: the raw data
+        :param DateTime start: start of the read
+        :param DateTime end: end of the read
+        :rtype: dict"""
+
+        streams = self._columnize(data)
+        start = to_micros(start)
+        end = to_micros(end)
+        table = None
+        for function in self.pipeline:
+            #timestamps stay in UTC until the end, but the functions after
+            #a timezone conversion bucket by its wall clock, like the backend
+            if isinstance(function, ConvertTZ):
+                table = get_transitions(function.args[0])
+            else:
+                streams = self._apply(function, streams, start, end, table)
+
+        result = {}
+        for key, points in streams.iteritems():
+            if table is None:
+                result[key] = [Point(from_micros(t), v) for t, v in points]
+            else:
+                convert = table.from_micros
+                result[key] = [Point(convert(t), v) for t, v in points]
+        return result
+
+    def _columnize(self, data):
+        streams = defaultdict(list)
+        if isinstance(data, dict):
+            for key, points in data.iteritems():
+                for p in points:
+                    if isinstance(p, Point):
+                        streams[key].append((to_micros(p.timestamp),
+                                             p.value))
+                    else:
+                        streams[key].append((to_micros(p[0]), p[1]))
+        else:
+            for row in data:
+                micros = to_micros(row.timestamp)
+                for key, value in row:
+                    streams[key].append((micros, value))
+        for points in streams.itervalues():
+            points.sort(key=lambda p: p[0])
+        return streams
+
+    def _apply(self, function, streams, start, end, table=None):
+        if isinstance(function, Rollup):
+            return self._rollup(function, streams, start, table)
+        elif isinstance(function, MultiRollup):
+            return self._multi_rollup(function, streams, start, table)
+        elif isinstance(function, Find):
+            return self._find(function, streams, start, table)
+        elif isinstance(function, Interpolation):
+            return self._interpolate(function, streams, start, end)
+        elif isinstance(function, Aggregation):
+            return self._aggregate(function, streams)
+        raise ValueError('Unsupported pipeline function: "%s"' %
+                         function.name)
+
+    def _align(self, function_start, start):
+        if function_start is None:
+            return start
+        return to_micros(function_start)
+
+    def _lookup(self, table, name):
+        try:
+            return table[name]
+        except KeyError:
+            raise ValueError('Unsupported function: "%s"' % name)
+
+    def _rollup(self, function, streams, start, table=None):
+        name, period, rollup_start = function.args
+        fold = self._lookup(ROLLUP_FUNCTIONS, name)
+        period = _period_micros(period)
+        start = self._align(rollup_start, start)
+        result = {}
+        for key, points in streams.iteritems():
+            result[key] = [(t, fold(members)) for t, members in
+                           _bucket(points, start, period, table)]
+        return result
+
+    def _multi_rollup(self, function, streams, start, table=None):
+        names, period, rollup_start = function.args
+        folds = [(n, self._lookup(ROLLUP_FUNCTIONS, n)) for n in names]
+        period = _period_micros(period)
+        start = self._align(rollup_start, start)
+        result = {}
+        for key, points in streams.iteritems():
+            result[key] = [(t, dict((n, fold(members)) for n, fold in folds))
+                           for t, members in
+                           _bucket(points, start, period, table)]
+        return result
+
+    def _find(self, function, streams, start, table=None):
+        name, period, find_start = function.args
+        pick = self._lookup(FIND_FUNCTIONS, name)
+        period = _period_micros(period)
+        start = self._align(find_start, start)
+        result = {}
+        for key, points in streams.iteritems():
+            indexed = ((p[0], p) for p in points)
+            result[key] = [pick(members) for t, members in
+                           _bucket(indexed, start, period, table)]
+        return result
+
+    def _interpolate(self, function, streams, start, end):
+        name, period, interp_start, interp_end = function.args
+        if name not in ('zoh', 'linear'):
+            raise ValueError('Unsupported function: "%s"' % name)
+        period = _period_micros(period)
+        start = self._align(interp_start, start)
+        end = self._align(interp_end, end)
+        result = {}
+        for key, points in streams.iteritems():
+            interpolated = []
+            i = 0
+            n = len(points)
+            t = start
+            while t < end:
+                while i < n and points[i][0] <= t:
+                    i += 1
+                #points[i - 1] is the last point at or before t
+                if i > 0:
+                    before_t, before_v = points[i - 1]
+                    if before_t == t or name == 'zoh':
+                        interpolated.append((t, before_v))
+                    elif i < n:
+                        after_t, after_v = points[i]
+                        ratio = (t - before_t) / float(after_t - before_t)
+                        interpolated.append(
+                            (t, before_v + (after_v - before_v) * ratio))
+                t += period
+            result[key] = interpolated
+        return result
+
+    def _aggregate(self, function, streams):
+        name = function.args[0]
+        fold = self._lookup(ROLLUP_FUNCTIONS, name)
+        by_time = defaultdict(list)
+        for points in streams.itervalues():
+            for t, v in points:
+                by_time[t].append(v)
+        aggregated = [(t, fold(by_time[t])) for t in sorted(by_time)]
+        return {('aggregation', name): aggregated}
+
+
+def to_rows(streams):
+    """Combine the streams produced by :meth:`LocalPipeline.run` back into
+    time ordered :class:`~tempoiq.protocol.row.Row` objects, in the same
+    shape that a read returns.
+
+    :param dict streams: mapping of (device key, sensor key) to points
+    :rtype: list of :class:`~tempoiq.protocol.row.Row`"""
+
+    by_time = {}
+    for (device, sensor), points in streams.iteritems():
+        for p in points:
+            values = by_time.setdefault(p.timestamp, {})
+            values.setdefault(device, {})[sensor] = p.value
+    return [Row({'t': t.isoformat(), 'data': by_time[t]})
+            for t in sorted(by_time)]
@@ -0,0 +1,185 @@
+import math
+from pipeline import to_micros
+from tempoiq.protocol.row import Row
+from tempoiq.temporal.validate import localize_datetime
+
+
+SAMPLINGS = ('rollup', 'lttb')
+SAMPLINGMSG = 'Sampled reads need max_points to be at least 3'
+#rollup periods, in seconds, that sampled reads choose from
+NICE_PERIODS = [1, 2, 5, 10, 15, 30,
+                60, 2 * 60, 5 * 60, 10 * 60, 15 * 60, 30 * 60,
+                3600, 2 * 3600, 3 * 3600, 6 * 3600, 12 * 3600,
+                86400, 7 * 86400]
+
+
+def format_period(seconds):
+    """Format a number of seconds as an ISO8601 period."""
+
+    if seconds % 604800 == 0:
+        return 'P%dW' % (seconds // 604800)
+    if seconds % 86400 == 0:
+        return 'P%dD' % (seconds // 86400)
+    if seconds % 3600 == 0:
+        return 'PT%dH' % (seconds // 3600)
+    if seconds % 60 == 0:
+        return 'PT%dM' % (seconds // 60)
+    return 'PT%dS' % seconds
+
+
+def choose_period(start, end, max_points):
+    """Pick the shortest round rollup period that splits the time between
+    start and end into no more than max_points periods.
+
+    :param Datetime start: start of the read
+    :param Datetime end: end of the read
+    :param int max_points: largest number of points wanted per stream
+    :rtype: string, an ISO8601 period"""
+
+    if max_points < 1:
+        raise ValueError(SAMPLINGMSG)
+    span = (to_micros(end) - to_micros(start)) / 1e6
+    needed = int(math.ceil(span / max_points)) or 1
+    for period in NICE_PERIODS:
+        if period >= needed:
+            return format_period(period)
+    weeks = int(math.ceil(needed / 604800.0))
+    return format_period(weeks * 604800)
+
+
+def _area(a, b, c):
+    return abs((a[0] - c[0]) * (b[1] - a[1]) -
+               (a[0] - b[0]) * (c[1] - a[1]))
+
+
+def _mean(bucket):
+    n = float(len(bucket))
+    return (sum(p[0] for p in bucket) / n, sum(p[1] for p in bucket) / n)
+
+
+class _StreamSampler(object):
+    #LTTB state for a single (device, sensor) stream: the last point chosen
+    #and the points of the buckets that haven't been decided yet.  The first
+    #and last points are always kept, but only come out when their bucket
+    #is decided, so that points come out in time order across streams
+
+    def __init__(self):
+        self.previous = None
+        self.last = None
+        self.first = None
+        self.buckets = {}
+
+    def add(self, bucket, point):
+        self.last = point
+        if self.previous is None:
+            self.previous = point
+            self.first = (bucket, point)
+        else:
+            self.buckets.setdefault(bucket, []).append(point)
+
+    def decide(self, bucket):
+        chosen = []
+        if self.first is not None and self.first[0] <= bucket:
+            chosen.append(self.first[1])
+            self.first = None
+        points = self.buckets.pop(bucket, None)
+        if points:
+            following = self.buckets.get(bucket + 1)
+            if following:
+                target = _mean(following)
+            else:
+                target = points[-1]
+            best = max(points, key=lambda p: _area(self.previous, p, target))
+            self.previous = best
+            chosen.append(best)
+        if not self.buckets and self.first is None and \
+                self.last is not self.previous:
+            #nothing newer of this stream has been read, so its latest point
+            #is kept now, rather than after the later rows of other streams.
+            #If the stream goes on, this just keeps the point before the gap
+            self.previous = self.last
+            chosen.append(self.last)
+        return chosen
+
+    def finish(self):
+        chosen = []
+        if self.first is not None:
+            chosen.append(self.first[1])
+            self.first = None
+        for bucket in sorted(self.buckets):
+            chosen.extend(self.decide(bucket))
+        if self.last is not None and self.last is not self.previous:
+            chosen.append(self.last)
+        return chosen
+
+
+def lttb(rows, start, end, max_points):
+    """Downsample rows with the largest-triangle-three-buckets algorithm,
+    keeping about max_points points per (device, sensor) stream.  The time
+    between start and end is divided into max_points - 2 equal buckets and
+    one point is kept per stream and bucket, besides each stream's first
+    and last point.  Since the buckets are fixed in time, rows are handled
+    as they stream in and only two buckets of points are held per stream.
+    Non-numeric values are dropped.
+
+    :param rows: iterable of :class:`~tempoiq.protocol.row.Row` in time
+                 order
+    :param Datetime start: start of the read
+    :param Datetime end: end of the read
+    :param int max_points: number of points to keep per stream
+    :rtype: generator of :class:`~tempoiq.protocol.row.Row`"""
+
+    if max_points < 3:
+        raise ValueError(SAMPLINGMSG)
+    origin = to_micros(localize_datetime(start))
+    width = max(1.0, (to_micros(localize_datetime(end)) - origin) /
+                float(max_points - 2))
+    samplers = {}
+    current = None
+
+    def emit(points):
+        by_time = {}
+        for x, value, t, device, sensor in points:
+            data = by_time.setdefault((x, t), {})
+            data.setdefault(device, {})[sensor] = value
+        for (x, t), data in sorted(by_time.iteritems()):
+            yield Row({'t': t.isoformat(), 'data': data})
+
+    for row in rows:
+        x = to_micros(row.timestamp)
+        bucket = min(int((x - origin) // width), max_points - 3)
+        chosen = []
+        if current is not None and bucket > current:
+            #the bucket before the one just finished can now be decided
+            for sampler in samplers.itervalues():
+                for b in range(current - 1, bucket - 1):
+                    chosen.extend(sampler.decide(b))
+        current = bucket if current is None else max(current, bucket)
+        for (device, sensor), value in row:
+            if isinstance(value, bool) or \
+                    not isinstance(value, (int, long, float)):
+                continue
+            sampler = samplers.setdefault((device, sensor), _StreamSampler())
+            sampler.add(bucket, (x, value, row.timestamp, device, sensor))
+        for r in emit(chosen):
+            yield r
+
+    chosen = []
+    for sampler in samplers.itervalues():
+        chosen.extend(sampler.finish())
+    for r in emit(chosen):
+        yield r
+
+
+class SampledCursor(object):
+    """Wraps a read cursor, downsampling its rows with :func:`lttb` as they
+    are iterated."""
+
+    def __init__(self, cursor, start, end, max_points):
+        self.cursor = cursor
+        self.start = start
+        self.end = end
+        self.max_points = max_points
+
+    def __iter__(self):
+        return lttb(self.cursor, self.start, self.end, self.max_points)
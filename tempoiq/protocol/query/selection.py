@@ -1,3 +1,6 @@
+import json
+
+
 class Compound(object):
     def __init__(self):
         self.selectors = []
@@ -108,3 +111,46 @@ def or_(selectors):
         s.add(selector)
     s.selection_type = object_type
     return s
+
+
+def selector_sort_key(selector):
+    """A key that orders selectors deterministically, regardless of the
+    order in which they were added to a query."""
+    if isinstance(selector, Compound):
+        return (1, selector.__class__.__name__,
+                tuple(selector_sort_key(s) for s in selector.selectors))
+    return (0, selector.selection_type, selector.key,
+            json.dumps(selector.value, sort_keys=True))
+
+
+def normalize(selector):
+    """Returns the canonical form of a selector: nested clauses of the same
+    type are flattened into their parent, duplicate selectors are dropped,
+    the remaining selectors are sorted and single-element clauses are
+    replaced by their only element. The selector passed in is not modified.
+
+    :param selector:
+    :type selector: :class:`ScalarSelector`, :class:`AndClause` or
+                    :class:`OrClause`"""
+    if not isinstance(selector, Compound):
+        return selector
+
+    flattened = []
+    for s in selector.selectors:
+        s = normalize(s)
+        if s.__class__ is selector.__class__:
+            flattened.extend(s.selectors)
+        else:
+            flattened.append(s)
+
+    unique = {}
+    for s in flattened:
+        unique.setdefault(selector_sort_key(s), s)
+    if len(unique) == 1:
+        return unique.values()[0]
+
+    clause = selector.__class__()
+    clause.selection_type = selector.selection_type
+    for k in sorted(unique):
+        clause.add(unique[k])
+    return clause
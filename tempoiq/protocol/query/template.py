@@ -0,0 +1,134 @@
+import re
+import copy
+import json
+import datetime
+from functions import APIOperation, Rollup, MultiRollup, Find, Interpolation
+from tempoiq.protocol.encoder import CanonicalReadEncoder
+
+
+PREPAREMSG = 'Only sensor reads can be prepared'
+RANGEMSG = 'Prepared queries with a rollup, find or multi-rollup must be read with a start and end'
+#a slot is encoded as a string no query can contain, so that it can be found
+#in the encoded JSON
+SLOT_PATTERN = re.compile(r'"\\u0000(\w+)\\u0000"')
+
+
+class Slot(object):
+    """Stands in for a value of a query that is only known when it runs."""
+
+    def __init__(self, name):
+        self.name = name
+
+
+START = Slot('start')
+STOP = Slot('stop')
+LIMIT = Slot('limit')
+
+
+class TemplateEncoder(CanonicalReadEncoder):
+    """A :class:`~tempoiq.protocol.encoder.CanonicalReadEncoder` that also
+    encodes :class:`Slot` placeholders."""
+
+    def default(self, o):
+        if isinstance(o, Slot):
+            return u'\x00%s\x00' % o.name
+        return super(TemplateEncoder, self).default(o)
+
+
+def encode_value(value, encoder):
+    #the common case, without going through json.dumps
+    if isinstance(value, datetime.datetime):
+        return '"%s"' % encoder.encode_datetime(value)
+    return json.dumps(value, default=encoder.default)
+
+
+def compile_skeleton(query, with_limit, encoder):
+    """Encode a sensor read with slots for its start, end and (if
+    with_limit) limit, and for the starts of its pipeline functions that
+    default to them.
+
+    :rtype: list alternating between JSON text and slot names, starting and
+            ending with text"""
+
+    template = copy.copy(query)
+    template.pipeline = []
+    for function in query.pipeline:
+        function = copy.copy(function)
+        function.args = list(function.args)
+        if isinstance(function, (Rollup, MultiRollup, Find)):
+            if function.args[-1] is None:
+                function.args[-1] = START
+        elif isinstance(function, Interpolation):
+            if function.args[-2] is None:
+                function.args[-2] = START
+            if function.args[-1] is None:
+                function.args[-1] = STOP
+        template.pipeline.append(function)
+    args = {'start': START, 'stop': STOP}
+    if with_limit:
+        args['limit'] = LIMIT
+    template.operation = APIOperation('read', args)
+    return SLOT_PATTERN.split(encoder.encode(template))
+
+
+class PreparedQuery(object):
+    """A sensor read compiled once, for queries that are run over and over
+    with only their time range changing.  The query is encoded with
+    placeholders for its start, end and limit, and each call only encodes
+    those values and joins them with the rest of the JSON, instead of
+    encoding the whole query again.  The body sent is the same as the one
+    :meth:`~tempoiq.protocol.query.builder.QueryBuilder.read` would send.
+
+    Changes made to the query after it was prepared don't affect the
+    prepared query.  Use
+    :meth:`~tempoiq.protocol.query.builder.QueryBuilder.prepare` to make
+    one.
+
+    :param query: the sensor
+                  :class:`~tempoiq.protocol.query.builder.QueryBuilder`"""
+
+    encoder = TemplateEncoder()
+
+    def __init__(self, query):
+        if query.object_type != 'sensors':
+            raise TypeError(PREPAREMSG)
+        self.client = query.client
+        #both are compiled now, so later changes to the query don't leak in
+        self.skeletons = {
+            False: compile_skeleton(query, False, self.encoder),
+            True: compile_skeleton(query, True, self.encoder)
+        }
+        self.needs_range = any(isinstance(f, (Rollup, MultiRollup, Find))
+                               for f in query.pipeline)
+
+    def encode(self, start, end, limit=None):
+        """The JSON body of a read between start and end.
+
+        :param DateTime start: start of the time range to read
+        :param DateTime end: end of the time range to read
+        :param int limit: (optional) most points per page
+        :rtype: string"""
+
+        if self.needs_range and (start is None or end is None):
+            raise ValueError(RANGEMSG)
+        values = {'start': encode_value(start, self.encoder),
+                  'stop': encode_value(end, self.encoder)}
+        if limit is not None:
+            values['limit'] = encode_value(limit, self.encoder)
+        parts = list(self.skeletons[limit is not None])
+        for i in xrange(1, len(parts), 2):
+            parts[i] = values[parts[i]]
+        return ''.join(parts)
+
+    def read(self, start, end, limit=None, project=None, timeout=None,
+             deadline=None):
+        """Read sensor data between start and end.  See
+        :meth:`~tempoiq.protocol.query.builder.QueryBuilder.read` for the
+        other parameters.
+
+        :rtype: :class:`tempoiq.response.SensorPointsResponse` or
+                :class:`tempoiq.response.StreamResponse`"""
+
+        body = self.encode(start, end, limit)
+        return self.client.read_encoded(body, project=project,
+                                        timeout=timeout, deadline=deadline)
@@ -0,0 +1,226 @@
+import math
+from collections import deque
+from pipeline import to_micros, from_micros, _period_micros
+from tempoiq.protocol.row import Row
+from tempoiq.temporal.validate import localize_datetime
+
+
+WINDOW_FUNCTIONS = ('count', 'sum', 'mean', 'min', 'max', 'first', 'last',
+                    'range', 'stddev', 'rate')
+
+
+def _check_function(function):
+    if function not in WINDOW_FUNCTIONS:
+        raise ValueError('Invalid window function: "%s", expected one of %s'
+                         % (function, ', '.join(WINDOW_FUNCTIONS)))
+
+
+class WindowState(object):
+    """Running aggregates over the points of one stream in a window.  Every
+    function is updated in constant amortized time per point: the sum is a
+    running total, the mean and variance are updated with Welford's method
+    (which stays accurate as points are evicted), and a sliding window's
+    min and max are kept with monotonic deques.  When the window slides,
+    the points it holds are kept so they can be evicted again; a tumbling
+    window only keeps the aggregates.
+
+    :param bool sliding: whether points will be evicted"""
+
+    def __init__(self, sliding=False):
+        self.sliding = sliding
+        self.points = deque()
+        self.mins = deque()
+        self.maxes = deque()
+        self.sequence = 0
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        #sum of squared differences from the mean
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.first = None
+        self.last = None
+
+    def add(self, micros, value):
+        entry = (self.sequence, micros, value)
+        self.sequence += 1
+        self.count += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.first is None:
+            self.first = entry
+        self.last = entry
+        if not self.sliding:
+            #nothing is evicted, so the extremes are all there is to keep
+            if self.min is None or value < self.min[2]:
+                self.min = entry
+            if self.max is None or value > self.max[2]:
+                self.max = entry
+            return
+        self.points.append(entry)
+        while self.mins and self.mins[-1][2] >= value:
+            self.mins.pop()
+        self.mins.append(entry)
+        while self.maxes and self.maxes[-1][2] <= value:
+            self.maxes.pop()
+        self.maxes.append(entry)
+        self.min = self.mins[0]
+        self.max = self.maxes[0]
+
+    def evict(self, before):
+        """Drop the points at or before the given time, in microseconds."""
+
+        while self.points and self.points[0][1] <= before:
+            entry = self.points.popleft()
+            value = entry[2]
+            self.count -= 1
+            self.total -= value
+            if self.count:
+                delta = value - self.mean
+                self.mean -= delta / self.count
+                self.m2 -= delta * (value - self.mean)
+            if self.mins[0] is entry:
+                self.mins.popleft()
+            if self.maxes[0] is entry:
+                self.maxes.popleft()
+        if self.points:
+            self.first = self.points[0]
+            self.min = self.mins[0]
+            self.max = self.maxes[0]
+        else:
+            self.first = self.last = self.min = self.max = None
+            self.total = self.mean = self.m2 = 0.0
+
+    def value(self, function):
+        if self.count == 0:
+            return None
+        if function == 'count':
+            return self.count
+        if function == 'sum':
+            return self.total
+        if function == 'mean':
+            return self.mean
+        if function == 'min':
+            return self.min[2]
+        if function == 'max':
+            return self.max[2]
+        if function == 'first':
+            return self.first[2]
+        if function == 'last':
+            return self.last[2]
+        if function == 'range':
+            return self.max[2] - self.min[2]
+        if function == 'stddev':
+            return math.sqrt(max(0.0, self.m2 / self.count))
+        if function == 'rate':
+            elapsed = (self.last[1] - self.first[1]) / 1e6
+            if elapsed == 0:
+                return None
+            return (self.last[2] - self.first[2]) / elapsed
+        raise ValueError('Invalid window function: "%s"' % function)
+
+
+def _numeric_values(row):
+    for key, value in row:
+        if isinstance(value, bool) or \
+                not isinstance(value, (int, long, float)):
+            continue
+        yield key, value
+
+
+def _make_row(micros, values, function):
+    #None if no stream has a value, e.g. rates of windows with one point
+    data = {}
+    for (device, sensor), state in values:
+        value = state.value(function)
+        if value is not None:
+            data.setdefault(device, {})[sensor] = value
+    if not data:
+        return None
+    return Row({'t': from_micros(micros).isoformat(), 'data': data})
+
+
+def tumbling(rows, period, function='mean', start=None):
+    """Aggregate rows into consecutive, non-overlapping windows of a fixed
+    length, as they are iterated.  A row is yielded for every window that
+    contains data as soon as the first row past its end arrives, stamped
+    with the start of the window and holding the aggregate of each
+    (device, sensor) stream in it.  Only the running aggregates of the
+    current window are held in memory.
+
+    :param rows: iterable of :class:`~tempoiq.protocol.row.Row` in time
+                 order, such as a read cursor
+    :param period: the window length
+    :type period: ISO8601 string or timedelta
+    :param string function: one of count, sum, mean, min, max, first, last,
+                            range, stddev or rate (change per second)
+    :param Datetime start: (optional) a time to align windows on. Default
+                           is the Unix epoch
+    :rtype: generator of :class:`~tempoiq.protocol.row.Row`"""
+
+    _check_function(function)
+    width = _period_micros(period)
+    origin = 0 if start is None else to_micros(localize_datetime(start))
+    current = None
+    states = {}
+
+    for row in rows:
+        micros = to_micros(row.timestamp)
+        window = (micros - origin) // width
+        if window != current:
+            if states:
+                r = _make_row(origin + current * width, states.iteritems(),
+                              function)
+                if r is not None:
+                    yield r
+            current = window
+            states = {}
+        for key, value in _numeric_values(row):
+            state = states.get(key)
+            if state is None:
+                state = states[key] = WindowState()
+            state.add(micros, value)
+
+    if states:
+        r = _make_row(origin + current * width, states.iteritems(), function)
+        if r is not None:
+            yield r
+
+
+def sliding(rows, period, function='mean'):
+    """Aggregate rows over a window of a fixed length that trails each row,
+    as they are iterated.  For every row a row with the same timestamp is
+    yielded, holding the aggregate over the preceding period (excluding its
+    start, including the row itself) of each (device, sensor) stream in the
+    row.  Only the points inside the window are held in memory.
+
+    :param rows: iterable of :class:`~tempoiq.protocol.row.Row` in time
+                 order, such as a read cursor
+    :param period: the window length
+    :type period: ISO8601 string or timedelta
+    :param string function: one of count, sum, mean, min, max, first, last,
+                            range, stddev or rate (change per second)
+    :rtype: generator of :class:`~tempoiq.protocol.row.Row`"""
+
+    _check_function(function)
+    width = _period_micros(period)
+    states = {}
+
+    for row in rows:
+        micros = to_micros(row.timestamp)
+        updated = []
+        for key, value in _numeric_values(row):
+            state = states.get(key)
+            if state is None:
+                state = states[key] = WindowState(sliding=True)
+            state.add(micros, value)
+            updated.append(key)
+        for key in updated:
+            states[key].evict(micros - width)
+        r = _make_row(micros, [(key, states[key]) for key in updated],
+                      function)
+        if r is not None:
+            yield r
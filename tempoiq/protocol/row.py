@@ -16,6 +16,42 @@ class TooManyResultsError(Exception):
     pass
 
 
+def make_projection(project):
+    """Utility function for turning a list of (device key, sensor key) pairs
+    into the dict of device key to sets of sensor keys used by
+    :class:`Row` to drop unwanted values.
+
+    :param list project: the pairs to keep, or None to keep everything
+    :rtype: dict or None"""
+
+    if project is None:
+        return None
+    projection = {}
+    for device, sensor in project:
+        projection.setdefault(device, set()).add(sensor)
+    return projection
+
+
+def project_values(data, projection):
+    """Utility function for keeping only the values of a row's data dict
+    that are in a projection made by :func:`make_projection`.
+
+    :param dict data: the 'data' dict of a row
+    :param dict projection: the projection to apply
+    :rtype: dict"""
+
+    values = {}
+    for device, sensors in projection.iteritems():
+        device_data = data.get(device)
+        if device_data is None:
+            continue
+        kept = dict((sensor, device_data[sensor]) for sensor in sensors
+                    if sensor in device_data)
+        if kept:
+            values[device] = kept
+    return values
+
+
 class Row(object):
     """Data from one or more sensors at a single timestamp. Returned when
     reading sensor data.
@@ -25,12 +61,27 @@ class Row(object):
 
         {'test1': {'temperature': 500.0} }
 
+    The timestamp is only parsed the first time it is accessed, so code
+    that only looks at values never pays for it.  If a projection (see
+    :func:`make_projection`) is given, only the values of the sensors in it
+    are kept.
+
     :var timestamp: DateTime of the sensor data
     :var values: dict mapping device key to a dict of sensor keys to values
     """
-    def __init__(self, row_json):
-        self.timestamp = convert_iso_stamp(row_json['t'])
-        self.values = row_json['data']
+    def __init__(self, row_json, projection=None):
+        self.raw_timestamp = row_json['t']
+        self._timestamp = None
+        if projection is None:
+            self.values = row_json['data']
+        else:
+            self.values = project_values(row_json['data'], projection)
+
+    @property
+    def timestamp(self):
+        if self._timestamp is None:
+            self._timestamp = convert_iso_stamp(self.raw_timestamp)
+        return self._timestamp
 
     def __getitem__(self, key):
         return self.values[key]
@@ -77,6 +77,44 @@ class Transition(object):
         self.action_logs = action_logs
 
 
+class LazyTransition(Transition):
+    """A :class:`Transition` that keeps the raw transition JSON around and
+    only decodes the timestamp, instigator and action logs the first time
+    they are accessed.
+
+    :param dict transition_json: the raw transition from the API
+    :param decoder: a :class:`tempoiq.protocol.decoder.TempoIQDecoder`"""
+
+    def __init__(self, transition_json, decoder):
+        self._json = transition_json
+        self._decoder = decoder
+        self._timestamp = None
+        self._instigator = None
+        self._action_logs = None
+        self.to = transition_json['transition_to']
+
+    @property
+    def timestamp(self):
+        if self._timestamp is None:
+            self._timestamp = self._decoder.decode_timestamp(
+                self._json['timestamp'])
+        return self._timestamp
+
+    @property
+    def instigator(self):
+        if self._instigator is None:
+            self._instigator = self._decoder.decode_instigator(
+                self._json['instigator'])
+        return self._instigator
+
+    @property
+    def action_logs(self):
+        if self._action_logs is None:
+            self._action_logs = [self._decoder.decode_action_log(a) for a
+                                 in self._json['actions']]
+        return self._action_logs
+
+
 class Alert(object):
     def __init__(self, alert_id, rule_key, transitions):
         self.id = alert_id
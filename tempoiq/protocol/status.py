@@ -0,0 +1,56 @@
+class WriteFailure(object):
+    """Part of a write request that the backend reported as failed in a
+    multi-status (207) response.  Depending on how precisely the backend
+    reported the failure it covers a whole device, one sensor of a device
+    or a set of points of one sensor.
+
+    :param string device: key of the device
+    :param string sensor: (optional) key of the sensor. None if the whole
+                          device failed
+    :param list indices: (optional) positions of the failed points in the
+                         sensor's list of points. None if every point of
+                         the sensor failed
+    :param string message: (optional) the reason given by the backend
+    """
+
+    def __init__(self, device, sensor=None, indices=None, message=None):
+        self.device = device
+        self.sensor = sensor
+        self.indices = indices
+        self.message = message
+
+
+def select_failed_points(write_request, failures):
+    """Extract the points covered by a list of :class:`WriteFailure` from a
+    write request, keeping the order of the points of every sensor.
+
+    :param dict write_request: the request that was written
+    :param list failures: list of :class:`WriteFailure`
+    :rtype: dict in the same form as write_request"""
+
+    #device -> sensor -> set of point indices, or None for every point
+    selected = {}
+    for f in failures:
+        sensors = write_request.get(f.device)
+        if sensors is None:
+            continue
+        chosen = selected.setdefault(f.device, {})
+        names = sensors.keys() if f.sensor is None else [f.sensor]
+        for name in names:
+            if name not in sensors:
+                continue
+            if f.sensor is None or f.indices is None:
+                chosen[name] = None
+            elif chosen.get(name, ()) is not None:
+                chosen.setdefault(name, set()).update(f.indices)
+
+    failed = {}
+    for device, chosen in selected.iteritems():
+        for sensor, indices in chosen.iteritems():
+            points = write_request[device][sensor]
+            if indices is not None:
+                points = [points[i] for i in sorted(indices)
+                          if 0 <= i < len(points)]
+            if points:
+                failed.setdefault(device, {})[sensor] = list(points)
+    return failed
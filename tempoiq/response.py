@@ -1,7 +1,8 @@
 import json
 from protocol.cursor import DeviceCursor, StreamResponseCursor
-from protocol.cursor import DataPointsCursor
+from protocol.cursor import DataPointsCursor, AlertCursor
 from protocol.decoder import TempoIQDecoder
+from protocol.status import WriteFailure, select_failed_points
 
 SUCCESS = 0
 FAILURE = 1
@@ -39,11 +40,10 @@ class Response(object):
     **Note:** successful has 3 possible values defined as constants in this
     module, SUCCESS, FAILURE, and PARTIAL.  A PARTIAL value can occur during a
     multi-write if some datapoints fail to write.  The error attribute in that
-    case will be a JSON encoded string of errors for each datapoint.  The
-    response object does *not* derserialize that error (there could be other
-    circumstances where the error is not JSON encoded), so if that case, error
-    handling code surrounding multi-writes should decode the error attribute
-    with the json library if it wants to attempt error recovery.
+    case still holds the raw JSON body, but writes return a
+    :class:`WriteResponse`, which decodes it: its failures attribute is a
+    list of :class:`tempoiq.protocol.status.WriteFailure`, and its unwritten
+    attribute holds the points that weren't written, ready to be retried.
 
     :param obj resp: a response object from the requests library"""
 
@@ -68,6 +68,41 @@ class Response(object):
         self.data = None
 
 
+class WriteResponse(Response):
+    """Response to a write.  On a multi-status (207) response the error body
+    is decoded into the failures attribute, a list of
+    :class:`tempoiq.protocol.status.WriteFailure`.  If the body can't be
+    decoded, or the write failed outright, the whole request is treated as
+    failed.
+
+    The unwritten attribute holds the points of the request that were not
+    written, in the same form as the request itself (empty on success), or
+    None if the request wasn't given.
+
+    :param obj resp: a response object from the requests library
+    :param dict write_request: the request that was written, or None"""
+
+    def __init__(self, resp, session, write_request):
+        super(WriteResponse, self).__init__(resp, session)
+        self.write_request = write_request
+        self.failures = []
+        self.attempts = 1
+        if self.successful == PARTIAL:
+            self.failures = self.parse_failures(self.body)
+        elif self.successful == FAILURE:
+            self.failures = [WriteFailure(d) for d in write_request or ()]
+        self.unwritten = None
+        if write_request is not None:
+            self.unwritten = select_failed_points(write_request,
+                                                  self.failures)
+
+    def parse_failures(self, body):
+        try:
+            return TempoIQDecoder().decode_multi_status(json.loads(body))
+        except (ValueError, TypeError, AttributeError):
+            return [WriteFailure(d) for d in self.write_request or ()]
+
+
 class DeviceResponse(Response):
     def __init__(self, resp, session, fetcher):
         super(DeviceResponse, self).__init__(resp, session)
@@ -81,22 +116,77 @@ class DeviceResponse(Response):
 
 
 class SensorPointsResponse(Response):
-    def __init__(self, resp, session, fetcher):
+    def __init__(self, resp, session, fetcher, page=None, project=None):
         super(SensorPointsResponse, self).__init__(resp, session)
         self.fetcher = fetcher
+        self.project = project
         if self.successful == SUCCESS:
-            self.parse(self.body)
+            if page is not None:
+                self.data = DataPointsCursor(self, page, self.fetcher,
+                                             project)
+            else:
+                self.parse(self.body)
 
     def parse(self, body):
-        self.data = DataPointsCursor(self, json.loads(body), self.fetcher)
+        self.data = DataPointsCursor(self, json.loads(body), self.fetcher,
+                                     self.project)
+
+
+class SubsetResponse(Response):
+    """The share of one query in a single call that answered several
+    queries at once (see :meth:`tempoiq.client.Client.single_many`).  Its
+    status attributes are those of the shared response, and data is a list
+    of the :class:`~tempoiq.protocol.row.Row` objects for the query's own
+    devices.
+
+    :param response: the shared response
+    :param list rows: the rows belonging to this query"""
+
+    def __init__(self, response, rows):
+        self.resp = response.resp
+        self.session = response.session
+        self.status = response.status
+        self.status_code = response.status_code
+        self.reason = response.reason
+        self.successful = response.successful
+        self.error = response.error
+        self.body = response.body
+        self.data = rows
+
+
+class CachedResponse(Response):
+    """Response to a ``single('latest')`` call answered from the client's
+    :class:`tempoiq.latest.LatestCache` without a request.  It looks like a
+    successful response whose data is a single page
+    :class:`~tempoiq.protocol.cursor.DataPointsCursor`, so it can be
+    iterated, or read with iter_points and export, like any other.
+
+    :param list rows: the :class:`~tempoiq.protocol.row.Row` objects found
+                      in the cache"""
+
+    def __init__(self, rows, session):
+        self.resp = None
+        self.session = session
+        self.status = 200
+        self.status_code = 200
+        self.reason = 200
+        self.successful = SUCCESS
+        self.error = None
+        self.body = None
+        page = {'data': [{'t': row.raw_timestamp, 'data': row.values}
+                         for row in rows]}
+        self.data = DataPointsCursor(self, page, None)
 
 
 class StreamResponse(Response):
-    def __init__(self, resp, session, fetcher):
+    def __init__(self, resp, session, fetcher, page=None):
         super(StreamResponse, self).__init__(resp, session)
         self.fetcher = fetcher
         if self.successful == SUCCESS:
-            self.parse(self.body)
+            if page is not None:
+                self.data = StreamResponseCursor(self, page, self.fetcher)
+            else:
+                self.parse(self.body)
 
     def parse(self, body):
         self.data = StreamResponseCursor(self, json.loads(body), self.fetcher)
@@ -119,17 +209,22 @@ class MonitoringResponse(Response):
         self.data = json.loads(body, object_hook=decoder)
 
 
-class AlertListResponse(MonitoringResponse):
-    def __init__(self, resp, session):
-        super(AlertListResponse, self).__init__(resp, session,
-                                                'decode_alert_list')
+class AlertListResponse(Response):
+    """Response for listing the alerts of a monitoring rule.  The data
+    attribute is a :class:`tempoiq.protocol.cursor.AlertCursor` which pages
+    through the alerts as it is iterated."""
 
-    def parse(self, body):
-        decoder = TempoIQDecoder()
-        if self.decoder_method is not None:
-            decoder.decoder = getattr(decoder, self.decoder_method)
+    def __init__(self, resp, session, fetcher, start=None, end=None):
+        super(AlertListResponse, self).__init__(resp, session)
+        self.fetcher = fetcher
+        self.start = start
+        self.end = end
+        if self.successful == SUCCESS and self.body != '':
+            self.parse(self.body)
 
-        self.data = json.loads(body, object_hook=decoder)
+    def parse(self, body):
+        self.data = AlertCursor(self, json.loads(body), self.fetcher,
+                                self.start, self.end)
 
 
 class DeleteDatapointsResponse(Response):
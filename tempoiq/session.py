@@ -1,17 +1,23 @@
 from client import Client
-from endpoint import HTTPEndpoint
+from endpoint import HTTPEndpoint, FailoverEndpoint
 
 
-def get_session(host, key, secret, secure=True, port=None, read_version='v2'):
+def get_session(host, key, secret, secure=True, port=None, read_version='v2',
+                http2=False):
     """Get a :class:`tempoiq.client.Client` instance with the given session
     information.
 
     :param String host: Backend's base URL, in the form
                        "your-host.backend.tempoiq.com". For legacy reasons,
                        it is also possible to prepend the URL schema, but this
-                       will be deprecated in the future.
+                       will be deprecated in the future. A list of hosts
+                       gives a :class:`tempoiq.endpoint.FailoverEndpoint`
     :param String key: API key
     :param String secret: API secret
+    :param bool http2: whether to multiplex requests over HTTP/2 connections
     :rtype: :class:`tempoiq.client.Client`"""
-    endpoint = HTTPEndpoint(host, key, secret, secure, port)
+    if isinstance(host, (list, tuple)):
+        endpoint = FailoverEndpoint(host, key, secret, secure, port, http2)
+    else:
+        endpoint = HTTPEndpoint(host, key, secret, secure, port, http2)
     return Client(endpoint, read_version=read_version)
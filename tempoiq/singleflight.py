@@ -0,0 +1,52 @@
+import threading
+
+
+class Call(object):
+    """An in-flight call that other callers can wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Coalesces concurrent calls that share a key, so that only the first
+    caller does the work and every caller that arrives while it is in flight
+    gets the same result (or the same exception).  Calls made after the
+    first one has finished run again; nothing is cached."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        """Call fn, or wait for the in-flight call with the same key.
+
+        :param key: hashable identity of the call
+        :param fn: callable taking no arguments
+        :rtype: the return value of fn"""
+
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = Call()
+                self.calls[key] = call
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception, e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+        return call.result
@@ -1,11 +1,28 @@
 import re
-import dateutil.parser
-from pytz.gae import pytz
+import bisect
+import datetime
+from tempoiq.lazy import LazyModule
+
+
+#both are slow to import, and only needed once timestamps are parsed
+parser = LazyModule('dateutil.parser')
+pytz = LazyModule('pytz.gae', 'pytz')
 
 
 ISO = re.compile(
     r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}'
     '((.\d{3,6})?([+-](\d{4|\d{2}:\d{2}}))?)?')
+#the form timestamps come back from the API in, parsed without dateutil
+STAMP = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?'
+    r'(Z|[+-]\d{2}:?\d{2})?$')
+#naive, so that defining it doesn't need pytz
+EPOCH = datetime.datetime(1970, 1, 1)
+
+#time zones, UTC offsets and transition tables, by name
+_zones = {}
+_offsets = {}
+_tables = {}
 
 
 def check_time_param(t):
@@ -26,20 +43,194 @@ def check_time_param(t):
         return t.isoformat()
 
 
+def get_timezone(tz):
+    """Look up a time zone by name, only asking pytz the first time.
+
+    :param string tz: the time zone name, e.g. "America/Chicago"
+    :rtype: pytz time zone"""
+
+    zone = _zones.get(tz)
+    if zone is None:
+        zone = _zones[tz] = pytz.timezone(tz)
+    return zone
+
+
+def _offset(suffix):
+    #the tzinfo of a timestamp's UTC offset suffix, e.g. "Z" or "-05:00"
+    tzinfo = _offsets.get(suffix)
+    if tzinfo is None:
+        if suffix == 'Z':
+            minutes = 0
+        else:
+            digits = suffix[1:].replace(':', '')
+            minutes = int(digits[:2]) * 60 + int(digits[2:])
+            if suffix[0] == '-':
+                minutes = -minutes
+        tzinfo = _offsets[suffix] = pytz.FixedOffset(minutes)
+    return tzinfo
+
+
+def _to_micros(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class TransitionTable(object):
+    """The UTC offsets of a time zone and the instants they change, read
+    from pytz once so that many timestamps can be converted with a binary
+    search each instead of going through pytz's localize and astimezone.
+
+    :param zone: the pytz time zone"""
+
+    def __init__(self, zone):
+        self.zone = zone
+        times = getattr(zone, '_utc_transition_times', None)
+        if times:
+            #naive UTC datetimes, each the start of the matching tzinfo
+            self.starts = list(times)
+            self.tzinfos = [zone._tzinfos[info]
+                            for info in zone._transition_info]
+            self.offsets = [info[0] for info in zone._transition_info]
+        else:
+            #UTC and the zones that never change their offset
+            self.starts = [datetime.datetime.min]
+            self.tzinfos = [zone]
+            self.offsets = [zone.utcoffset(None)]
+        self.micros = [_to_micros(t - EPOCH) for t in self.starts]
+        self.offset_micros = [_to_micros(o) for o in self.offsets]
+
+    def localize(self, dt):
+        """Attach the time zone to a naive local Datetime, like pytz's
+        localize.
+
+        :rtype: Datetime object"""
+
+        starts = self.starts
+        i = bisect.bisect_right(starts, dt) - 1
+        found = None
+        #offsets are less than a day and transitions months apart, so only
+        #the periods next to the one dt would be in as UTC can hold it
+        for j in (i - 1, i, i + 1):
+            if j < 0 or j >= len(starts):
+                continue
+            utc = dt - self.offsets[j]
+            if utc >= starts[j] and (j + 1 == len(starts) or
+                                     utc < starts[j + 1]):
+                if found is not None:
+                    #ambiguous, e.g. when clocks are set back
+                    return self.zone.localize(dt)
+                found = j
+        if found is None:
+            #a local time skipped when clocks are set forward
+            return self.zone.localize(dt)
+        return dt.replace(tzinfo=self.tzinfos[found])
+
+    def local_micros(self, micros):
+        """The wall clock time in this time zone of an instant, both in
+        microseconds since the epoch.
+
+        :rtype: int"""
+
+        i = max(0, bisect.bisect_right(self.micros, micros) - 1)
+        return micros + self.offset_micros[i]
+
+    def utc_micros(self, local):
+        """The instant of a wall clock time in this time zone, the inverse
+        of :meth:`local_micros`.
+
+        :rtype: int"""
+
+        dt = self.localize(EPOCH + datetime.timedelta(microseconds=local))
+        return local - _to_micros(dt.utcoffset())
+
+    def from_micros(self, micros):
+        """The Datetime in this time zone of an instant in microseconds
+        since the epoch, like pytz's astimezone.
+
+        :rtype: Datetime object"""
+
+        i = max(0, bisect.bisect_right(self.micros, micros) - 1)
+        local = micros + self.offset_micros[i]
+        dt = EPOCH + datetime.timedelta(microseconds=local)
+        return dt.replace(tzinfo=self.tzinfos[i])
+
+
+def get_transitions(tz):
+    """The :class:`TransitionTable` of a time zone, built once per name.
+
+    :param string tz: the time zone name
+    :rtype: :class:`TransitionTable`"""
+
+    table = _tables.get(tz)
+    if table is None:
+        table = _tables[tz] = TransitionTable(get_timezone(tz))
+    return table
+
+
+def parse_iso_stamp(t):
+    """Parse an ISO8601 timestamp.  Timestamps in the form the API returns
+    them (e.g. "2015-01-01T00:00:00.000-06:00") are parsed directly, with
+    one shared tzinfo per UTC offset, and anything else is left to dateutil.
+
+    :param string t: the timestamp to parse
+    :rtype: Datetime object"""
+
+    match = STAMP.match(t)
+    if match is None:
+        return parser.parse(t)
+    year, month, day, hour, minute, second, fraction, suffix = match.groups()
+    micros = int(fraction.ljust(6, '0')) if fraction else 0
+    tzinfo = _offset(suffix) if suffix else None
+    return datetime.datetime(int(year), int(month), int(day), int(hour),
+                             int(minute), int(second), micros, tzinfo)
+
+
 def convert_iso_stamp(t, tz=None):
     """Convert a string in ISO8601 form into a Datetime object.  This is mainly
     used for converting timestamps sent from the TempoDB API, which are
     assumed to be correct.
 
     :param string t: the timestamp to convert
+    :param string tz: (optional) time zone of timestamps without a UTC
+                      offset
     :rtype: Datetime object"""
 
     if t is None:
         return None
 
-    dt = dateutil.parser.parse(t)
-    if tz is not None:
-        timezone = pytz.timezone(tz)
-        if dt.tzinfo is None:
-            dt = timezone.localize(dt)
+    dt = parse_iso_stamp(t)
+    if tz is not None and dt.tzinfo is None:
+        dt = get_transitions(tz).localize(dt)
     return dt
+
+
+def convert_iso_stamps(stamps, tz=None):
+    """Convert a whole page of timestamps at once, see
+    :func:`convert_iso_stamp`.  The time zone's transition table is only
+    looked up once for the page.
+
+    :param list stamps: the timestamps to convert
+    :param string tz: (optional) time zone of timestamps without a UTC
+                      offset
+    :rtype: list of Datetime objects"""
+
+    parse = parse_iso_stamp
+    result = [None if t is None else parse(t) for t in stamps]
+    if tz is not None:
+        localize = get_transitions(tz).localize
+        result = [localize(dt) if dt is not None and dt.tzinfo is None
+                  else dt for dt in result]
+    return result
+
+
+def localize_datetime(dt, tz='UTC'):
+    """Attach a time zone to a naive Datetime object so that it can be
+    compared against the (always zoned) timestamps returned by the API.
+    Datetime objects that already carry a time zone are returned unchanged.
+
+    :param Datetime dt: the datetime to localize
+    :param string tz: the time zone to assume for naive datetimes
+    :rtype: Datetime object"""
+
+    if dt is None or dt.tzinfo is not None:
+        return dt
+    return get_timezone(tz).localize(dt)
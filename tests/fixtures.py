@@ -0,0 +1,85 @@
+import threading
+from tempoiq.protocol.encoder import CanonicalReadEncoder
+from tempoiq.response import SUCCESS, FAILURE
+
+
+class DummyWriteResponse(object):
+    def __init__(self, status):
+        self.status = status
+        self.successful = SUCCESS if status == 200 else FAILURE
+
+
+class DummyWriteClient(object):
+    """Answers writes with the given statuses in turn, then with 200s.  A
+    None status raises IOError instead, as a write that timed out would.
+    Every write that got a response is kept in writes."""
+
+    def __init__(self, statuses=None):
+        self.statuses = list(statuses or [])
+        self.writes = []
+        self.lock = threading.Lock()
+
+    def next_status(self):
+        with self.lock:
+            status = self.statuses.pop(0) if self.statuses else 200
+        if status is None:
+            raise IOError('deadline exceeded')
+        return status
+
+    def write(self, write_request, retries=0):
+        status = self.next_status()
+        with self.lock:
+            self.writes.append(write_request)
+        return DummyWriteResponse(status)
+
+    def write_encoded(self, body, write_request, headers={}):
+        status = self.next_status()
+        with self.lock:
+            self.writes.append((body, headers))
+        return DummyWriteResponse(status)
+
+
+class Clock(object):
+    """A clock to pass as the clock argument, moved forward by hand."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class DummyResp(object):
+    """Stands in for the HTTP response an endpoint returns."""
+
+    def __init__(self, status_code, content=''):
+        self.status_code = status_code
+        self.content = content
+        self.text = content
+
+
+class DummyReadClient(object):
+    """Keeps the body and the options of every read sent to it, and answers
+    with :meth:`answer`, which returns nothing unless overridden."""
+
+    read_version = 'v2'
+
+    def __init__(self):
+        self.bodies = []
+        self.options = []
+
+    def read(self, query, **kwargs):
+        return self.read_encoded(CanonicalReadEncoder().encode(query),
+                                 **kwargs)
+
+    def single(self, query, **kwargs):
+        return self.read_encoded(CanonicalReadEncoder().encode(query),
+                                 **kwargs)
+
+    def read_encoded(self, body, **kwargs):
+        self.bodies.append(body)
+        self.options.append(kwargs)
+        return self.answer(body)
+
+    def answer(self, body):
+        return None
@@ -0,0 +1,106 @@
+import gzip
+import json
+import time
+import random
+import datetime
+import unittest
+import threading
+from StringIO import StringIO
+from benchmarks.backfill_scaling import measure
+from tempoiq.backfill import backfill, encode_request, KeyGate
+from tempoiq.protocol.point import Point
+from tempoiq.response import SUCCESS, FAILURE
+from fixtures import DummyWriteClient
+
+
+class DummyClient(DummyWriteClient):
+    #a little jitter, so that the senders finish out of order
+    def write_encoded(self, body, write_request, headers={}):
+        time.sleep(random.random() * 0.005)
+        return DummyWriteClient.write_encoded(self, body, write_request,
+                                              headers)
+
+
+def make_batches(count, sensors=3):
+    start = datetime.datetime(2015, 1, 1)
+    for i in range(count):
+        t = start + datetime.timedelta(seconds=i)
+        yield {'d': {'s%d' % (i % sensors): [Point(t, i)]}}
+
+
+def load_batch(i):
+    t = datetime.datetime(2015, 1, 1) + datetime.timedelta(seconds=i)
+    return {'d': {'s': [Point(t, i)]}}
+
+
+class TestBackfill(unittest.TestCase):
+    def test_encode_request_matches_client_encoding(self):
+        request = {'d': {'s': [Point(datetime.datetime(2015, 1, 1), 1)]}}
+        body = encode_request(request)
+        self.assertEquals(json.loads(body), {
+            'd': {'s': [{'t': '2015-01-01T00:00:00', 'v': 1}]}})
+        zipped = encode_request(request, 'gzip')
+        self.assertEquals(gzip.GzipFile(fileobj=StringIO(zipped)).read(),
+                          body)
+
+    def test_per_sensor_order_is_kept(self):
+        client = DummyClient()
+        result = backfill(client, make_batches(60), processes=2, senders=4)
+        self.assertEquals(result.successful, SUCCESS)
+        self.assertEquals(len(result.succeeded), 60)
+        seen = {}
+        for body, headers in client.writes:
+            for sensor, points in json.loads(body)['d'].iteritems():
+                seen.setdefault(sensor, []).extend(p['v'] for p in points)
+        for values in seen.itervalues():
+            self.assertEquals(values, sorted(values))
+
+    def test_loader_builds_batches_in_workers(self):
+        client = DummyClient()
+        result = backfill(client, range(10), loader=load_batch, processes=2,
+                          senders=2)
+        self.assertEquals(len(result.succeeded), 10)
+        values = [json.loads(body)['d']['s'][0]['v']
+                  for body, headers in client.writes]
+        self.assertEquals(values, range(10))
+
+    def test_compression_header_and_retries(self):
+        client = DummyClient(statuses=[503])
+        result = backfill(client, make_batches(3), processes=0, senders=1,
+                          compression='gzip', backoff=0)
+        self.assertEquals(result.successful, SUCCESS)
+        self.assertEquals(len(client.writes), 4)
+        self.assertEquals(client.writes[0][1],
+                          {'Content-Encoding': 'gzip'})
+
+    def test_invalid_arguments(self):
+        client = DummyClient()
+        self.assertRaises(ValueError, backfill, client, [], senders=0)
+        self.assertRaises(ValueError, backfill, client, [],
+                          compression='brotli')
+
+    def test_key_gate_blocks_overlapping_keys(self):
+        gate = KeyGate()
+        gate.acquire(set(['a']))
+        acquired = threading.Event()
+
+        def second():
+            gate.acquire(set(['a', 'b']))
+            acquired.set()
+
+        t = threading.Thread(target=second)
+        t.start()
+        gate.acquire(set(['c']))
+        self.assertFalse(acquired.wait(0.05))
+        gate.release(set(['a']))
+        t.join()
+        self.assertTrue(acquired.is_set())
+
+    def test_benchmark_writes_to_stand_in_server(self):
+        for processes in (0, 2):
+            seconds, points, size, failures = measure(
+                processes, 2, batches=6, points=10, compression='gzip',
+                latency=0)
+            self.assertEquals(points, 60)
+            self.assertEquals(failures, 0)
+            self.assertTrue(size > 0)
@@ -0,0 +1,155 @@
+import unittest
+from tempoiq.breaker import CircuitBreaker, HostPool, CircuitOpenError
+from tempoiq.breaker import CLOSED, OPEN, HALF_OPEN
+from tempoiq.deadline import CancelledError
+from fixtures import Clock, DummyResp
+
+
+class DummyEndpoint(object):
+    def __init__(self, name, status=200):
+        self.name = name
+        self.status = status
+        self.calls = 0
+
+    def get(self):
+        self.calls += 1
+        if isinstance(self.status, Exception):
+            raise self.status
+        return DummyResp(self.status)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.breaker = CircuitBreaker(window=10, min_requests=4,
+                                      error_rate=0.5, open_for=30,
+                                      clock=self.clock)
+
+    def test_opens_on_error_rate(self):
+        for success in (True, False, True):
+            self.breaker.record(success)
+        self.assertEquals(self.breaker.state, CLOSED)
+        self.breaker.record(False)
+        self.assertEquals(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_error_rate_of_the_window(self):
+        for success in (False, True, True, True, True, True, True, True,
+                        True, True):
+            self.breaker.record(success)
+        self.assertEquals(self.breaker.error_rate(), 0.1)
+        #the oldest outcome, a failure, leaves the window
+        self.breaker.record(True)
+        self.assertEquals(self.breaker.error_rate(), 0.0)
+        self.assertEquals(len(self.breaker.outcomes), 10)
+        self.breaker.record(False)
+        self.assertEquals(self.breaker.error_rate(), 0.1)
+        self.assertEquals(self.breaker.state, CLOSED)
+
+    def test_half_open_probe(self):
+        for i in range(4):
+            self.breaker.record(False)
+        self.clock.now += 30
+        self.assertEquals(self.breaker.state, HALF_OPEN)
+        probe = self.breaker.allow()
+        self.assertTrue(probe)
+        #only one probe at a time
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(False, probe)
+        self.assertEquals(self.breaker.state, OPEN)
+        self.clock.now += 30
+        probe = self.breaker.allow()
+        self.assertTrue(probe)
+        self.breaker.record(True, probe)
+        self.assertEquals(self.breaker.state, CLOSED)
+        self.assertEquals(self.breaker.error_rate(), 0.0)
+
+    def test_only_the_probe_resolves_the_half_open_state(self):
+        #a request let through while the breaker was still closed
+        late = self.breaker.allow()
+        for i in range(4):
+            self.breaker.record(False)
+        self.clock.now += 30
+        probe = self.breaker.allow()
+        self.breaker.record(True, late)
+        self.breaker.cancel(late)
+        self.assertEquals(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.breaker.cancel(probe)
+        probe = self.breaker.allow()
+        self.assertTrue(probe)
+        self.breaker.record(True, probe)
+        self.assertEquals(self.breaker.state, CLOSED)
+
+
+class TestHostPool(unittest.TestCase):
+    def make(self, *endpoints):
+        self.clock = Clock()
+        breaker = lambda: CircuitBreaker(window=4, min_requests=2,
+                                         open_for=10, clock=self.clock)
+        return HostPool(list(endpoints), breaker, clock=self.clock)
+
+    def test_fails_over_to_healthy_host(self):
+        bad = DummyEndpoint('bad', 503)
+        good = DummyEndpoint('good')
+        pool = self.make(bad, good)
+        for i in range(4):
+            self.assertEquals(pool.call(lambda e: e.get()).status_code, 200)
+        #the failing host is avoided once its error rate is known
+        self.assertEquals(bad.calls, 1)
+        self.assertEquals(good.calls, 4)
+
+    def test_writes_do_not_fail_over(self):
+        bad = DummyEndpoint('bad', 503)
+        good = DummyEndpoint('good')
+        pool = self.make(bad, good)
+        response = pool.call(lambda e: e.get(), idempotent=False)
+        self.assertEquals(response.status_code, 503)
+        self.assertEquals((bad.calls, good.calls), (1, 0))
+        bad = DummyEndpoint('bad', IOError('reset'))
+        pool = self.make(bad, good)
+        self.assertRaises(IOError, pool.call, lambda e: e.get(),
+                          idempotent=False)
+        self.assertEquals((bad.calls, good.calls), (1, 0))
+
+    def test_probe_brings_host_back(self):
+        bad = DummyEndpoint('bad', IOError('refused'))
+        good = DummyEndpoint('good')
+        pool = self.make(bad, good)
+        for i in range(2):
+            pool.hosts[0].breaker.record(False)
+        self.assertEquals(pool.hosts[0].breaker.state, OPEN)
+        pool.hosts[1].outstanding = 1
+        pool.call(lambda e: e.get())
+        self.assertEquals(bad.calls, 0)
+
+        bad.status = 200
+        self.clock.now += 10
+        pool.call(lambda e: e.get())
+        self.assertEquals(bad.calls, 1)
+        self.assertEquals(pool.hosts[0].breaker.state, CLOSED)
+
+    def test_least_outstanding(self):
+        a, b = DummyEndpoint('a'), DummyEndpoint('b')
+        pool = self.make(a, b)
+        first, token = pool.choose()
+        second, other = pool.choose()
+        self.assertNotEquals(first, second)
+        pool.finish(first, token, DummyResp(200), 0.1)
+        self.assertTrue(pool.choose()[0] is first)
+
+    def test_every_host_failing(self):
+        pool = self.make(DummyEndpoint('a', IOError('refused')),
+                         DummyEndpoint('b', 500))
+        for i in range(2):
+            self.assertEquals(pool.call(lambda e: e.get()).status_code, 500)
+        self.assertEquals([h.failures for h in pool.hosts], [2, 2])
+        self.assertRaises(CircuitOpenError, pool.call, lambda e: e.get())
+
+    def test_cancelled_calls_do_not_fail_over(self):
+        a, b = DummyEndpoint('a', CancelledError()), DummyEndpoint('b')
+        pool = self.make(a, b)
+        self.assertRaises(CancelledError, pool.call, lambda e: e.get())
+        self.assertEquals(b.calls, 0)
+        self.assertEquals(pool.hosts[0].outstanding, 0)
+        self.assertEquals(pool.hosts[0].failures, 0)
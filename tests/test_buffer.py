@@ -0,0 +1,134 @@
+import shutil
+import tempfile
+import unittest
+import datetime
+from tempoiq.buffer import WriteAheadLog, WriteBuffer, Segment
+from tempoiq.buffer import FlusherError
+from tempoiq.protocol.point import Point
+from fixtures import DummyWriteClient
+
+
+def make_request(device, sensor, values):
+    start = datetime.datetime(2015, 1, 1)
+    return {device: {sensor: [Point(start + datetime.timedelta(seconds=v), v)
+                              for v in values]}}
+
+
+class TestWriteAheadLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_segment_detects_torn_records(self):
+        segment = Segment(self.directory + '/0.seg', 64)
+        end = segment.append(0, 'hello')
+        self.assertEquals(segment.read(0), ('hello', end))
+        self.assertEquals(segment.read(end), None)
+        segment.map[10] = 'X'
+        self.assertEquals(segment.read(0), None)
+        self.assertEquals(segment.append(end, 'x' * 64), None)
+        segment.close()
+
+    def test_log_rolls_over_segments_and_resumes(self):
+        log = WriteAheadLog(self.directory, segment_size=32)
+        for i in range(5):
+            log.append('record-%d' % i)
+        records = log.read(log.checkpoint)
+        self.assertEquals([r[0] for r in records],
+                          ['record-%d' % i for i in range(5)])
+        log.commit(records[2][1])
+        log.close()
+
+        reopened = WriteAheadLog(self.directory, segment_size=32)
+        records = reopened.read(reopened.checkpoint)
+        self.assertEquals([r[0] for r in records], ['record-3', 'record-4'])
+        reopened.commit(records[-1][1])
+        self.assertEquals(reopened.read(reopened.checkpoint), [])
+        reopened.close()
+
+    def test_read_skips_unsized_segments(self):
+        log = WriteAheadLog(self.directory, segment_size=32)
+        log.append('record-0')
+        #a segment file created but not yet truncated to size
+        open(log._path(log.write_number + 1), 'wb').close()
+        log.write_number += 1
+        self.assertEquals([r[0] for r in log.read(log.checkpoint)],
+                          ['record-0'])
+        log.close()
+
+
+class TestWriteBuffer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_buffer_batches_in_order(self):
+        client = DummyWriteClient()
+        buf = WriteBuffer(client, self.directory, batch_size=100,
+                          flush_interval=0.01)
+        buf.write(make_request('dev1', 'temp', [1, 2]))
+        buf.write(make_request('dev1', 'temp', [3]))
+        self.assertTrue(buf.flush(5))
+        buf.close()
+        values = [p['v'] for w in client.writes for p in w['dev1']['temp']]
+        self.assertEquals(values, [1, 2, 3])
+
+    def test_buffer_retries_until_acknowledged(self):
+        client = DummyWriteClient([None, 503, 200])
+        buf = WriteBuffer(client, self.directory, flush_interval=0.01,
+                          max_backoff=0.01)
+        buf.write(make_request('dev1', 'temp', [1]))
+        self.assertTrue(buf.flush(10))
+        buf.close()
+        self.assertEquals(len(client.writes), 2)
+
+    def test_unsent_records_survive_a_restart(self):
+        client = DummyWriteClient([None] * 1000)
+        buf = WriteBuffer(client, self.directory, flush_interval=0.01,
+                          max_backoff=0.01)
+        buf.write(make_request('dev1', 'temp', [1]))
+        buf.close(flush=False)
+
+        client = DummyWriteClient()
+        buf = WriteBuffer(client, self.directory, flush_interval=0.01)
+        self.assertTrue(buf.flush(5))
+        buf.close()
+        self.assertEquals(len(client.writes), 1)
+
+    def test_flusher_survives_its_own_errors(self):
+        def on_error(batch, response):
+            raise KeyError('handler bug')
+
+        client = DummyWriteClient([400])
+        buf = WriteBuffer(client, self.directory, flush_interval=0.01,
+                          on_error=on_error, max_backoff=0.01)
+        commit = buf.log.commit
+        failures = [IOError('disk full')]
+
+        def flaky_commit(position):
+            if failures:
+                raise failures.pop()
+            commit(position)
+        buf.log.commit = flaky_commit
+        buf.write(make_request('dev1', 'temp', [1]))
+        self.assertTrue(buf.flush(5))
+        buf.write(make_request('dev1', 'temp', [2]))
+        self.assertTrue(buf.flush(5))
+        buf.close()
+        self.assertTrue(isinstance(buf.last_error, IOError))
+        self.assertEquals(len(client.writes), 3)
+
+    def test_flush_raises_once_the_flusher_died(self):
+        def die(*args):
+            raise SystemExit()
+
+        client = DummyWriteClient()
+        client.write = die
+        buf = WriteBuffer(client, self.directory, flush_interval=0.01)
+        buf.write(make_request('dev1', 'temp', [1]))
+        self.assertRaises(FlusherError, buf.flush)
+        self.assertRaises(FlusherError, buf.close)
@@ -0,0 +1,201 @@
+import json
+import unittest
+import threading
+from tempoiq.bulk import run_bulk, call_with_retry, is_retryable, SKIPPED
+from tempoiq.bulk import BulkResult
+from tempoiq.response import SUCCESS, FAILURE, PARTIAL
+from tempoiq.client import Client
+from tempoiq.protocol import Device, Sensor, Rule
+from tempoiq.protocol.rule import Condition, Filter, Trigger, Webhook
+from tempoiq.protocol.query.selection import Selection
+from fixtures import DummyResp
+
+
+class DummyOutcome(object):
+    def __init__(self, status):
+        self.status = status
+        self.successful = SUCCESS if status == 200 else FAILURE
+
+
+class TestBulk(unittest.TestCase):
+    def test_is_retryable(self):
+        self.assertTrue(is_retryable(ValueError('timeout')))
+        self.assertTrue(is_retryable(DummyOutcome(503)))
+        self.assertFalse(is_retryable(DummyOutcome(404)))
+        self.assertFalse(is_retryable(DummyOutcome(200)))
+
+    def test_call_with_retry_retries_server_errors(self):
+        outcomes = [DummyOutcome(500), ValueError('boom'), DummyOutcome(200)]
+        result = call_with_retry(lambda item: outcomes.pop(0), 'foo',
+                                 retries=2, backoff=0)
+        self.assertEquals(result.status, 200)
+        self.assertEquals(outcomes, [])
+
+    def test_call_with_retry_gives_up(self):
+        calls = []
+
+        def operation(item):
+            calls.append(item)
+            raise ValueError('boom')
+
+        result = call_with_retry(operation, 'foo', retries=1, backoff=0)
+        self.assertTrue(isinstance(result, ValueError))
+        self.assertEquals(len(calls), 2)
+
+    def test_call_with_retry_does_not_retry_client_errors(self):
+        calls = []
+
+        def operation(item):
+            calls.append(item)
+            return DummyOutcome(400)
+
+        call_with_retry(operation, 'foo', retries=3, backoff=0)
+        self.assertEquals(len(calls), 1)
+
+    def test_bulk_result_successful(self):
+        result = BulkResult()
+        result.add('a', DummyOutcome(200))
+        result.add('b', SKIPPED)
+        self.assertEquals(result.successful, SUCCESS)
+        result.add('c', DummyOutcome(400))
+        self.assertEquals(result.successful, PARTIAL)
+        self.assertEquals(result.skipped, ['b'])
+
+        failed = BulkResult()
+        failed.add('a', ValueError('boom'))
+        self.assertEquals(failed.successful, FAILURE)
+
+    def test_run_bulk_aggregates_by_key(self):
+        def operation(item):
+            if item % 3 == 0:
+                return DummyOutcome(404)
+            return DummyOutcome(200)
+
+        result = run_bulk(operation, iter(range(1, 51)),
+                          key=lambda item: 'rule-%d' % item,
+                          workers=4, retries=0)
+        self.assertEquals(len(result.succeeded), 34)
+        self.assertEquals(len(result.failed), 16)
+        self.assertTrue('rule-3' in result.failed)
+        self.assertTrue('rule-1' in result.succeeded)
+
+    def test_run_bulk_requires_a_worker(self):
+        self.assertRaises(ValueError, run_bulk, lambda item: item, [1],
+                          workers=0)
+
+    def test_run_bulk_records_key_failures(self):
+        def key(item):
+            if item == 3:
+                raise ValueError('no key')
+            return 'rule-%d' % item
+
+        sent = []
+        result = run_bulk(lambda item: sent.append(item) or
+                          DummyOutcome(200), iter(range(1, 21)), key=key,
+                          workers=1, retries=0)
+        self.assertEquals(len(result.succeeded), 19)
+        self.assertTrue(isinstance(result.failed[3], ValueError))
+        self.assertFalse(3 in sent)
+
+
+class DummyEndpoint(object):
+    """Answers monitoring requests from a dict of stored rule JSON."""
+
+    base_url = 'http://test.tempo-iq.com/v2/'
+
+    def __init__(self, rules=None):
+        self.rules = dict(rules or {})
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _record(self, method, url):
+        with self.lock:
+            self.calls.append((method, url[len(self.base_url):]))
+
+    def get(self, url, body='', headers={}, **kwargs):
+        self._record('GET', url)
+        key = url.rsplit('/', 1)[1]
+        if key not in self.rules:
+            return DummyResp(404, 'not found')
+        return DummyResp(200, self.rules[key])
+
+    def post(self, url, body, headers={}, **kwargs):
+        self._record('POST', url)
+        rule = json.loads(body)
+        rule['rule'].setdefault('key', 'generated')
+        return DummyResp(200, json.dumps(rule))
+
+    def put(self, url, body, headers={}, **kwargs):
+        self._record('PUT', url)
+        return DummyResp(200, body)
+
+    def delete(self, url, body='', headers={}, **kwargs):
+        self._record('DELETE', url)
+        return DummyResp(200)
+
+
+def make_rule(key, threshold=5):
+    selection = {'devices': Selection(), 'sensors': Selection()}
+    selection['devices'].add(Device.key == 'device-1')
+    selection['sensors'].add(Sensor.key == 'temp')
+    condition = Condition([Filter('and', 'operator', ['gt', threshold])],
+                          Trigger('static', []))
+    return Rule('rule %s' % key, alert_by='device', key=key,
+                selection=selection, conditions=[condition],
+                action=Webhook('http://example.com/hook'))
+
+
+class TestBulkRules(unittest.TestCase):
+    def setUp(self):
+        self.encode = Client.write_encoder.encode_rule
+
+    def stored(self, *rules):
+        return dict((r.key, json.dumps(self.encode(r))) for r in rules)
+
+    def test_deploy_rules(self):
+        endpoint = DummyEndpoint(self.stored(make_rule('same'),
+                                             make_rule('changed')))
+        client = Client(endpoint)
+        rules = [make_rule('same'), make_rule('changed', threshold=10),
+                 make_rule('new')]
+        result = client.deploy_rules(rules, workers=2, retries=0)
+        self.assertEquals(result.successful, SUCCESS)
+        self.assertEquals(result.skipped, ['same'])
+        self.assertEquals(sorted(result.succeeded), ['changed', 'new'])
+        writes = sorted(c for c in endpoint.calls if c[0] != 'GET')
+        self.assertEquals(writes, [('POST', 'monitors/'),
+                                   ('PUT', 'monitors/changed')])
+
+    def test_deploy_rule_without_key_is_created(self):
+        endpoint = DummyEndpoint()
+        rule = make_rule(None)
+        result = Client(endpoint).deploy_rules([rule], retries=0)
+        self.assertEquals(result.succeeded.keys(), ['rule None'])
+        self.assertEquals(endpoint.calls, [('POST', 'monitors/')])
+
+    def test_monitor_rules(self):
+        endpoint = DummyEndpoint()
+        rules = [make_rule('rule-%d' % i) for i in range(10)]
+        result = Client(endpoint).monitor_rules(rules, workers=3, retries=0)
+        self.assertEquals(len(result.succeeded), 10)
+        self.assertEquals(endpoint.calls, [('POST', 'monitors/')] * 10)
+
+    def test_update_rules(self):
+        endpoint = DummyEndpoint()
+        rules = [make_rule('rule-%d' % i) for i in range(5)]
+        result = Client(endpoint).update_rules(rules, workers=2, retries=0)
+        self.assertEquals(sorted(result.succeeded),
+                          ['rule-%d' % i for i in range(5)])
+        self.assertEquals(sorted(endpoint.calls),
+                          [('PUT', 'monitors/rule-%d' % i)
+                           for i in range(5)])
+
+    def test_delete_rules(self):
+        endpoint = DummyEndpoint()
+        client = Client(endpoint)
+        result = client.monitoring_client.delete_rules(['a', 'b', 'c'],
+                                                       workers=2, retries=0)
+        self.assertEquals(sorted(result.succeeded), ['a', 'b', 'c'])
+        self.assertEquals(sorted(endpoint.calls),
+                          [('DELETE', 'monitors/a'), ('DELETE', 'monitors/b'),
+                           ('DELETE', 'monitors/c')])
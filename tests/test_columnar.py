@@ -0,0 +1,94 @@
+import os
+import json
+import shutil
+import tempfile
+#unittest2 for skipIf, which unittest only has from 2.7 on
+import unittest2 as unittest
+from tempoiq.protocol.columnar import iter_payloads, encode_points
+from tempoiq.protocol.columnar import load_npy, load_arrow
+
+#numpy and pyarrow are only installed with the columnar and export extras
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+START = 1420070400000
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestColumnar(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_encode_points(self):
+        timestamps = np.array([START, START + 1500])
+        j = json.loads(encode_points(np, timestamps, np.array([1.5, 2])))
+        self.assertEquals(j, [{'t': '2015-01-01T00:00:00.000Z', 'v': 1.5},
+                              {'t': '2015-01-01T00:00:01.500Z', 'v': 2.0}])
+        stamps = timestamps.astype('datetime64[ms]')
+        j = json.loads(encode_points(np, stamps, np.array([True, False])))
+        self.assertEquals([p['v'] for p in j], [True, False])
+
+    def test_encode_points_rejects_bad_input(self):
+        timestamps = np.array([START, START + 1])
+        self.assertRaises(ValueError, encode_points, np, timestamps,
+                          np.array([1]))
+        self.assertRaises(ValueError, encode_points, np, timestamps,
+                          np.array([1.0, np.nan]))
+        self.assertRaises(ValueError, encode_points, np,
+                          np.array([1.0, 2.0]), np.array([1, 2]))
+
+    def test_payloads_are_chunked(self):
+        columns = {
+            'device1': {
+                'sensor1': (np.arange(5) + START, np.arange(5)),
+                'sensor2': (np.arange(3) + START, np.arange(3))
+            }
+        }
+        payloads = list(iter_payloads(columns, chunk_size=4))
+        self.assertTrue(all(n <= 4 for body, n in payloads))
+        self.assertEquals(sum(n for body, n in payloads), 8)
+        merged = {}
+        for body, n in payloads:
+            for sensor, points in json.loads(body)['device1'].iteritems():
+                merged.setdefault(sensor, []).extend(p['v'] for p in points)
+                self.assertEquals(sum(len(p) for p in
+                                      json.loads(body)['device1'].values()),
+                                  n)
+        self.assertEquals(merged, {'sensor1': range(5), 'sensor2': range(3)})
+
+    def test_load_npy_is_memory_mapped(self):
+        t_path = os.path.join(self.directory, 't.npy')
+        v_path = os.path.join(self.directory, 'v.npy')
+        np.save(t_path, np.arange(10) + START)
+        np.save(v_path, np.arange(10) * 0.5)
+        timestamps, values = load_npy(t_path, v_path)
+        self.assertTrue(isinstance(values, np.memmap))
+        body, n = list(iter_payloads({'d': {'s': (timestamps, values)}}))[0]
+        self.assertEquals(n, 10)
+        self.assertEquals(json.loads(body)['d']['s'][-1]['v'], 4.5)
+
+    @unittest.skipIf(pa is None, 'pyarrow is not installed')
+    def test_load_arrow_yields_record_batches(self):
+        path = os.path.join(self.directory, 'points.arrow')
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(np.arange(3) + START), pa.array([1.0, 2.0, 3.0])],
+            ['t', 'v'])
+        sink = pa.OSFile(path, 'wb')
+        writer = pa.RecordBatchFileWriter(sink, batch.schema)
+        writer.write_batch(batch)
+        writer.write_batch(batch)
+        writer.close()
+        sink.close()
+        payloads = list(iter_payloads({'d': {'s': load_arrow(path)}}))
+        self.assertEquals(len(payloads), 1)
+        points = json.loads(payloads[0][0])['d']['s']
+        self.assertEquals([p['v'] for p in points], [1.0, 2.0, 3.0] * 2)
@@ -0,0 +1,42 @@
+import unittest
+from tempoiq.deadline import CancelToken, Deadline, split_timeout
+from tempoiq.deadline import CancelledError, DeadlineExceeded
+from fixtures import Clock
+
+
+class TestDeadline(unittest.TestCase):
+    def test_limit_cuts_timeouts_to_time_left(self):
+        clock = Clock(100.0)
+        deadline = Deadline(10, clock=clock)
+        self.assertEquals(deadline.limit(35), 10)
+        self.assertEquals(deadline.limit(None), 10)
+        clock.now += 8
+        self.assertEquals(deadline.limit(1), 1)
+        self.assertEquals(deadline.limit(35), 2)
+        clock.now += 2
+        self.assertRaises(DeadlineExceeded, deadline.limit, 35)
+
+    def test_no_time_limit(self):
+        deadline = Deadline()
+        self.assertEquals(deadline.remaining(), None)
+        self.assertEquals(deadline.limit(35), 35)
+        self.assertEquals(deadline.limit(None), None)
+
+    def test_cancel(self):
+        token = CancelToken()
+        calls = []
+        token.on_cancel(lambda: calls.append('a'))
+        unregister = token.on_cancel(lambda: calls.append('b'))
+        unregister()
+        deadline = Deadline(token=token)
+        deadline.check()
+        token.cancel()
+        token.cancel()
+        self.assertEquals(calls, ['a'])
+        self.assertRaises(CancelledError, deadline.check)
+        token.on_cancel(lambda: calls.append('c'))
+        self.assertEquals(calls, ['a', 'c'])
+
+    def test_split_timeout(self):
+        self.assertEquals(split_timeout(5), (5, 5))
+        self.assertEquals(split_timeout((1, 30)), (1, 30))
@@ -441,6 +441,47 @@ class TestTempoIQDecoder(unittest.TestCase):
             decoded['data'][0].transitions[0].instigator,
             Instigator))
 
+    def test_decoder_for_lazy_alert(self):
+        j = {
+            'alert_id': 1,
+            'rule_key': 'key-1',
+            'transitions': [
+                {
+                    'timestamp': '2015-01-01T00:00:00.000Z',
+                    'instigator': {
+                        'datapoint': {'t': '2015-01-01T00:00:00.000Z',
+                                      'v': 1},
+                        'device': {'key': 'key-1', 'name': '',
+                                   'attributes': {}},
+                        'sensor': {'key': 'temp', 'name': '',
+                                   'attributes': {}}
+                    },
+                    'transition_to': 'warning',
+                    'actions': [
+                        {
+                            'payload': 'test payload',
+                            'recipient': 'me',
+                            'response': 'all good',
+                            'status': '200',
+                            'action_type': 'webhook'
+                        }
+                    ]
+                }
+            ]
+        }
+
+        decoder = TempoIQDecoder()
+        decoded = decoder.decode_lazy_alert(j)
+        transition = decoded.transitions[0]
+        self.assertEquals(decoded.id, 1)
+        self.assertEquals(transition.to, 'warning')
+        self.assertEquals(transition._instigator, None)
+        self.assertTrue(isinstance(transition.instigator, Instigator))
+        self.assertEquals(transition.timestamp.year, 2015)
+        self.assertEquals(transition.action_logs[0].payload, 'test payload')
+        self.assertTrue(transition.action_logs is transition.action_logs)
+        self.assertTrue(decoded.warning_transition is transition)
+
     def test_device_decoder(self):
         j = """{
                  "key": "test-dev",
@@ -461,3 +502,27 @@ class TestTempoIQDecoder(unittest.TestCase):
         self.assertEquals(decoded.key, 'test-dev')
         self.assertEquals(decoded.attributes['type'], 'blarg')
         self.assertEquals(decoded.sensors[0].key, 'vals')
+
+    def test_decode_multi_status(self):
+        body = {
+            'device1': {'success': True},
+            'device2': {'success': False, 'message': 'unknown device'},
+            'device3': {
+                'success': False,
+                'message': 'bad points',
+                'sensors': {
+                    'sensor1': {'success': True},
+                    'sensor2': {'success': False, 'points': [0, 2]}
+                }
+            }
+        }
+        failures = TempoIQDecoder().decode_multi_status(body)
+        failures.sort(key=lambda f: f.device)
+        self.assertEquals(len(failures), 2)
+        self.assertEquals(failures[0].device, 'device2')
+        self.assertEquals(failures[0].sensor, None)
+        self.assertEquals(failures[0].message, 'unknown device')
+        self.assertEquals(failures[1].device, 'device3')
+        self.assertEquals(failures[1].sensor, 'sensor2')
+        self.assertEquals(failures[1].indices, [0, 2])
+        self.assertEquals(failures[1].message, 'bad points')
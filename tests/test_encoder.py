@@ -3,9 +3,11 @@ import json
 import datetime
 import mock
 from tempoiq.protocol.encoder import WriteEncoder, CreateEncoder, ReadEncoder
+from tempoiq.protocol.encoder import CanonicalReadEncoder
 from tempoiq.protocol import Sensor, Device, Point, Rule
 from tempoiq.protocol.query.selection import *
 from tempoiq.protocol.query.builder import QueryBuilder
+from tempoiq.protocol.query.functions import APIOperation
 from tempoiq.session import get_session
 from monkey import monkeypatch_requests
 
@@ -344,3 +346,35 @@ class TestReadEncoder(unittest.TestCase):
         #    'http://test.tempo-iq.com/v2/devices/',
         #    data=expected,
         #    auth=self.client.endpoint.auth)
+
+
+class TestCanonicalReadEncoder(unittest.TestCase):
+    canonical_encoder = CanonicalReadEncoder()
+
+    def make_query(self, selectors):
+        qb = QueryBuilder(None, Sensor)
+        for selector in selectors:
+            qb.filter(selector)
+        qb.operation = APIOperation('read', {
+            'start': datetime.datetime(2014, 1, 1),
+            'stop': datetime.datetime(2014, 1, 2)})
+        return qb
+
+    def test_filter_order_does_not_change_encoding(self):
+        a = Device.key == 'foo'
+        b = Device.attributes['building'] == '24'
+        c = Sensor.key == 'temp'
+        q1 = self.make_query([a, b, c])
+        q2 = self.make_query([c, b, a])
+        self.assertEquals(self.canonical_encoder.encode(q1),
+                          self.canonical_encoder.encode(q2))
+        self.assertEquals(self.canonical_encoder.hash(q1),
+                          self.canonical_encoder.hash(q2))
+
+    def test_canonical_encoding_is_compact_and_sorted(self):
+        q = self.make_query([Device.key == 'foo'])
+        expected = ('{"read":{"start":"2014-01-01T00:00:00",'
+                    '"stop":"2014-01-02T00:00:00"},"search":{"filters":'
+                    '{"devices":{"key":"foo"},"sensors":"all"},'
+                    '"select":"sensors"}}')
+        self.assertEquals(self.canonical_encoder.encode(q), expected)
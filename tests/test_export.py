@@ -0,0 +1,108 @@
+import gzip
+#unittest2 for skipIf, which unittest only has from 2.7 on
+import unittest2 as unittest
+from StringIO import StringIO
+from tempoiq.protocol.cursor import DataPointsCursor
+from tempoiq.protocol.export import export_pages, flatten_page
+from test_protocol_cursor import DummyResponse
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    #only installed with the export extra
+    pa = None
+
+NOPYARROW = 'pyarrow is not installed'
+
+
+FIRST_PAGE = {
+    'next_page': {'next_query': {'page': 2}},
+    'data': [
+        {'t': '2015-01-01T00:00:00.000Z',
+         'data': {'dev1': {'temp': 1.0}}}
+    ]
+}
+
+SECOND_PAGE = {
+    'data': [
+        {'t': '2015-01-01T00:01:00.000Z',
+         'data': {'dev1': {'temp': 2.0}, 'dev2': {'temp': 3.0}}}
+    ]
+}
+
+
+class TestExport(unittest.TestCase):
+    def test_flatten_page(self):
+        values = sorted(flatten_page(SECOND_PAGE['data']))
+        self.assertEquals(values, [
+            ('2015-01-01T00:01:00.000Z', 'dev1', 'temp', 2.0),
+            ('2015-01-01T00:01:00.000Z', 'dev2', 'temp', 3.0)])
+
+    def test_export_csv_from_cursor(self):
+        fetched = []
+
+        def fetcher(cursor):
+            fetched.append(cursor)
+            return SECOND_PAGE
+
+        c = DataPointsCursor(DummyResponse(), FIRST_PAGE, fetcher)
+        sink = StringIO()
+        count = c.export(sink)
+        lines = sink.getvalue().splitlines()
+        self.assertEquals(count, 3)
+        self.assertEquals(fetched, [{'page': 2}])
+        self.assertEquals(lines[0], 't,device,sensor,value')
+        self.assertEquals(lines[1], '2015-01-01T00:00:00.000Z,dev1,temp,1.0')
+        self.assertEquals(len(lines), 4)
+        self.assertEquals([r for r in c], [])
+
+    def test_export_gzip_csv(self):
+        sink = StringIO()
+        export_pages([SECOND_PAGE['data']], sink, compression='gzip')
+        sink.seek(0)
+        lines = gzip.GzipFile(fileobj=sink).read().splitlines()
+        self.assertEquals(len(lines), 3)
+
+    def test_export_invalid_format(self):
+        self.assertRaises(ValueError, export_pages, [], StringIO(),
+                          format='xls')
+
+    @unittest.skipIf(pa is None, NOPYARROW)
+    def test_export_mixed_value_types(self):
+        pages = [
+            [{'t': '2015-01-01T00:00:00.000Z', 'data': {'dev1': {'temp': 1}}}],
+            [{'t': '2015-01-01T00:01:00.000Z',
+              'data': {'dev1': {'temp': 2.5}}}]
+        ]
+
+        sink = pa.BufferOutputStream()
+        self.assertEquals(export_pages(pages, sink, format='arrow',
+                                       row_group_size=1), 2)
+        table = pa.ipc.open_stream(sink.getvalue()).read_all()
+        self.assertEquals(table.schema.field('value').type, pa.float64())
+        self.assertEquals(table.column('value').to_pylist(), [1.0, 2.5])
+
+        sink = pa.BufferOutputStream()
+        self.assertEquals(export_pages(pages, sink, format='parquet',
+                                       row_group_size=1), 2)
+        table = pq.read_table(pa.BufferReader(sink.getvalue()))
+        self.assertEquals(table.column('value').to_pylist(), [1.0, 2.5])
+        self.assertEquals(table.column('t').to_pylist()[1],
+                          '2015-01-01T00:01:00.000Z')
+
+    @unittest.skipIf(pa is None, NOPYARROW)
+    def test_export_compressed_arrow(self):
+        pages = [FIRST_PAGE['data'], SECOND_PAGE['data']]
+        for codec in ('gzip', 'lz4'):
+            sink = StringIO()
+            self.assertEquals(export_pages(pages, sink, format='arrow',
+                                           compression=codec), 3)
+            self.assertFalse(sink.closed)
+            stream = pa.CompressedInputStream(
+                pa.BufferReader(sink.getvalue()), codec)
+            table = pa.ipc.open_stream(stream).read_all()
+            self.assertEquals(sorted(table.column('value').to_pylist()),
+                              [1.0, 2.0, 3.0])
+        self.assertRaises(ValueError, export_pages, pages, StringIO(),
+                          format='arrow', compression='snappy')
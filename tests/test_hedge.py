@@ -0,0 +1,89 @@
+import time
+import unittest
+import threading
+from tempoiq.hedge import LatencyHistogram, HedgePolicy, hedged
+
+
+class Sender(object):
+    """Send callable whose attempts take the given times, in order, and
+    stop early when cancelled."""
+
+    def __init__(self, *delays):
+        self.delays = list(delays)
+        self.tokens = []
+        self.lock = threading.Lock()
+
+    def __call__(self, token):
+        with self.lock:
+            index = len(self.tokens)
+            self.tokens.append(token)
+            delay = self.delays[index]
+        if isinstance(delay, Exception):
+            raise delay
+        token.event.wait(delay)
+        return index
+
+
+class TestHedging(unittest.TestCase):
+    def test_histogram_percentile(self):
+        h = LatencyHistogram()
+        self.assertEquals(h.percentile(99), None)
+        for i in range(90):
+            h.record(0.010)
+        for i in range(10):
+            h.record(0.500)
+        self.assertTrue(0.010 <= h.percentile(50) < 0.012)
+        self.assertTrue(0.500 <= h.percentile(95) < 0.6)
+
+    def test_histogram_decays(self):
+        h = LatencyHistogram(max_samples=100)
+        for i in range(99):
+            h.record(0.5)
+        for i in range(300):
+            h.record(0.01)
+        self.assertTrue(h.percentile(90) < 0.012)
+
+    def test_delay_follows_latencies(self):
+        policy = HedgePolicy(initial_delay=0.3, min_samples=10)
+        self.assertEquals(policy.delay('a'), 0.3)
+        for i in range(10):
+            policy.record('a', 0.05)
+        self.assertTrue(0.05 <= policy.delay('a') < 0.06)
+        self.assertEquals(policy.delay('b'), 0.3)
+
+    def test_fast_request_is_not_hedged(self):
+        policy = HedgePolicy(initial_delay=0.5, budget=1)
+        send = Sender(0.01)
+        self.assertEquals(hedged(policy, 'a', send), 0)
+        self.assertEquals(len(send.tokens), 1)
+        self.assertEquals(policy.hedges, 0)
+        self.assertEquals(policy.histogram('a').total, 1)
+
+    def test_slow_request_is_hedged(self):
+        policy = HedgePolicy(initial_delay=0.05, budget=1)
+        send = Sender(5, 0.01)
+        start = time.time()
+        self.assertEquals(hedged(policy, 'a', send), 1)
+        self.assertTrue(time.time() - start < 1)
+        self.assertTrue(send.tokens[0].cancelled)
+        self.assertEquals((policy.hedges, policy.wins), (1, 1))
+
+    def test_hedge_win_records_latency_from_the_start(self):
+        policy = HedgePolicy(initial_delay=0.2, budget=1)
+        self.assertEquals(hedged(policy, 'a', Sender(5, 0.01)), 1)
+        #the caller waited for the delay and the hedge, not just the hedge
+        self.assertTrue(policy.histogram('a').percentile(50) >= 0.2)
+
+    def test_budget_caps_hedges(self):
+        policy = HedgePolicy(initial_delay=0.01, budget=0.5, burst=1)
+        self.assertEquals(hedged(policy, 'a', Sender(0.05, 1)), 0)
+        self.assertEquals(policy.hedges, 0)
+        self.assertEquals(hedged(policy, 'a', Sender(1, 0.01)), 1)
+        self.assertEquals(policy.hedges, 1)
+
+    def test_failed_attempt_waits_for_the_other(self):
+        policy = HedgePolicy(initial_delay=0.01, budget=1)
+        send = Sender(0.05, IOError('reset'))
+        self.assertEquals(hedged(policy, 'a', send), 0)
+        send = Sender(IOError('reset'))
+        self.assertRaises(IOError, hedged, policy, 'a', send)
@@ -0,0 +1,211 @@
+import json
+import time
+import socket
+#unittest2 for skipIf, which unittest only has from 2.7 on
+import unittest2 as unittest
+import threading
+from tempoiq.http2 import HTTP2Transport, HTTP2Error
+from tempoiq.deadline import CancelToken, CancelledError
+
+try:
+    #only installed with the http2 extra
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.settings
+except ImportError:
+    h2 = None
+
+
+class H2Server(object):
+    """Local stand-in for the backend that answers every request over
+    HTTP/2 with a JSON echo of it, after delay seconds."""
+
+    def __init__(self, delay=0.0, window=None):
+        self.delay = delay
+        self.window = window
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.threads = []
+        self.timers = []
+        self.active = 0
+        self.max_active = 0
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(5)
+        self.port = self.listener.getsockname()[1]
+        t = threading.Thread(target=self.accept)
+        t.daemon = True
+        t.start()
+
+    def accept(self):
+        while True:
+            try:
+                sock, addr = self.listener.accept()
+            except socket.error:
+                return
+            with self.lock:
+                self.connections += 1
+            t = threading.Thread(target=self.serve, args=(sock,))
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def serve(self, sock):
+        config = h2.config.H2Configuration(client_side=False,
+                                           header_encoding='utf-8')
+        conn = h2.connection.H2Connection(config=config)
+        send_lock = threading.Lock()
+        conn.initiate_connection()
+        if self.window is not None:
+            conn.update_settings(
+                {h2.settings.SettingCodes.INITIAL_WINDOW_SIZE: self.window})
+        sock.sendall(conn.data_to_send())
+        requests = {}
+        reset = set()
+
+        def respond(stream_id):
+            headers, body = requests.pop(stream_id)
+            echo = json.dumps({'method': headers[':method'],
+                               'path': headers[':path'],
+                               'authority': headers[':authority'],
+                               'type': headers.get('content-type'),
+                               'body': ''.join(body)})
+            with self.lock:
+                self.active -= 1
+            with send_lock:
+                if stream_id in reset:
+                    return
+                conn.send_headers(stream_id, [(':status', '200')])
+                size = conn.max_outbound_frame_size
+                for i in range(0, len(echo), size):
+                    conn.send_data(stream_id, echo[i:i + size])
+                conn.end_stream(stream_id)
+                sock.sendall(conn.data_to_send())
+
+        while True:
+            data = sock.recv(65535)
+            if not data:
+                return
+            with send_lock:
+                events = conn.receive_data(data)
+            for event in events:
+                if isinstance(event, h2.events.RequestReceived):
+                    requests[event.stream_id] = [dict(event.headers), []]
+                    with self.lock:
+                        self.active += 1
+                        self.max_active = max(self.max_active, self.active)
+                elif isinstance(event, h2.events.DataReceived):
+                    requests[event.stream_id][1].append(event.data)
+                    with send_lock:
+                        conn.acknowledge_received_data(
+                            event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamReset):
+                    reset.add(event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    timer = threading.Timer(self.delay, respond,
+                                            (event.stream_id,))
+                    timer.daemon = True
+                    timer.start()
+                    self.timers.append(timer)
+            with send_lock:
+                sock.sendall(conn.data_to_send())
+
+    def close(self):
+        self.listener.close()
+        for t in self.timers:
+            t.cancel()
+            t.join(1)
+        for t in self.threads:
+            t.join(1)
+
+
+@unittest.skipIf(h2 is None, 'h2 is not installed')
+class TestHTTP2Transport(unittest.TestCase):
+    def make(self, connections=2, max_streams=100, **kwargs):
+        self.server = H2Server(**kwargs)
+        self.transport = HTTP2Transport(
+            'http://127.0.0.1:%d' % self.server.port, connections,
+            max_streams)
+        return self.transport
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.close()
+
+    def request(self, body='{}', timeout=5, token=None):
+        url = 'http://127.0.0.1:%d/v2/single/query' % self.server.port
+        return self.transport.request('POST', url, body,
+                                      {'Content-Type': 'application/json'},
+                                      timeout, token=token)
+
+    def run_concurrently(self, n):
+        results = []
+
+        def run(i):
+            results.append(json.loads(self.request(str(i)).content))
+
+        threads = [threading.Thread(target=run, args=(i,))
+                   for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_round_trip(self):
+        self.make()
+        resp = self.request('{"a": 1}')
+        self.assertEquals(resp.status_code, 200)
+        echo = json.loads(resp.text)
+        self.assertEquals(echo['method'], 'POST')
+        self.assertEquals(echo['path'], '/v2/single/query')
+        self.assertEquals(echo['authority'],
+                          '127.0.0.1:%d' % self.server.port)
+        self.assertEquals(echo['type'], 'application/json')
+        self.assertEquals(echo['body'], '{"a": 1}')
+
+    def test_multiplexes_requests_on_one_connection(self):
+        self.make(connections=1, delay=0.2)
+        results = self.run_concurrently(10)
+        self.assertEquals(sorted(int(r['body']) for r in results), range(10))
+        self.assertEquals(self.server.connections, 1)
+        self.assertEquals(self.server.max_active, 10)
+
+    def test_caps_concurrent_streams(self):
+        self.make(connections=1, max_streams=3, delay=0.05)
+        results = self.run_concurrently(9)
+        self.assertEquals(len(results), 9)
+        self.assertEquals(self.server.max_active, 3)
+
+    def test_opens_more_connections_when_busy(self):
+        self.make(connections=2, max_streams=2, delay=0.1)
+        self.run_concurrently(4)
+        self.assertEquals(self.server.connections, 2)
+
+    def test_body_larger_than_flow_control_window(self):
+        self.make(window=1000)
+        body = 'x' * 50000
+        echo = json.loads(self.request(body).content)
+        self.assertEquals(echo['body'], body)
+
+    def test_timeout(self):
+        self.make(delay=1.0)
+        self.assertRaises(HTTP2Error, self.request, timeout=0.1)
+        #the connection is still usable afterwards
+        self.server.delay = 0
+        self.assertEquals(self.request().status_code, 200)
+
+    def test_cancel_in_flight_request(self):
+        self.make(delay=2.0)
+        token = CancelToken()
+        timer = threading.Timer(0.1, token.cancel)
+        timer.start()
+        start = time.time()
+        self.assertRaises(CancelledError, self.request, token=token)
+        self.assertTrue(time.time() - start < 1.0)
+        timer.join()
+        #an already cancelled token stops the request right away
+        self.assertRaises(CancelledError, self.request, token=token)
+        self.server.delay = 0
+        self.assertEquals(self.request().status_code, 200)
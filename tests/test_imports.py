@@ -0,0 +1,28 @@
+import sys
+import unittest
+from benchmarks.import_time import measure, slow_modules
+from tempoiq.lazy import LazyModule
+
+
+class TestLazyModule(unittest.TestCase):
+    def test_imports_on_first_use(self):
+        sys.modules.pop('colorsys', None)
+        colorsys = LazyModule('colorsys')
+        self.assertFalse('colorsys' in sys.modules)
+        self.assertEquals(colorsys.rgb_to_hsv(0, 0, 0), (0, 0, 0))
+        self.assertTrue('colorsys' in sys.modules)
+
+    def test_attribute_of_module(self):
+        path = LazyModule('os', 'path')
+        self.assertEquals(path.join('a', 'b'), 'a/b')
+
+    def test_missing_module(self):
+        missing = LazyModule('tempoiq_no_such_module')
+        self.assertRaises(ImportError, getattr, missing, 'anything')
+
+
+class TestImportTime(unittest.TestCase):
+    def test_session_loads_no_slow_dependencies(self):
+        seconds, modules = measure()
+        self.assertEquals(slow_modules(modules), [])
+        self.assertTrue('tempoiq.client' in modules)
@@ -0,0 +1,85 @@
+import time
+import unittest
+import datetime
+from pytz.gae import pytz
+from tempoiq.ingest import IngestBuffer, point_value
+from tempoiq.protocol.point import Point
+from fixtures import DummyWriteClient
+
+
+def stamp(seconds):
+    return datetime.datetime(2015, 1, 1) + datetime.timedelta(seconds=seconds)
+
+
+class TestIngestBuffer(unittest.TestCase):
+    def test_duplicates_are_merged_last_write_wins(self):
+        client = DummyWriteClient()
+        buf = IngestBuffer(client, flush_interval=60)
+        buf.write({'d': {'s': [Point(stamp(2), 1), Point(stamp(1), 1)]}})
+        buf.write({'d': {'s': [Point(stamp(2), 5)]}})
+        buf.write({'d': {'t': [Point(stamp(1), 3)]}})
+        buf.close()
+        self.assertEquals(len(client.writes), 1)
+        points = client.writes[0]['d']['s']
+        self.assertEquals([p.timestamp for p in points], [stamp(1), stamp(2)])
+        self.assertEquals([p.value for p in points], [1, 5])
+        self.assertEquals(len(client.writes[0]['d']['t']), 1)
+        self.assertEquals((buf.received, buf.sent, buf.requests), (4, 3, 1))
+
+    def test_flushes_on_size(self):
+        client = DummyWriteClient()
+        buf = IngestBuffer(client, max_points=3, flush_interval=60)
+        for i in range(7):
+            buf.write({'d': {'s': [Point(stamp(i), i)]}})
+        self.assertEquals(len(client.writes), 2)
+        self.assertEquals(buf.pending_points, 1)
+        buf.close(flush=False)
+        self.assertEquals(len(client.writes), 2)
+
+    def test_flushes_on_time(self):
+        client = DummyWriteClient()
+        buf = IngestBuffer(client, flush_interval=0.01)
+        buf.write({'d': {'s': [Point(stamp(0), 0)]}})
+        deadline = time.time() + 5
+        while not client.writes and time.time() < deadline:
+            time.sleep(0.01)
+        buf.close()
+        self.assertEquals(len(client.writes), 1)
+
+    def test_failures_go_to_on_error(self):
+        errors = []
+        client = DummyWriteClient([500])
+        buf = IngestBuffer(client, flush_interval=60,
+                           on_error=lambda b, r: errors.append((b, r)))
+        buf.write({'d': {'s': [{'t': '2015-01-01T00:00:00Z', 'v': 1}]}})
+        buf.flush()
+        buf.close()
+        self.assertEquals(len(errors), 1)
+        self.assertEquals(errors[0][1].status, 500)
+        self.assertEquals(buf.sent, 0)
+
+    def test_same_instant_in_different_forms_is_merged(self):
+        client = DummyWriteClient()
+        buf = IngestBuffer(client, flush_interval=60)
+        chicago = pytz.timezone('America/Chicago')
+        buf.write({'d': {'s': [Point(stamp(1), 1),
+                               {'t': '2015-01-01T00:00:02Z', 'v': 2}]}})
+        buf.write({'d': {'s': [
+            Point(stamp(1).replace(tzinfo=pytz.utc), 3),
+            Point(chicago.localize(datetime.datetime(2014, 12, 31, 18)), 0),
+            {'t': stamp(2).isoformat() + '+00:00', 'v': 4}]}})
+        buf.close()
+        points = client.writes[0]['d']['s']
+        self.assertEquals([point_value(p) for p in points], [0, 3, 4])
+
+    def test_background_errors_are_raised_later(self):
+        client = DummyWriteClient()
+        client.write = lambda write_request, retries=0: 1 / 0
+        buf = IngestBuffer(client, flush_interval=0.01)
+        buf.write({'d': {'s': [Point(stamp(0), 0)]}})
+        deadline = time.time() + 5
+        while buf.error is None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertRaises(ZeroDivisionError, buf.write,
+                          {'d': {'s': [Point(stamp(1), 1)]}})
+        buf.close(flush=False)
@@ -0,0 +1,105 @@
+import unittest
+import datetime
+from StringIO import StringIO
+from pytz.gae import pytz
+from tempoiq.client import Client
+from tempoiq.latest import LatestCache, cacheable_streams
+from tempoiq.protocol.device import Device
+from tempoiq.protocol.sensor import Sensor
+from tempoiq.protocol.point import Point
+from tempoiq.protocol.row import Row
+from tempoiq.protocol.query.builder import QueryBuilder
+from tempoiq.protocol.query.selection import or_
+from tempoiq.protocol.query.batch import single_operation
+from fixtures import Clock
+
+
+class DummyEndpoint(object):
+    base_url = 'http://example.com/v2/'
+
+
+def latest(*selectors, **kwargs):
+    qb = QueryBuilder(None, Sensor)
+    for selector in selectors:
+        qb.filter(selector)
+    qb.operation = single_operation(kwargs.get('function', 'latest'))
+    return qb
+
+
+def stamp(second):
+    return datetime.datetime(2015, 1, 1, 0, 0, second, tzinfo=pytz.utc)
+
+
+class TestLatestCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock(1000.0)
+        self.cache = LatestCache(max_age=5, clock=self.clock)
+
+    def test_cacheable_streams(self):
+        q = latest(or_([Device.key == 'b', Device.key == 'a']),
+                   Sensor.key == 'temp')
+        self.assertEquals(cacheable_streams(q),
+                          [('a', 'temp'), ('b', 'temp')])
+        q = latest(Device.key == 'a')
+        self.assertEquals(cacheable_streams(q), None)
+        q = latest(Device.key == 'a', Sensor.key == 'temp',
+                   function='earliest')
+        self.assertEquals(cacheable_streams(q), None)
+
+    def test_write_keeps_newest_written_point(self):
+        newest = Point(stamp(3), 3.0)
+        failed = Point(stamp(9), 9.0)
+        request = {'a': {'temp': [Point(stamp(1), 1.0), newest, failed,
+                                  Point(stamp(2), 2.0)]}}
+        self.cache.record_write(request, {'a': {'temp': [failed]}})
+        rows = self.cache.lookup(latest(Device.key == 'a',
+                                        Sensor.key == 'temp'))
+        self.assertEquals([(r.timestamp, r.values) for r in rows],
+                          [(stamp(3), {'a': {'temp': 3.0}})])
+        #an older point doesn't replace a newer one
+        self.cache.record('a', 'temp', stamp(2), 2.0)
+        rows = self.cache.lookup(latest(Device.key == 'a',
+                                        Sensor.key == 'temp'))
+        self.assertEquals(rows[0].values, {'a': {'temp': 3.0}})
+
+    def test_lookup_needs_every_stream_fresh(self):
+        self.cache.record_rows([Row({'t': stamp(1).isoformat(),
+                                     'data': {'a': {'temp': 1.0}}})])
+        self.clock.now += 3
+        self.cache.record('b', 'temp', stamp(2), 2.0)
+        q = latest(or_([Device.key == 'a', Device.key == 'b']),
+                   Sensor.key == 'temp')
+        rows = self.cache.lookup(q)
+        self.assertEquals([r.values for r in rows],
+                          [{'a': {'temp': 1.0}}, {'b': {'temp': 2.0}}])
+        self.clock.now += 3
+        self.assertEquals(self.cache.lookup(q), None)
+        self.assertEquals(self.cache.lookup(
+            latest(Device.key == 'b', Sensor.key == 'temp'))[0].values,
+            {'b': {'temp': 2.0}})
+        self.assertEquals(self.cache.lookup(
+            latest(Device.key == 'c', Sensor.key == 'temp')), None)
+        self.assertEquals((self.cache.hits, self.cache.misses), (2, 2))
+
+    def test_write_of_dict_points(self):
+        request = {'a': {'temp': [{'t': stamp(1), 'v': 1.0},
+                                  {'t': stamp(4).isoformat(), 'v': 4.0}]}}
+        self.cache.record_write(request, {})
+        rows = self.cache.lookup(latest(Device.key == 'a',
+                                        Sensor.key == 'temp'))
+        self.assertEquals([(r.timestamp, r.values) for r in rows],
+                          [(stamp(4), {'a': {'temp': 4.0}})])
+
+    def test_cached_single_reads_like_a_cursor(self):
+        client = Client(DummyEndpoint(), latest_cache=self.cache)
+        self.cache.record('a', 'temp', stamp(1), 1.0)
+        query = client.query(Sensor).filter(Device.key == 'a') \
+            .filter(Sensor.key == 'temp')
+        points = list(query.single('latest').data.iter_points())
+        self.assertEquals(points, [(stamp(1), 'a', 'temp', 1.0)])
+        self.assertEquals([r.values for r in query.single('latest').data],
+                          [{'a': {'temp': 1.0}}])
+        sink = StringIO()
+        self.assertEquals(query.single('latest').data.export(sink), 1)
+        self.assertTrue('temp' in sink.getvalue())
+        self.assertEquals(self.cache.hits, 3)
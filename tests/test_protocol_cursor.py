@@ -1,6 +1,9 @@
 import mock
 import unittest
+import datetime
 from tempoiq.protocol.cursor import DataPointsCursor, DeviceCursor
+from tempoiq.protocol.cursor import merge_cursors
+from tempoiq.protocol.cursor import AlertCursor
 from tempoiq.protocol.cursor import StreamResponseCursor, Page, StreamManager
 
 
@@ -27,6 +30,24 @@ class DummyResponse(object):
         self.links = {}
 
 
+def make_alert_json(alert_id, timestamp):
+    return {
+        'alert_id': alert_id,
+        'rule_key': 'rule-1',
+        'transitions': [
+            {'timestamp': timestamp,
+             'instigator': {
+                 'datapoint': {'t': timestamp, 'v': 1},
+                 'device': {'key': 'key-1', 'name': '', 'attributes': {}},
+                 'sensor': {'key': 'temp', 'name': '', 'attributes': {}}
+             },
+             'transition_to': 'warning',
+             'actions': []
+             }
+        ]
+    }
+
+
 class TestProtocolCursor(unittest.TestCase):
     def test_datapoints_cursor_iteration_with_no_fetch(self):
         first_data = {
@@ -86,6 +107,100 @@ class TestProtocolCursor(unittest.TestCase):
         self.assertEquals(results[0]['test1']['temp'], 1.0)
         self.assertEquals(results[1]['test1']['temp'], 2.0)
 
+    def test_datapoints_cursor_iter_points(self):
+        first_data = {
+            'next_page': {'next_query': None},
+            'data': [
+                {'t': '2014-01-01T00:00:00Z',
+                 'data': {
+                     'test1': {'temp': 1.0}
+                 }
+                 }
+            ]
+        }
+
+        def fetcher(cursor):
+            return {
+                'data': [
+                    {'t': '2014-01-01T00:00:01.500Z',
+                     'data': {
+                         'test1': {'temp': 2.0}
+                     }
+                     }
+                ]
+            }
+        resp = DummyResponse()
+        c = DataPointsCursor(resp, first_data, fetcher)
+        points = list(c.iter_points(epoch=True))
+        self.assertEquals(points, [(1388534400000, 'test1', 'temp', 1.0),
+                                   (1388534401500, 'test1', 'temp', 2.0)])
+        self.assertEquals(list(c), [])
+
+        c = DataPointsCursor(resp, first_data, fetcher)
+        point = list(c.iter_points(named=True))[0]
+        self.assertEquals(point.timestamp.year, 2014)
+        self.assertEquals((point.device, point.sensor, point.value),
+                          ('test1', 'temp', 1.0))
+
+    def test_merge_cursors_aligns_rows_on_timestamp(self):
+        def make_cursor(rows, sensor):
+            pages = [{'data': [{'t': t, 'data': {'test1': {sensor: v}}}]}
+                     for t, v in rows]
+            for page, following in zip(pages, pages[1:]):
+                page['next_page'] = {'next_query': following}
+            return DataPointsCursor(DummyResponse(), pages[0],
+                                    lambda cursor: cursor)
+
+        def merged(fill):
+            raw = make_cursor([('2014-01-01T00:00:00Z', 1.0),
+                               ('2014-01-01T00:00:01Z', 2.0),
+                               ('2014-01-01T00:00:02Z', 3.0)], 'raw')
+            rollup = make_cursor([('2014-01-01T00:00:00Z', 10.0),
+                                  ('2014-01-01T00:00:02Z', 30.0)], 'mean')
+            return list(merge_cursors(raw, rollup, fill=fill))
+
+        rows = merged(None)
+        self.assertEquals([r.timestamp.second for r in rows], [0, 1, 2])
+        self.assertEquals(rows[0].values, [{'test1': {'raw': 1.0}},
+                                           {'test1': {'mean': 10.0}}])
+        self.assertEquals(rows[1].values, [{'test1': {'raw': 2.0}}, {}])
+        self.assertEquals(merged('previous')[1].values[1],
+                          {'test1': {'mean': 10.0}})
+        nan = merged('nan')[1].values[1]['test1']['mean']
+        self.assertTrue(nan != nan)
+        self.assertRaises(ValueError, list,
+                          merge_cursors(fill='zero'))
+
+    def test_datapoints_cursor_projection_applies_to_every_page(self):
+        first_data = {
+            'next_page': {'next_query': None},
+            'data': [
+                {'t': '2014-01-01T00:00:00',
+                 'data': {
+                     'test1': {'temp': 1.0, 'hum': 5.0}
+                 }
+                 }
+            ]
+        }
+
+        def fetcher(cursor):
+            return {
+                'data': [
+                    {'t': '2014-01-02T00:00:00',
+                     'data': {
+                         'test1': {'temp': 2.0, 'hum': 6.0}
+                     }
+                     }
+                ]
+            }
+        resp = DummyResponse()
+        resp.data = first_data
+        c = DataPointsCursor(resp, first_data, fetcher,
+                             project=[('test1', 'hum')])
+        results = [d.values for d in c]
+        self.assertEquals(results, [{'test1': {'hum': 5.0}},
+                                    {'test1': {'hum': 6.0}}])
+
     def test_device_cursor_iteration_with_no_fetch(self):
         first_data = {
             'data': [
@@ -668,3 +783,30 @@ class TestProtocolStreamResponseCursor(unittest.TestCase):
             stream_data.append([s.value for s in stream])
         self.assertEquals(stream_data[0], [1, 2, 3, 4, 5, 6])
         self.assertEquals(stream_data[1], [1, 2, 3, 4, 6])
+
+    def test_alert_cursor_iteration_with_extra_fetch(self):
+        first_data = {
+            'next_page': {'next_query': {'page': 2}},
+            'data': [make_alert_json(1, '2015-01-01T00:00:00.000Z')]
+        }
+
+        def fetcher(cursor):
+            self.assertEquals(cursor, {'page': 2})
+            return {'data': [make_alert_json(2, '2015-01-02T00:00:00.000Z')]}
+
+        c = AlertCursor(DummyResponse(), first_data, fetcher)
+        results = [a for a in c]
+        self.assertEquals([a.id for a in results], [1, 2])
+        self.assertEquals(results[1].transitions[0].instigator.sensor.key,
+                          'temp')
+
+    def test_alert_cursor_applies_time_bounds(self):
+        first_data = {
+            'data': [make_alert_json(1, '2015-01-01T00:00:00.000Z'),
+                     make_alert_json(2, '2015-01-02T00:00:00.000Z'),
+                     make_alert_json(3, '2015-01-03T00:00:00.000Z')]
+        }
+        start = datetime.datetime(2015, 1, 2)
+        end = datetime.datetime(2015, 1, 3)
+        c = AlertCursor(DummyResponse(), first_data, None, start, end)
+        self.assertEquals([a.id for a in c], [2])
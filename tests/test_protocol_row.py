@@ -2,7 +2,7 @@ import unittest
 from pytz.gae import pytz
 import datetime
 from tempoiq.protocol.row import Row, SelectionEvaluator, StreamInfo
-from tempoiq.protocol.row import PointStream
+from tempoiq.protocol.row import PointStream, make_projection
 from tempoiq.protocol.row import NoResultError, TooManyResultsError
 from tempoiq.protocol.query.selection import Selection, or_, and_
 from tempoiq.protocol.device import Device
@@ -93,6 +93,44 @@ class TestRow(unittest.TestCase):
         ]
         self.assertEquals(values, expected)
 
+    def test_row_timestamp_is_parsed_lazily(self):
+        data = {
+            't': 'not a timestamp',
+            'data': {
+                'device-1': {
+                    'sensor-1': 1.0
+                }
+            }
+        }
+
+        row = Row(data)
+        self.assertEquals(row['device-1']['sensor-1'], 1.0)
+        self.assertEquals(row.raw_timestamp, 'not a timestamp')
+        row.raw_timestamp = '2014-01-01T00:00:00Z'
+        first = row.timestamp
+        self.assertTrue(row.timestamp is first)
+
+    def test_row_projection(self):
+        data = {
+            't': '2014-01-01T00:00:00Z',
+            'data': {
+                'device-1': {
+                    'sensor-1': 1.0,
+                    'sensor-2': 2.0
+                },
+                'device-2': {
+                    'sensor-2': 3.0
+                }
+            }
+        }
+
+        projection = make_projection([('device-1', 'sensor-2'),
+                                      ('device-2', 'sensor-1'),
+                                      ('device-3', 'sensor-1')])
+        row = Row(data, projection)
+        self.assertEquals(row.values, {'device-1': {'sensor-2': 2.0}})
+        self.assertEquals(make_projection(None), None)
+
 
 class TestSelectionEvaluator(unittest.TestCase):
     def test_selection_evaluator_with_device_key_selector(self):
@@ -0,0 +1,106 @@
+import json
+import unittest
+from tempoiq.protocol.device import Device
+from tempoiq.protocol.sensor import Sensor
+from tempoiq.protocol.row import Row
+from tempoiq.protocol.query.builder import QueryBuilder
+from tempoiq.protocol.query.selection import or_
+from tempoiq.protocol.query.batch import device_keys, plan_singles
+from tempoiq.protocol.query.batch import split_rows, single_operation
+from tempoiq.protocol.query.batch import single_many
+from tempoiq.response import SensorPointsResponse, SubsetResponse
+from fixtures import DummyResp, DummyReadClient
+
+
+class DummyClient(DummyReadClient):
+    def answer(self, body):
+        if 'building' in body:
+            return SensorPointsResponse(DummyResp(503, 'unavailable'), None,
+                                        None)
+        rows = [{'t': '2015-01-01T00:00:00Z',
+                 'data': {'a': {'temp': 1}, 'b': {'temp': 2}}}]
+        return SensorPointsResponse(
+            DummyResp(200, json.dumps({'data': rows})), None, None)
+
+
+def single(*selectors):
+    qb = QueryBuilder(None, Sensor)
+    for selector in selectors:
+        qb.filter(selector)
+    qb.operation = single_operation('latest')
+    return qb
+
+
+class TestBatchSingles(unittest.TestCase):
+    def test_device_keys(self):
+        self.assertEquals(device_keys(single(Device.key == 'a')),
+                          frozenset(['a']))
+        q = single(or_([Device.key == 'a', Device.key == 'b']))
+        self.assertEquals(device_keys(q), frozenset(['a', 'b']))
+        q = single(Device.attributes['building'] == '1')
+        self.assertEquals(device_keys(q), None)
+        self.assertEquals(device_keys(single(Sensor.key == 'temp')), None)
+
+    def test_plan_merges_compatible_queries(self):
+        queries = [
+            single(Device.key == 'a', Sensor.key == 'temp'),
+            single(Device.attributes['building'] == '1'),
+            single(Device.key == 'b', Sensor.key == 'temp'),
+            single(Device.key == 'c', Sensor.key == 'humidity'),
+            single(or_([Device.key == 'c', Device.key == 'd']),
+                   Sensor.key == 'temp'),
+        ]
+        groups = plan_singles(queries)
+        self.assertEquals(len(groups), 3)
+        merged = groups[0]
+        self.assertTrue(merged.merged)
+        self.assertEquals([i for i, keys in merged.members], [0, 2, 4])
+        self.assertEquals(device_keys(merged.query),
+                          frozenset(['a', 'b', 'c', 'd']))
+        self.assertEquals(
+            merged.query.selection['sensors'].selection.value, 'temp')
+        #the input query is left alone
+        self.assertEquals(device_keys(queries[0]), frozenset(['a']))
+        self.assertEquals(groups[1].members, [(1, None)])
+        self.assertTrue(groups[1].query is queries[1])
+        self.assertEquals(groups[2].members, [(3, None)])
+        self.assertFalse(groups[2].merged)
+
+    def test_plan_caps_keys_per_request(self):
+        queries = [single(Device.key == k) for k in 'abcde']
+        groups = plan_singles(queries, max_keys=2)
+        self.assertEquals([[i for i, k in g.members] for g in groups],
+                          [[0, 1], [2, 3], [4]])
+
+    def test_split_rows(self):
+        rows = [Row({'t': '2015-01-01T00:00:00Z',
+                     'data': {'a': {'temp': 1}, 'b': {'temp': 2}}}),
+                Row({'t': '2015-01-01T00:00:01Z',
+                     'data': {'b': {'temp': 3}}})]
+        kept = split_rows(rows, frozenset(['a']))
+        self.assertEquals(len(kept), 1)
+        self.assertEquals(kept[0].values, {'a': {'temp': 1}})
+        self.assertEquals(kept[0].raw_timestamp, '2015-01-01T00:00:00Z')
+
+    def test_single_many_maps_results_back(self):
+        client = DummyClient()
+        queries = [QueryBuilder(client, Sensor).filter(Device.key == 'a'),
+                   QueryBuilder(client, Sensor).filter(
+                       Device.attributes['building'] == '1'),
+                   QueryBuilder(client, Sensor).filter(Device.key == 'b')]
+        result = single_many(client, queries, 'latest', retries=0)
+        self.assertEquals(len(client.bodies), 2)
+        self.assertEquals(sorted(result.succeeded), [0, 2])
+        self.assertEquals(sorted(result.failed), [1])
+        self.assertTrue(isinstance(result.succeeded[0], SubsetResponse))
+        self.assertEquals([r.values for r in result.succeeded[0].data],
+                          [{'a': {'temp': 1}}])
+        self.assertEquals([r.values for r in result.succeeded[2].data],
+                          [{'b': {'temp': 2}}])
+
+    def test_single_many_leaves_queries_alone(self):
+        client = DummyClient()
+        queries = [QueryBuilder(client, Sensor).filter(Device.key == k)
+                   for k in 'ab']
+        single_many(client, queries, 'latest', retries=0)
+        self.assertEquals([q.operation for q in queries], [None, None])
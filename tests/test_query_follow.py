@@ -0,0 +1,151 @@
+import json
+import unittest
+import datetime
+import threading
+from pytz.gae import pytz
+from tempoiq.temporal.validate import convert_iso_stamp
+from tempoiq.protocol.cursor import DataPointsCursor
+from tempoiq.protocol.sensor import Sensor
+from tempoiq.protocol.query.builder import QueryBuilder
+from tempoiq.response import ResponseException, SUCCESS, FAILURE
+from fixtures import DummyReadClient
+
+
+class DummyReadResponse(object):
+    def __init__(self, status, rows=()):
+        self.status = status
+        self.successful = SUCCESS if status == 200 else FAILURE
+        self.data = DataPointsCursor(self, {'data': list(rows)}, None)
+
+
+class FailingCursor(object):
+    #yields the points of one page, then fails fetching the next
+    def __init__(self, cursor, error):
+        self.cursor = cursor
+        self.error = error
+
+    def iter_points(self, named=False):
+        for point in self.cursor.iter_points(named=named):
+            yield point
+        raise self.error
+
+
+class DummyClient(DummyReadClient):
+    def __init__(self, polls, gate=None):
+        DummyReadClient.__init__(self)
+        self.polls = list(polls)
+        self.starts = []
+        self.gate = gate
+
+    def answer(self, body):
+        if self.gate is not None:
+            self.gate.wait()
+        self.starts.append(convert_iso_stamp(json.loads(body)['read']['start']))
+        poll = self.polls.pop(0) if self.polls else 200
+        if isinstance(poll, Exception):
+            raise poll
+        if isinstance(poll, int):
+            return DummyReadResponse(poll)
+        if isinstance(poll, tuple):
+            rows, error = poll
+            response = DummyReadResponse(200, rows)
+            response.data = FailingCursor(response.data, error)
+            return response
+        return DummyReadResponse(200, poll)
+
+
+def row(second, **values):
+    t = datetime.datetime(2015, 1, 1, 0, 0, second, tzinfo=pytz.utc)
+    return {'t': t.isoformat(), 'data': {'d': values}}
+
+
+class TestFollower(unittest.TestCase):
+    def setUp(self):
+        self.start = datetime.datetime(2015, 1, 1, tzinfo=pytz.utc)
+
+    def test_poll_dedups_and_advances(self):
+        client = DummyClient([
+            [row(1, a=1.0), row(2, a=2.0, b=5.0)],
+            [row(2, a=2.0, b=5.0), row(3, b=6.0)],
+        ])
+        follower = QueryBuilder(client, Sensor).follow(self.start)
+        first = follower.poll()
+        self.assertEquals([(p.sensor, p.value) for p in first],
+                          [('a', 1.0), ('a', 2.0), ('b', 5.0)])
+        second = follower.poll()
+        self.assertEquals([(p.sensor, p.value) for p in second],
+                          [('b', 6.0)])
+        self.assertEquals(client.starts[0], self.start)
+        self.assertEquals(client.starts[1], second[0].timestamp -
+                          datetime.timedelta(seconds=1))
+
+    def test_interval_backs_off_when_idle(self):
+        client = DummyClient([[], 503, IOError('timeout'), [row(1, a=1.0)]])
+        follower = QueryBuilder(client, Sensor).follow(
+            self.start, min_interval=1, max_interval=5)
+        intervals = []
+        for i in range(4):
+            follower.poll()
+            intervals.append(follower.interval)
+        self.assertEquals(intervals, [2, 4, 5, 1])
+        self.assertTrue(isinstance(follower.last_error, IOError))
+
+    def test_failed_page_is_read_again(self):
+        client = DummyClient([
+            ([row(1, a=1.0)], IOError('page')),
+            [row(1, a=1.0), row(2, a=2.0)],
+        ])
+        follower = QueryBuilder(client, Sensor).follow(self.start)
+        self.assertEquals(follower.poll(), [])
+        self.assertTrue(isinstance(follower.last_error, IOError))
+        self.assertEquals(follower.watermark, self.start)
+        self.assertEquals([p.value for p in follower.poll()], [1.0, 2.0])
+        self.assertEquals(client.starts, [self.start, self.start])
+
+    def test_client_errors_raise(self):
+        client = DummyClient([403])
+        follower = QueryBuilder(client, Sensor).tail()
+        self.assertRaises(ResponseException, follower.poll)
+
+    def test_subscribers_share_one_poll_loop(self):
+        #the first poll waits for both subscribers, so neither misses it
+        gate = threading.Event()
+        client = DummyClient([[row(1, a=1.0), row(2, a=2.0)]], gate)
+        follower = QueryBuilder(client, Sensor).follow(
+            self.start, min_interval=0.01, max_interval=0.01)
+        one = follower.subscribe()
+        two = follower.subscribe()
+        gate.set()
+        self.assertEquals([one.next().value, one.next().value], [1.0, 2.0])
+        self.assertEquals([two.next().value, two.next().value], [1.0, 2.0])
+        follower.close()
+        self.assertEquals(list(one), [])
+        self.assertEquals(list(two), [])
+
+    def test_polls_only_change_the_time_range(self):
+        client = DummyClient([[row(1, a=1.0)], []])
+        query = QueryBuilder(client, Sensor)
+        follower = query.follow(self.start)
+        query.rollup('max', 'PT1M')
+        follower.poll()
+        follower.poll()
+        first, second = [json.loads(b) for b in client.bodies]
+        self.assertFalse('pipeline' in first)
+        del first['read'], second['read']
+        self.assertEquals(first, second)
+
+    def test_subscribe_after_the_loop_ended(self):
+        client = DummyClient([403])
+        follower = QueryBuilder(client, Sensor).tail(min_interval=0.01)
+        self.assertEquals(list(follower.subscribe()), [])
+        self.assertTrue(isinstance(follower.last_error, ResponseException))
+        self.assertEquals(list(follower.subscribe()), [])
+
+    def test_direct_iteration(self):
+        client = DummyClient([[row(1, a=1.0)]])
+        follower = QueryBuilder(client, Sensor).follow(
+            self.start, min_interval=0, max_interval=0)
+        it = iter(follower)
+        self.assertEquals(it.next().value, 1.0)
+        follower.close()
+        self.assertEquals(list(it), [])
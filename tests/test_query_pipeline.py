@@ -0,0 +1,102 @@
+import unittest
+import datetime
+from tempoiq.protocol.point import Point
+from tempoiq.protocol.row import Row
+from tempoiq.protocol.sensor import Sensor
+from tempoiq.protocol.query.builder import QueryBuilder
+from tempoiq.protocol.query.functions import Rollup, Interpolation
+from tempoiq.protocol.query.pipeline import LocalPipeline, parse_period
+from tempoiq.protocol.query.pipeline import to_rows
+
+
+def make_streams():
+    base = datetime.datetime(2015, 1, 1)
+    points = [Point(base + datetime.timedelta(minutes=15 * i), float(i))
+              for i in range(8)]
+    return {('dev1', 'temp'): points}
+
+
+class TestLocalPipeline(unittest.TestCase):
+    def setUp(self):
+        self.start = datetime.datetime(2015, 1, 1)
+        self.end = datetime.datetime(2015, 1, 1, 2)
+
+    def test_parse_period(self):
+        self.assertEquals(parse_period('PT1H'), datetime.timedelta(hours=1))
+        self.assertEquals(parse_period('P1DT30M'),
+                          datetime.timedelta(days=1, minutes=30))
+        self.assertEquals(parse_period('PT1.5S'),
+                          datetime.timedelta(seconds=1.5))
+
+    def test_parse_period_rejects_calendar_periods(self):
+        self.assertRaises(ValueError, parse_period, 'P1M')
+        self.assertRaises(ValueError, parse_period, 'P1Y')
+        self.assertRaises(ValueError, parse_period, 'foo')
+
+    def test_rollup(self):
+        pipeline = LocalPipeline([Rollup('mean', 'PT1H', None)])
+        result = pipeline.run(make_streams(), self.start, self.end)
+        points = result[('dev1', 'temp')]
+        self.assertEquals([p.value for p in points], [1.5, 5.5])
+        self.assertEquals(points[1].timestamp.hour, 1)
+
+    def test_rollup_aligned_on_start(self):
+        start = datetime.datetime(2015, 1, 1, 0, 30)
+        pipeline = LocalPipeline([Rollup('count', 'PT1H', start)])
+        result = pipeline.run(make_streams(), self.start, self.end)
+        self.assertEquals([p.value for p in result[('dev1', 'temp')]],
+                          [2, 4, 2])
+
+    def test_zoh_and_linear_interpolation(self):
+        zoh = LocalPipeline([Interpolation('zoh', 'PT10M', None, None)])
+        result = zoh.run(make_streams(), self.start, self.start +
+                         datetime.timedelta(minutes=40))
+        self.assertEquals([p.value for p in result[('dev1', 'temp')]],
+                          [0.0, 0.0, 1.0, 2.0])
+
+        linear = LocalPipeline([Interpolation('linear', 'PT10M', None,
+                                              None)])
+        result = linear.run(make_streams(), self.start, self.start +
+                            datetime.timedelta(minutes=40))
+        values = [round(p.value, 3) for p in result[('dev1', 'temp')]]
+        self.assertEquals(values, [0.0, 0.667, 1.333, 2.0])
+
+    def test_query_builder_compute_from_rows(self):
+        rows = [Row({'t': '2015-01-01T00:00:00Z',
+                     'data': {'dev1': {'temp': 1.0}, 'dev2': {'temp': 3.0}}}),
+                Row({'t': '2015-01-01T00:30:00Z',
+                     'data': {'dev1': {'temp': 2.0}}})]
+        qb = QueryBuilder(None, Sensor)
+        qb.rollup('max', 'PT1H').aggregate('sum')
+        result = qb.compute(rows, self.start, self.end)
+        self.assertEquals([p.value for p in result[('aggregation', 'sum')]],
+                          [5.0])
+
+    def test_multi_rollup_and_timezone(self):
+        qb = QueryBuilder(None, Sensor)
+        qb.multi_rollup(['min', 'max'], 'PT2H').convert_timezone(
+            'America/Chicago')
+        result = qb.compute(make_streams(), self.start, self.end)
+        point = result[('dev1', 'temp')][0]
+        self.assertEquals(point.value, {'min': 0.0, 'max': 7.0})
+        self.assertEquals(point.timestamp.hour, 18)
+
+    def test_rollup_after_timezone_follows_local_days(self):
+        #clocks in Chicago go forward on 2015-03-08, a 23 hour day
+        midnight = datetime.datetime(2015, 3, 7, 6)
+        stamps = [midnight + datetime.timedelta(hours=h)
+                  for h in (1, 25, 47.5, 48.5)]
+        streams = {('dev1', 'temp'): [Point(t, 1.0) for t in stamps]}
+        qb = QueryBuilder(None, Sensor)
+        qb.convert_timezone('America/Chicago').rollup('count', 'P1D')
+        result = qb.compute(streams, midnight,
+                            midnight + datetime.timedelta(days=3))
+        points = result[('dev1', 'temp')]
+        self.assertEquals([p.value for p in points], [1, 1, 2])
+        self.assertEquals([(p.timestamp.day, p.timestamp.hour)
+                           for p in points], [(7, 0), (8, 0), (9, 0)])
+
+    def test_to_rows(self):
+        rows = to_rows(make_streams())
+        self.assertEquals(len(rows), 8)
+        self.assertEquals(rows[1]['dev1']['temp'], 1.0)
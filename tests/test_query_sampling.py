@@ -0,0 +1,142 @@
+import unittest
+import datetime
+from tempoiq.protocol.row import Row
+from tempoiq.protocol.sensor import Sensor
+from tempoiq.protocol.query.builder import QueryBuilder
+from tempoiq.protocol.query.functions import Rollup
+from tempoiq.protocol.query.sampling import choose_period, lttb
+from tempoiq.protocol.query.sampling import SampledCursor
+from fixtures import DummyReadClient
+
+
+class DummyReadResponse(object):
+    def __init__(self, rows):
+        self.data = rows
+
+
+class DummyClient(DummyReadClient):
+    def __init__(self, rows=None):
+        DummyReadClient.__init__(self)
+        self.rows = rows or []
+        self.pipelines = []
+
+    def read(self, query, **kwargs):
+        self.pipelines.append(list(query.pipeline))
+        return DummyReadClient.read(self, query, **kwargs)
+
+    def answer(self, body):
+        return DummyReadResponse(self.rows)
+
+
+def make_rows(start, values, step=datetime.timedelta(seconds=1)):
+    rows = []
+    for i, v in enumerate(values):
+        t = start + step * i
+        rows.append(Row({'t': t.isoformat(), 'data': v}))
+    return rows
+
+
+class TestSampling(unittest.TestCase):
+    def setUp(self):
+        self.start = datetime.datetime(2015, 1, 1)
+        self.end = datetime.datetime(2015, 1, 2)
+
+    def test_choose_period(self):
+        self.assertEquals(choose_period(self.start, self.end, 24), 'PT1H')
+        self.assertEquals(choose_period(self.start, self.end, 1000), 'PT2M')
+        self.assertEquals(choose_period(self.start, self.end, 10 ** 6),
+                          'PT1S')
+        later = self.start + datetime.timedelta(days=60)
+        self.assertEquals(choose_period(self.start, later, 1), 'P9W')
+
+    def test_lttb_keeps_ends_and_spikes(self):
+        values = [0.0] * 100
+        values[42] = 50.0
+        rows = make_rows(self.start, [{'d': {'s': v}} for v in values])
+        end = self.start + datetime.timedelta(seconds=100)
+        sampled = list(lttb(rows, self.start, end, 10))
+        self.assertTrue(len(sampled) <= 10)
+        stamps = [r.timestamp for r in sampled]
+        self.assertEquals(stamps, sorted(stamps))
+        self.assertEquals(sampled[0].timestamp, rows[0].timestamp)
+        self.assertEquals(sampled[-1].timestamp, rows[-1].timestamp)
+        self.assertTrue(50.0 in [r['d']['s'] for r in sampled])
+
+    def test_lttb_orders_rows_across_streams(self):
+        values = []
+        for i in range(60):
+            v = {'d': {'a': float(i % 7)}}
+            if i >= 5:
+                v['d']['b'] = float(i % 3)
+            values.append(v)
+        rows = make_rows(self.start, values)
+        end = self.start + datetime.timedelta(seconds=60)
+        sampled = list(lttb(rows, self.start, end, 8))
+        stamps = [r.timestamp for r in sampled]
+        self.assertEquals(stamps, sorted(stamps))
+        counts = {}
+        for r in sampled:
+            for key, v in r:
+                counts[key] = counts.get(key, 0) + 1
+        self.assertTrue(all(n <= 8 for n in counts.values()))
+        self.assertEquals(sorted(counts), [('d', 'a'), ('d', 'b')])
+
+    def test_lttb_keeps_time_order_when_a_stream_stops_early(self):
+        values = [{'a': {'s': float(i % 7)}, 'b': {'s': float(i % 5)}}
+                  if i < 20 else {'b': {'s': float(i % 5)}}
+                  for i in range(100)]
+        rows = make_rows(self.start, values, datetime.timedelta(minutes=1))
+        end = self.start + datetime.timedelta(minutes=100)
+        sampled = list(lttb(rows, self.start, end, 12))
+        stamps = [r.timestamp for r in sampled]
+        self.assertEquals(stamps, sorted(stamps))
+        a = [r.timestamp for r in sampled if 'a' in r.values]
+        self.assertEquals(a[-1], self.start + datetime.timedelta(minutes=19))
+        self.assertEquals(sampled[-1].timestamp,
+                          self.start + datetime.timedelta(minutes=99))
+
+    def test_lttb_rejects_small_max_points(self):
+        self.assertRaises(ValueError, list, lttb([], self.start, self.end, 2))
+
+    def test_read_with_max_points_adds_rollup(self):
+        client = DummyClient()
+        qb = QueryBuilder(client, Sensor)
+        qb.read(start=self.start, end=self.end, max_points=24)
+        rollup, = client.pipelines[0]
+        self.assertTrue(isinstance(rollup, Rollup))
+        self.assertEquals(rollup.args, ['mean', 'PT1H', self.start])
+        self.assertEquals(qb.pipeline, [])
+
+    def test_repeated_reads_sample_their_own_range(self):
+        client = DummyClient()
+        qb = QueryBuilder(client, Sensor)
+        later = self.end + datetime.timedelta(days=2)
+        qb.read(start=self.start, end=self.end, max_points=24)
+        qb.read(start=self.end, end=later, max_points=24)
+        first, = client.pipelines[0]
+        second, = client.pipelines[1]
+        self.assertEquals(first.args, ['mean', 'PT1H', self.start])
+        self.assertEquals(second.args, ['mean', 'PT2H', self.end])
+
+    def test_repeated_reads_fill_in_their_own_start(self):
+        client = DummyClient()
+        qb = QueryBuilder(client, Sensor).rollup('max', 'PT1M')
+        qb.read(start=self.start, end=self.end, max_points=24)
+        qb.read(start=self.end, end=self.end + datetime.timedelta(days=1))
+        first, = client.pipelines[0]
+        second, = client.pipelines[1]
+        self.assertEquals(first.args, ['max', 'PT1M', self.start])
+        self.assertEquals(second.args, ['max', 'PT1M', self.end])
+        self.assertEquals(qb.pipeline[0].args, ['max', 'PT1M', None])
+
+    def test_read_with_lttb_sampling_wraps_cursor(self):
+        client = DummyClient(make_rows(self.start,
+                                       [{'d': {'s': 1.0}}] * 10))
+        qb = QueryBuilder(client, Sensor)
+        response = qb.read(start=self.start, end=self.end, max_points=5,
+                           sampling='lttb')
+        self.assertTrue(isinstance(response.data, SampledCursor))
+        self.assertEquals(qb.pipeline, [])
+        self.assertTrue(len(list(response.data)) <= 5)
+        self.assertRaises(ValueError, qb.read, start=self.start,
+                          end=self.end, max_points=5, sampling='random')
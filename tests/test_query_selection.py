@@ -2,7 +2,7 @@ import unittest
 from tempoiq.protocol.device import Device
 from tempoiq.protocol.sensor import Sensor
 from tempoiq.protocol.query.selection import Selection, AndClause, \
-    ScalarSelector, and_, or_
+    ScalarSelector, OrClause, and_, or_, normalize
 
 
 class TestSelectionAPI(unittest.TestCase):
@@ -66,3 +66,25 @@ class TestSelectionObjects(unittest.TestCase):
         selectors = [Sensor.key == 'foo', Sensor.key == 'bar']
         clause = or_(selectors)
         self.assertEquals(clause.selection_type, 'sensors')
+
+    def test_normalize_flattens_and_sorts(self):
+        inner = and_([Device.key == 'b', Device.attributes['x'] == 1])
+        selector = and_([inner, Device.key == 'a'])
+        normalized = normalize(selector)
+        self.assertTrue(isinstance(normalized, AndClause))
+        self.assertEquals(len(normalized.selectors), 3)
+        self.assertEquals([s.key for s in normalized.selectors],
+                          ['attributes', 'key', 'key'])
+        self.assertEquals(normalized.selectors[1].value, 'a')
+        self.assertEquals(len(selector.selectors), 2)
+
+    def test_normalize_keeps_mixed_clauses_nested(self):
+        either = or_([Device.key == 'b', Device.key == 'a'])
+        normalized = normalize(and_([either, Device.name == 'n']))
+        self.assertTrue(isinstance(normalized.selectors[1], OrClause))
+        self.assertEquals(normalized.selectors[1].selectors[0].value, 'a')
+
+    def test_normalize_drops_duplicates_and_unwraps(self):
+        normalized = normalize(or_([Device.key == 'a', Device.key == 'a']))
+        self.assertTrue(isinstance(normalized, ScalarSelector))
+        self.assertEquals(normalized.value, 'a')
@@ -0,0 +1,85 @@
+import datetime
+import unittest
+import pytz
+from tempoiq.protocol.device import Device
+from tempoiq.protocol.sensor import Sensor
+from tempoiq.protocol.query.builder import QueryBuilder
+from tempoiq.protocol.query.selection import or_
+from tempoiq.protocol.query.template import PreparedQuery, RANGEMSG
+from fixtures import DummyReadClient
+
+
+def sensors(client):
+    qb = QueryBuilder(client, Sensor)
+    qb.filter(or_([Device.key == 'b', Device.key == 'a']))
+    qb.filter(Sensor.key == 'temp')
+    return qb
+
+
+class TestPreparedQuery(unittest.TestCase):
+    def setUp(self):
+        self.client = DummyReadClient()
+        self.start = datetime.datetime(2015, 1, 1, tzinfo=pytz.utc)
+        self.end = datetime.datetime(2015, 1, 2, tzinfo=pytz.utc)
+
+    def assertSameBody(self, make, **kwargs):
+        make(self.client).read(start=self.start, end=self.end, **kwargs)
+        make(self.client).prepare().read(self.start, self.end,
+                                         kwargs.get('limit'))
+        expected, prepared = self.client.bodies
+        self.assertEquals(prepared, expected)
+
+    def test_plain_read(self):
+        self.assertSameBody(sensors)
+
+    def test_read_with_limit(self):
+        self.assertSameBody(sensors, limit=100)
+
+    def test_pipeline_starts_default_to_read_range(self):
+        def make(client):
+            return sensors(client).rollup('max', '1min') \
+                .interpolate('linear', '10s').aggregate('mean')
+        self.assertSameBody(make)
+
+    def test_explicit_rollup_start_is_kept(self):
+        rollup_start = datetime.datetime(2014, 12, 31, tzinfo=pytz.utc)
+
+        def make(client):
+            return sensors(client).rollup('max', '1min', rollup_start)
+        self.assertSameBody(make)
+        self.assertTrue(rollup_start.isoformat() in self.client.bodies[1])
+
+    def test_each_read_fills_its_range(self):
+        prepared = sensors(self.client).rollup('max', '1min').prepare()
+        later = self.end + datetime.timedelta(days=1)
+        prepared.read(self.start, self.end)
+        prepared.read(self.end, later, timeout=5)
+        first, second = self.client.bodies
+        self.assertTrue(self.start.isoformat() in first)
+        self.assertFalse(later.isoformat() in first)
+        self.assertTrue(later.isoformat() in second)
+        self.assertFalse(self.start.isoformat() in second)
+        self.assertEquals(self.client.options[1]['timeout'], 5)
+
+    def test_later_changes_to_query_are_ignored(self):
+        qb = sensors(self.client)
+        prepared = qb.prepare()
+        qb.filter(Device.key == 'c')
+        qb.rollup('max', '1min')
+        prepared.read(self.start, self.end, 10)
+        self.assertFalse('"c"' in self.client.bodies[0])
+        self.assertFalse('rollup' in self.client.bodies[0])
+
+    def test_rollup_needs_range(self):
+        prepared = sensors(self.client).rollup('max', '1min').prepare()
+        try:
+            prepared.read(self.start, None)
+        except ValueError, e:
+            self.assertEquals(str(e), RANGEMSG)
+        else:
+            self.fail('ValueError not raised')
+
+    def test_only_sensor_reads(self):
+        self.assertRaises(TypeError, QueryBuilder(None, Device).prepare)
+        self.assertRaises(TypeError, PreparedQuery,
+                          QueryBuilder(None, Device))
@@ -0,0 +1,88 @@
+import random
+import unittest
+import datetime
+from tempoiq.protocol.row import Row
+from tempoiq.protocol.query.window import tumbling, sliding, WindowState
+
+
+def make_rows(start, values, step=datetime.timedelta(minutes=1)):
+    return [Row({'t': (start + step * i).isoformat(), 'data': v})
+            for i, v in enumerate(values)]
+
+
+class TestWindows(unittest.TestCase):
+    def setUp(self):
+        self.start = datetime.datetime(2015, 1, 1)
+
+    def test_tumbling_windows(self):
+        rows = make_rows(self.start, [{'d': {'s': float(i), 'x': 'on'}}
+                                      for i in range(7)])
+        result = list(tumbling(rows, 'PT3M', 'sum'))
+        self.assertEquals([r['d']['s'] for r in result], [3.0, 12.0, 6.0])
+        self.assertEquals([r.timestamp.minute for r in result], [0, 3, 6])
+        self.assertEquals(result[0].values, {'d': {'s': 3.0}})
+
+    def test_tumbling_rate_and_alignment(self):
+        rows = make_rows(self.start, [{'d': {'s': float(i * 60)}}
+                                      for i in range(4)])
+        start = self.start + datetime.timedelta(minutes=1)
+        result = list(tumbling(rows, 'PT2M', 'rate', start=start))
+        #the windows at 0:59 and 0:03 hold a single point, so have no rate
+        self.assertEquals([r.timestamp.minute for r in result], [1])
+        self.assertEquals(result[0]['d']['s'], 1.0)
+
+    def test_sliding_min_max_match_brute_force(self):
+        values = [random.random() for i in range(200)]
+        rows = make_rows(self.start, [{'d': {'s': v}} for v in values])
+        for function, expected in (('min', min), ('max', max),
+                                   ('count', len)):
+            result = [r['d']['s'] for r in sliding(rows, 'PT5M', function)]
+            brute = [expected(values[max(0, i - 4):i + 1])
+                     for i in range(len(values))]
+            self.assertEquals(result, brute)
+
+    def test_sliding_mean_and_stddev(self):
+        rows = make_rows(self.start, [{'d': {'s': v}}
+                                      for v in [2.0, 4.0, 4.0, 4.0, 6.0]])
+        means = [r['d']['s'] for r in sliding(rows, 'PT2M', 'mean')]
+        self.assertEquals(means, [2.0, 3.0, 4.0, 4.0, 5.0])
+        stddevs = [r['d']['s'] for r in sliding(rows, 'PT2M', 'stddev')]
+        self.assertAlmostEquals(stddevs[1], 1.0)
+        self.assertAlmostEquals(stddevs[3], 0.0)
+
+    def test_sliding_stddev_stays_accurate(self):
+        values = [1e9 + random.random() for i in range(2000)]
+        rows = make_rows(self.start, [{'d': {'s': v}} for v in values])
+        result = [r['d']['s'] for r in sliding(rows, 'PT10M', 'stddev')]
+        for i in (500, 1000, 1999):
+            window = values[i - 9:i + 1]
+            mean = sum(window) / len(window)
+            brute = (sum((v - mean) ** 2 for v in window) / len(window)) ** 0.5
+            self.assertAlmostEquals(result[i], brute, places=4)
+
+    def test_tumbling_state_keeps_no_deques(self):
+        state = WindowState()
+        for i in range(100):
+            state.add(i, float(i % 10))
+        self.assertEquals((len(state.mins), len(state.maxes)), (0, 0))
+        self.assertEquals((state.value('min'), state.value('max')),
+                          (0.0, 9.0))
+        self.assertEquals(state.value('range'), 9.0)
+
+    def test_sliding_rate_of_a_single_point_is_dropped(self):
+        rows = make_rows(self.start, [{'d': {'s': 1.0}}, {'d': {'s': 3.0}}],
+                         datetime.timedelta(minutes=10))
+        result = list(sliding(rows, 'PT5M', 'rate'))
+        self.assertEquals(result, [])
+
+    def test_window_state_holds_only_the_window(self):
+        state = WindowState(sliding=True)
+        for i in range(100):
+            state.add(i, float(i))
+            state.evict(i - 10)
+        self.assertEquals(len(state.points), 10)
+        self.assertEquals(state.value('first'), 90.0)
+        self.assertEquals(state.value('range'), 9.0)
+
+    def test_invalid_function(self):
+        self.assertRaises(ValueError, list, tumbling([], 'PT1M', 'median'))
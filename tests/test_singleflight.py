@@ -0,0 +1,60 @@
+import unittest
+import threading
+from tempoiq.singleflight import SingleFlight
+
+
+class CountingEvent(object):
+    def __init__(self, event):
+        self.event = event
+        self.waiters = 0
+
+    def wait(self):
+        self.waiters += 1
+        self.event.wait()
+
+    def set(self):
+        self.event.set()
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_one_result(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def fn():
+            calls.append(1)
+            release.wait()
+            return object()
+
+        def caller():
+            results.append(flight.do('key', fn))
+
+        leader = threading.Thread(target=caller)
+        leader.start()
+        while 'key' not in flight.calls:
+            pass
+        waiting = CountingEvent(flight.calls['key'].event)
+        flight.calls['key'].event = waiting
+        followers = [threading.Thread(target=caller) for i in range(4)]
+        for t in followers:
+            t.start()
+        while waiting.waiters < 4:
+            pass
+        release.set()
+        for t in [leader] + followers:
+            t.join()
+        self.assertEquals(len(calls), 1)
+        self.assertEquals(len(results), 5)
+        self.assertEquals(len(set(id(r) for r in results)), 1)
+        self.assertEquals(flight.calls, {})
+
+    def test_errors_are_raised_and_not_remembered(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError('boom')
+
+        self.assertRaises(ValueError, flight.do, 'key', fail)
+        self.assertEquals(flight.do('key', lambda: 1), 1)
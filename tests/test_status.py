@@ -0,0 +1,74 @@
+import json
+import unittest
+from tempoiq.protocol.status import WriteFailure, select_failed_points
+from tempoiq.response import WriteResponse, SUCCESS, FAILURE, PARTIAL
+from fixtures import DummyResp
+
+
+def make_request():
+    return {
+        'device1': {'sensor1': [1, 2, 3], 'sensor2': [4, 5]},
+        'device2': {'sensor1': [6]}
+    }
+
+
+class TestSelectFailedPoints(unittest.TestCase):
+    def test_select_whole_device(self):
+        failed = select_failed_points(make_request(),
+                                      [WriteFailure('device1')])
+        self.assertEquals(failed, {'device1': {'sensor1': [1, 2, 3],
+                                               'sensor2': [4, 5]}})
+
+    def test_select_points_keeps_order(self):
+        failures = [WriteFailure('device1', 'sensor1', [2]),
+                    WriteFailure('device1', 'sensor1', [0, 7]),
+                    WriteFailure('device2', 'sensor1')]
+        failed = select_failed_points(make_request(), failures)
+        self.assertEquals(failed, {'device1': {'sensor1': [1, 3]},
+                                   'device2': {'sensor1': [6]}})
+
+    def test_whole_sensor_wins_over_indices(self):
+        failures = [WriteFailure('device1', 'sensor2'),
+                    WriteFailure('device1', 'sensor2', [1])]
+        failed = select_failed_points(make_request(), failures)
+        self.assertEquals(failed, {'device1': {'sensor2': [4, 5]}})
+
+    def test_unknown_keys_are_ignored(self):
+        failures = [WriteFailure('device3'),
+                    WriteFailure('device1', 'sensor3', [0])]
+        self.assertEquals(select_failed_points(make_request(), failures), {})
+
+
+class TestWriteResponse(unittest.TestCase):
+    def test_success_has_nothing_unwritten(self):
+        r = WriteResponse(DummyResp(200), None, make_request())
+        self.assertEquals(r.successful, SUCCESS)
+        self.assertEquals(r.failures, [])
+        self.assertEquals(r.unwritten, {})
+
+    def test_failure_leaves_everything_unwritten(self):
+        r = WriteResponse(DummyResp(503, 'unavailable'), None,
+                          make_request())
+        self.assertEquals(r.successful, FAILURE)
+        self.assertEquals(r.unwritten, make_request())
+
+    def test_partial_selects_failed_points(self):
+        body = json.dumps({
+            'device1': {'success': False,
+                        'sensors': {'sensor2': {'success': False,
+                                                'points': [1]}}},
+            'device2': {'success': True}
+        })
+        r = WriteResponse(DummyResp(207, body), None, make_request())
+        self.assertEquals(r.successful, PARTIAL)
+        self.assertEquals(r.unwritten, {'device1': {'sensor2': [5]}})
+
+    def test_undecodable_partial_treats_everything_as_failed(self):
+        r = WriteResponse(DummyResp(207, 'not json'), None,
+                          make_request())
+        self.assertEquals(r.unwritten, make_request())
+
+    def test_unknown_request_has_no_unwritten_points(self):
+        r = WriteResponse(DummyResp(500, 'error'), None, None)
+        self.assertEquals(r.successful, FAILURE)
+        self.assertEquals(r.unwritten, None)
@@ -1,6 +1,10 @@
 import unittest
 import datetime
+import dateutil.parser
+from pytz.gae import pytz
 from tempoiq.temporal.validate import check_time_param, convert_iso_stamp
+from tempoiq.temporal.validate import convert_iso_stamps, parse_iso_stamp
+from tempoiq.temporal.validate import get_timezone, get_transitions
 
 
 class TestTempValidate(unittest.TestCase):
@@ -78,3 +82,72 @@ class TestTempValidate(unittest.TestCase):
         self.assertEquals(ret.minute, 12)
         self.assertEquals(ret.second, 15)
         self.assertEquals(ret.microsecond, 32000)
+
+    def test_parse_matches_dateutil(self):
+        for s in ['2013-01-01T10:12:15', '2013-01-01T10:12:15.032Z',
+                  '2013-01-01T10:12:15.032+0000',
+                  '2008-01-03T10:12:32.231321+05:30',
+                  '2015-03-08T01:00:00.000-06:00', '2015-01-01',
+                  'Jan 1 2015 10:00']:
+            self.assertEquals(parse_iso_stamp(s), dateutil.parser.parse(s))
+            self.assertEquals(parse_iso_stamp(s).utcoffset(),
+                              dateutil.parser.parse(s).utcoffset())
+
+    def test_offsets_are_shared(self):
+        a = convert_iso_stamp('2015-03-08T01:00:00.000-06:00')
+        b = convert_iso_stamp('2015-07-08T01:00:00.000-06:00')
+        self.assertTrue(a.tzinfo is b.tzinfo)
+        self.assertTrue(convert_iso_stamp('2015-01-01T00:00:00Z').tzinfo
+                        is pytz.utc)
+
+    def test_timezones_are_cached(self):
+        self.assertTrue(get_timezone('America/Chicago') is
+                        get_timezone('America/Chicago'))
+        self.assertTrue(get_transitions('America/Chicago') is
+                        get_transitions('America/Chicago'))
+
+    def test_localize_matches_pytz(self):
+        tz = pytz.timezone('America/Chicago')
+        table = get_transitions('America/Chicago')
+        #ordinary times, and the hours skipped and repeated at DST changes
+        for dt in [datetime.datetime(2015, 1, 1, 12),
+                   datetime.datetime(2015, 7, 1, 12),
+                   datetime.datetime(2015, 3, 8, 1, 59),
+                   datetime.datetime(2015, 3, 8, 2, 30),
+                   datetime.datetime(2015, 3, 8, 3),
+                   datetime.datetime(2015, 11, 1, 0, 59),
+                   datetime.datetime(2015, 11, 1, 1, 30),
+                   datetime.datetime(2015, 11, 1, 2)]:
+            expected = tz.localize(dt)
+            self.assertEquals(table.localize(dt), expected)
+            self.assertTrue(table.localize(dt).tzinfo is expected.tzinfo)
+
+    def test_from_micros_matches_astimezone(self):
+        tz = pytz.timezone('America/Chicago')
+        table = get_transitions('America/Chicago')
+        epoch = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+        start = datetime.datetime(2015, 3, 8, 7, tzinfo=pytz.utc)
+        for minutes in range(0, 24 * 60, 30):
+            utc = start + datetime.timedelta(minutes=minutes)
+            delta = utc - epoch
+            micros = (delta.days * 86400 + delta.seconds) * 1000000
+            expected = utc.astimezone(tz)
+            converted = table.from_micros(micros)
+            self.assertEquals(converted, expected)
+            self.assertEquals(converted.isoformat(), expected.isoformat())
+
+    def test_static_zones(self):
+        table = get_transitions('UTC')
+        dt = datetime.datetime(2015, 1, 1)
+        self.assertEquals(table.localize(dt).tzinfo, pytz.utc)
+        self.assertEquals(table.from_micros(0),
+                          datetime.datetime(1970, 1, 1, tzinfo=pytz.utc))
+
+    def test_convert_iso_stamps(self):
+        stamps = ['2015-11-01T01:30:00', None, '2015-11-01T08:00:00Z']
+        ret = convert_iso_stamps(stamps, tz='America/Chicago')
+        self.assertEquals(ret, [convert_iso_stamp(s, tz='America/Chicago')
+                                for s in stamps])
+        #ambiguous, so standard time like pytz's localize
+        self.assertEquals(ret[0].utcoffset(), datetime.timedelta(hours=-6))
+        self.assertTrue(ret[1] is None)